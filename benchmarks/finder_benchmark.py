@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'luiz'
+
+# Latency, Elasticsearch round trips and result quality of findFromLocation (DriverFinder.run) and
+# inArea (DriverBus.list_in_rectangle) on synthetic cities of growing size (see SyntheticCity).
+# Quality is measured against brute force over the generated drivers:
+#   - findFromLocation: recall of the desired_drivers nearest available drivers and mean distance of
+#     the drivers found over the mean distance of the nearest ones (1.0 is best)
+#   - inArea: recall of the available drivers inside the box
+# Drivers are written to the index of the environment (ids "bench-..."), use a dedicated one since
+# other drivers in the index are not known by the brute force.
+#
+# i.e: python -m benchmarks.finder_benchmark -e test -d 10000,100000,1000000
+
+import argparse
+import math
+import os
+import threading
+import time
+from synthetic_city import SyntheticCity, KM_PER_DEGREE
+
+
+class RoundTripCounter(object):
+    # counts the requests sent to Elasticsearch by wrapping the client transport
+
+    def __init__(self, connection):
+        self.count = 0
+        self._lock = threading.Lock()
+        perform_request = connection.transport.perform_request
+
+        def counted_perform_request(*args, **kwargs):
+            with self._lock:
+                self.count += 1
+            return perform_request(*args, **kwargs)
+
+        connection.transport.perform_request = counted_perform_request
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(round(p / 100.0 * (len(values) - 1)))] if values else 0
+
+
+class Report(object):
+
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, key, elapsed, round_trips, quality=None):
+        row = self.rows.setdefault(key, dict(latencies=[], round_trips=[], quality=[]))
+        row["latencies"].append(elapsed * 1000)
+        row["round_trips"].append(round_trips)
+        if quality is not None:
+            row["quality"].append(quality)
+
+    def show(self):
+        print "%-9s %-17s %-9s %7s %8s %8s %8s %8s %7s %7s %7s" % (
+            "drivers", "operation", "zone", "queries", "p50 ms", "p95 ms", "p99 ms", "mean ms", "trips",
+            "recall", "ratio")
+        for (drivers, operation, zone), row in sorted(self.rows.iteritems()):
+            latencies, quality = row["latencies"], row["quality"]
+            recall = sum(q[0] for q in quality) / len(quality) if quality else None
+            ratios = [q[1] for q in quality if q[1] is not None]
+            print "%-9i %-17s %-9s %7i %8.2f %8.2f %8.2f %8.2f %7.2f %7s %7s" % (
+                drivers, operation, zone, len(latencies), percentile(latencies, 50), percentile(latencies, 95),
+                percentile(latencies, 99), sum(latencies) / len(latencies),
+                float(sum(row["round_trips"])) / len(row["round_trips"]),
+                "%.3f" % recall if recall is not None else "-",
+                "%.3f" % (sum(ratios) / len(ratios)) if ratios else "-")
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description="DriverFinder benchmark on synthetic cities")
+    parser.add_argument("-e", "--env", type=str, default="test", help="Environment (prod|test). Default: test")
+    parser.add_argument("-d", "--drivers", type=str, default="10000,100000",
+                        help="Comma separated city sizes, loaded incrementally. Default: 10000,100000")
+    parser.add_argument("-q", "--queries", type=int, default=200, help="Queries per city size. Default: 200")
+    parser.add_argument("--quality-queries", type=int, default=50,
+                        help="Queries checked against brute force. Default: 50")
+    parser.add_argument("--desired", type=int, default=10, help="desired_drivers of findFromLocation. Default: 10")
+    parser.add_argument("--box-km", type=float, default=1.0, help="Half side of inArea boxes. Default: 1.0")
+    parser.add_argument("--warmup", type=int, default=10, help="Queries not measured per city size. Default: 10")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000, help="Drivers per bulk write. Default: 5000")
+    parser.add_argument("--no-load", action="store_true", help="Drivers were loaded by a previous run")
+    parser.add_argument("--no-result-cache", action="store_true", help="Disable the finder result cache")
+    args = parser.parse_args()
+
+    # configure environment before loading config dependent modules
+    os.environ["api_env"] = args.env
+    from taxi_api.helpers.helpers import Helpers
+    from taxi_api.helpers import geo
+    from taxi_api.business.driver import DriverBus
+    from taxi_api.helpers.driver_finder import DriverFinder
+
+    cfg = Helpers.load_config()
+    driver_bus = DriverBus(cfg["api"]["database"], cfg["env"])
+    connection = driver_bus.data_source.connection
+    counter = RoundTripCounter(connection)
+    finder = DriverFinder()
+    if args.no_result_cache:
+        finder.result_cache = None
+
+    city = SyntheticCity(args.seed)
+    # warmup passengers are extra ones, so measured queries don't hit caches they filled
+    passengers = city.passengers(args.queries + args.warmup)
+    warmup, passengers = passengers[args.queries:], passengers[:args.queries]
+    report = Report()
+    loaded = 0
+    for count in [int(size) for size in args.drivers.split(",")]:
+        if not args.no_load and count > loaded:
+            start = time.time()
+            written, failed = city.load(driver_bus, count, loaded, args.batch_size)
+            connection.indices.refresh(index=driver_bus.data_source.index)
+            print "Loaded %i drivers (%i failed) in %.1fs" % (written, failed, time.time() - start)
+        loaded = max(loaded, count)
+
+        # available drivers for the brute force
+        ids, points = [], []
+        for _, driver in city.drivers(count):
+            if driver.available:
+                ids.append(driver.driver_id)
+                points.append(driver.location)
+        lats, lons = geo.to_arrays(points)
+
+        for zone, location in warmup:
+            finder.run(location, args.desired)
+
+        for i, (zone, location) in enumerate(passengers):
+            check = i < args.quality_queries
+            distances = geo.haversine_many(lats, lons, location["lat"], location["lon"]) if check else None
+
+            before, start = counter.count, time.time()
+            found = finder.run(location, args.desired)
+            elapsed, round_trips = time.time() - start, counter.count - before
+            quality = None
+            if check:
+                negated = -distances if geo.numpy is not None else [-distance for distance in distances]
+                nearest = geo.top_k(negated, args.desired)
+                nearest_ids = set(ids[j] for j in nearest)
+                found_distances = [geo.haversine(driver.location[0], driver.location[1],
+                                                 location["lat"], location["lon"]) for driver in found]
+                nearest_distance = sum(distances[j] for j in nearest) / len(nearest) if nearest else 0
+                quality = (
+                    float(len(nearest_ids.intersection(driver.driver_id for driver in found))) / len(nearest_ids)
+                    if nearest_ids else 1.0,
+                    (sum(found_distances) / len(found_distances)) / nearest_distance
+                    if found_distances and nearest_distance else None)
+            for key_zone in (zone, "all"):
+                report.add((count, "findFromLocation", key_zone), elapsed, round_trips, quality)
+
+            dlat = args.box_km / KM_PER_DEGREE
+            dlon = dlat / max(math.cos(math.radians(location["lat"])), 0.01)
+            top_left = dict(lat=location["lat"] + dlat, lon=location["lon"] - dlon)
+            bottom_right = dict(lat=location["lat"] - dlat, lon=location["lon"] + dlon)
+            before, start = counter.count, time.time()
+            in_area = list(driver_bus.list_in_rectangle(top_left, bottom_right))
+            elapsed, round_trips = time.time() - start, counter.count - before
+            quality = None
+            if check:
+                if geo.numpy is not None:
+                    inside = geo.numpy.flatnonzero(
+                        (lats >= bottom_right["lat"]) & (lats <= top_left["lat"]) &
+                        (lons >= top_left["lon"]) & (lons <= bottom_right["lon"])).tolist()
+                else:
+                    inside = [j for j, (lat, lon) in enumerate(points)
+                              if bottom_right["lat"] <= lat <= top_left["lat"] and
+                              top_left["lon"] <= lon <= bottom_right["lon"]]
+                inside = set(ids[j] for j in inside)
+                quality = (float(len(inside.intersection(driver.driver_id for driver in in_area))) / len(inside)
+                           if inside else 1.0, None)
+            for key_zone in (zone, "all"):
+                report.add((count, "inArea", key_zone), elapsed, round_trips, quality)
+
+    report.show()
+
+
+if __name__ == '__main__':
+    run_main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'luiz'
+
+# Time of TO.serialize() on the TOs written the most, for records serialized again without changes
+# (i.e. bulk retries, lookups and the upsert body of a save) and for records changed before every call.
+#
+# i.e: python -m benchmarks.serialize_benchmark -n 20000
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("api_env", "test")
+
+from taxi_api.to.driver import DriverTO
+from taxi_api.to.request_driver import RequestDriverTO
+
+
+def _time(func, calls):
+    start = time.time()
+    for _ in xrange(calls):
+        func()
+    return time.time() - start
+
+
+def run(calls, repeat):
+    driver = DriverTO(driver_id="d1", available=True, location=(-23.55, -46.63))
+    request = RequestDriverTO(requester_id="p1", requester_location=(-23.55, -46.63), status="active")
+    request.serialize()
+
+    def changed_driver():
+        driver.available = not driver.available
+        return driver.serialize()
+
+    def changed_request():
+        request.status = "canceled" if request.status == "active" else "active"
+        return request.serialize()
+
+    cases = [
+        ("DriverTO unchanged", driver.serialize),
+        ("DriverTO changed", changed_driver),
+        ("RequestDriverTO unchanged", request.serialize),
+        ("RequestDriverTO changed", changed_request),
+    ]
+    print "%-28s %10s" % ("case", "seconds")
+    for name, func in cases:
+        print "%-28s %10.3f" % (name, min(_time(func, calls) for _ in xrange(repeat)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="TO.serialize() benchmark")
+    parser.add_argument("-n", "--calls", type=int, default=20000, help="serialize() calls per case")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per case, the best one is reported")
+    args = parser.parse_args()
+    run(args.calls, args.repeat)
@@ -0,0 +1,92 @@
+__author__ = 'luiz'
+
+import math
+import random
+from taxi_api.to.driver import DriverTO
+
+KM_PER_DEGREE = 111.32
+
+
+class SyntheticCity(object):
+    """
+        Clustered driver and passenger locations around a city center: a dense downtown (gaussian),
+        sparse suburbs (uniform ring) and an airport queue (tight gaussian far from the center).
+        Zones have different weights for drivers and passengers and different availability.
+        Generation is deterministic for a seed and drivers are generated in order, so the first n
+        drivers of a bigger city are the drivers of the smaller one (cities can be loaded incrementally).
+    """
+
+    _default_center = (-23.5505, -46.6333)
+    _default_zones = [
+        # name, kind, params, driver weight, passenger weight, available ratio
+        ("downtown", "gaussian", dict(offset_km=(0, 0), sigma_km=2.0), 0.5, 0.6, 0.6),
+        ("suburbs", "ring", dict(min_km=5.0, max_km=25.0), 0.35, 0.35, 0.8),
+        ("airport", "gaussian", dict(offset_km=(12.0, 14.0), sigma_km=0.3), 0.15, 0.05, 0.95),
+    ]
+
+    def __init__(self, seed=42, center=None, zones=None):
+        self.seed = seed
+        self.center = center or SyntheticCity._default_center
+        self.zones = zones or SyntheticCity._default_zones
+
+    def _pick_zone(self, rnd, weight_index):
+        total = sum(zone[weight_index] for zone in self.zones)
+        value = rnd.random() * total
+        for zone in self.zones:
+            value -= zone[weight_index]
+            if value < 0:
+                return zone
+        return self.zones[-1]
+
+    def _to_location(self, north_km, east_km):
+        lat = self.center[0] + north_km / KM_PER_DEGREE
+        lon = self.center[1] + east_km / (KM_PER_DEGREE * math.cos(math.radians(self.center[0])))
+        return dict(lat=round(lat, 6), lon=round(lon, 6))
+
+    def _sample(self, rnd, zone):
+        _, kind, params = zone[:3]
+        if kind == "gaussian":
+            north, east = params["offset_km"]
+            return self._to_location(rnd.gauss(north, params["sigma_km"]), rnd.gauss(east, params["sigma_km"]))
+        if kind == "ring":
+            # uniform over the ring area
+            radius = math.sqrt(rnd.uniform(params["min_km"] ** 2, params["max_km"] ** 2))
+            angle = rnd.uniform(0, 2 * math.pi)
+            return self._to_location(radius * math.sin(angle), radius * math.cos(angle))
+        raise ValueError("Unknown zone kind %s" % kind)
+
+    # Yields (zone name, DriverTO) for drivers start to count - 1
+    def drivers(self, count, start=0):
+        rnd = random.Random(self.seed)
+        for i in xrange(count):
+            zone = self._pick_zone(rnd, 3)
+            location = self._sample(rnd, zone)
+            available = rnd.random() < zone[5]
+            if i >= start:
+                yield zone[0], DriverTO(driver_id="bench-%07i" % i, location=location, available=available)
+
+    # List of (zone name, location) of count passengers
+    def passengers(self, count):
+        rnd = random.Random(self.seed + 1)
+        result = []
+        for _ in xrange(count):
+            zone = self._pick_zone(rnd, 4)
+            result.append((zone[0], self._sample(rnd, zone)))
+        return result
+
+    # Writes drivers start to count - 1 with DriverBus.bulk_save, returns (written, failed)
+    def load(self, driver_bus, count, start=0, batch_size=5000):
+        written, failed = 0, 0
+        batch = []
+        for _, driver in self.drivers(count, start):
+            batch.append(driver)
+            if len(batch) >= batch_size:
+                results = driver_bus.bulk_save(batch)
+                failed += sum(1 for _, error in results if error is not None)
+                written += len(batch)
+                batch = []
+        if batch:
+            results = driver_bus.bulk_save(batch)
+            failed += sum(1 for _, error in results if error is not None)
+            written += len(batch)
+        return written - failed, failed
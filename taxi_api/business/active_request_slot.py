@@ -0,0 +1,58 @@
+__author__ = 'luiz'
+
+from base import BaseBus
+from datetime import datetime, timedelta
+from taxi_api.helpers.exceptions import RecordAlreadyExistsException, OutDatedRecordException
+
+
+class ActiveRequestSlotBus(BaseBus):
+    _ref = "active_request_slot"
+
+    # a slot whose request can't be found is only considered abandoned after this period,
+    # the request is created right after its slot
+    _grace_period = timedelta(seconds=60)
+    _max_attempts = 3
+
+    def acquire(self, requester_id, request_id, request_bus):
+        # one conditional write enforces one active request per requester
+        for _ in xrange(self._max_attempts):
+            slot = self.to_class(requester_id=requester_id, request_id=request_id)
+            try:
+                self.create(slot)
+                return True
+            except RecordAlreadyExistsException:
+                pass
+
+            current = self.get_by_pk(requester_id)
+            if current is not None:
+                break
+            # released meanwhile, try again
+        else:
+            return False
+
+        if not self._is_abandoned(current, request_bus) or getattr(current, "_version", None) is None:
+            return False
+
+        # take over the abandoned slot, unless someone else did it first
+        try:
+            self.save_if_up_to_date(slot, version=current._version)
+            return True
+        except OutDatedRecordException:
+            return False
+
+    def _is_abandoned(self, slot, request_bus):
+        request = request_bus.get_by_pk(slot.request_id)
+        if request:
+            return request.status != "active"
+        return slot.created_in + ActiveRequestSlotBus._grace_period < datetime.now()
+
+    def release(self, requester_id, request_id):
+        # the slot may already belong to a newer request
+        slot = self.get_by_pk(requester_id)
+        if slot is None or slot.request_id != request_id:
+            return False
+        try:
+            # unless it was taken over after being read
+            return self.delete(slot, version=slot._version)
+        except OutDatedRecordException:
+            return False
@@ -3,6 +3,9 @@ __author__ = 'luiz'
 from ..ds_provider.ds_provider import DSProvider
 from itertools import chain
 from ..helpers.helpers import Helpers
+from ..helpers.async_executor import AsyncExecutor
+from ..dao.unit_of_work import UnitOfWork
+from ..helpers.exceptions import RecordAlreadyExistsException, BulkWriteException
 
 
 class BaseBus(object):
@@ -25,6 +28,23 @@ class BaseBus(object):
         self.to_class_name = "%s.%s.%sTO" % (self._TO_PATH, self._ref, self.__class__.__name__[:-3])
         self.to_class = Helpers.get_class(self.to_class_name)
 
+    # Request scoped identity map and write queue, use it as a context manager.
+    # Plain writes made inside it are flushed in a single bulk call at the end.
+    @staticmethod
+    def unit_of_work():
+        return UnitOfWork()
+
+    # Hook called with the result of every successful write made through the bus
+    def _after_write(self, to_obj):
+        return to_obj
+
+    # Runs _after_write once to_obj is persisted: right away, or when the unit of work flushes its queued write
+    def _written(self, to_obj):
+        uow = UnitOfWork.current()
+        if to_obj is not None and uow is not None and uow.after_write(to_obj, self._after_write):
+            return to_obj
+        return self._after_write(to_obj)
+
     def exists(self, pk, **args):
         return self.dao.exists(pk, **args)
 
@@ -33,21 +53,21 @@ class BaseBus(object):
         if isinstance(to_obj, dict):
             to_obj = self.to_class(**to_obj)
 
-        return self.dao.save(to_obj, **args)
+        return self._written(self.dao.save(to_obj, **args))
 
     # Write the record, ONLY if it exists.
     def update_if_exists(self, to_obj, **args):
         if isinstance(to_obj, dict):
             to_obj = self.to_class(**to_obj)
 
-        return self.dao.update_if_exists(to_obj, **args)
+        return self._written(self.dao.update_if_exists(to_obj, **args))
 
     # Create a record, ONLY if it doesn't exist.
     def create(self, to_obj, **args):
         if isinstance(to_obj, dict):
             to_obj = self.to_class(**to_obj)
 
-        return self.dao.create(to_obj, **args)
+        return self._written(self.dao.create(to_obj, **args))
 
     # Returns a tuple of (object, created), where object is the retrieved or created
     # and created is a boolean specifying whether a new object was created.
@@ -55,19 +75,56 @@ class BaseBus(object):
         if isinstance(to_obj, dict):
             to_obj = self.to_class(**to_obj)
 
-        if self.dao.create(to_obj, **args):
-            return to_obj, True
+        try:
+            if self._written(self.dao.create(to_obj, **args)):
+                return to_obj, True
+        except RecordAlreadyExistsException:
+            pass
         return self.get_by_pk(to_obj.pk), False
 
+    # Write many records in a single backend call. Returns a list of (pk, error) in the same order
+    # of to_objs, error is None when the record was written.
+    def bulk_save(self, to_objs, **args):
+        return self._bulk_write(self.dao.bulk_save, to_objs, **args)
+
+    # Same as bulk_save but ONLY writes records that already exist.
+    def bulk_update_if_exists(self, to_objs, **args):
+        return self._bulk_write(self.dao.bulk_update_if_exists, to_objs, **args)
+
+    def _bulk_write(self, dao_method, to_objs, **args):
+        results = [None] * len(to_objs)
+        valid = []
+        for i, to_obj in enumerate(to_objs):
+            try:
+                if isinstance(to_obj, dict):
+                    to_obj = self.to_class(**to_obj)
+                # validate every record before sending, invalid ones are reported and skipped
+                to_obj.serialize()
+                valid.append((i, to_obj))
+            except Exception as e:
+                pk_name = self.to_class._pks[0]
+                pk = to_obj.get(pk_name) if isinstance(to_obj, dict) else getattr(to_obj, pk_name, None)
+                results[i] = (pk, e.message or str(e))
+
+        for (i, to_obj), (pk, error) in zip(valid, dao_method([to_obj for _, to_obj in valid], **args)):
+            results[i] = (pk, error)
+            if error is None:
+                self._written(to_obj)
+        return results
+
     def replace(self, to_obj, **args):
         if isinstance(to_obj, dict):
             to_obj = self.to_class(**to_obj)
-        return self.dao.replace(to_obj, **args)
+        return self._written(self.dao.replace(to_obj, **args))
 
     def delete(self, to_obj, **args):
         return self.dao.delete(to_obj, **args)
 
-    def search_by_field_value(self, field_to_search, value_to_search, *fields, **args):
+    # Delete many records in a single backend call. Returns a list of (pk, error) in the same order of to_objs.
+    def bulk_delete(self, to_objs, **args):
+        return self.dao.bulk_delete(to_objs, **args)
+
+    def _serialize_search_value(self, field_to_search, value_to_search):
         if isinstance(field_to_search, list) and isinstance(value_to_search, list):
             for i in xrange(0, len(field_to_search)):
                 search_field = self.to_class.get_field(field_to_search[i])
@@ -77,8 +134,26 @@ class BaseBus(object):
             search_field = self.to_class.get_field(field_to_search)
             search_field.validate(value_to_search)
             value_to_search = search_field.serialize(value_to_search)
+        return value_to_search
+
+    def search_by_field_value(self, field_to_search, value_to_search, *fields, **args):
+        value_to_search = self._serialize_search_value(field_to_search, value_to_search)
         return self.dao.search_by_field_value(field_to_search, value_to_search, *fields, **args)
 
+    # Assign values (dict of field name -> value) to every record matching the search in a single write call.
+    # Returns the list of updated objects.
+    def update_by_field_value(self, field_to_search, value_to_search, values, **args):
+        for field_name, value in values.iteritems():
+            self.to_class.get_field(field_name).validate(value)
+        value_to_search = self._serialize_search_value(field_to_search, value_to_search)
+        try:
+            updated = self.dao.update_by_field_value(field_to_search, value_to_search, values, **args)
+        except BulkWriteException as e:
+            # records written before the failure still get their hooks
+            e.written = [self._written(to_obj) for to_obj in e.written]
+            raise
+        return [self._written(to_obj) for to_obj in updated]
+
     def search_by_field_range(self, field_to_search, initial_range, final_range, *fields, **args):
         search_field = self.to_class.get_field(field_to_search)
         search_field.validate(initial_range)
@@ -105,7 +180,7 @@ class BaseBus(object):
     def save_if_up_to_date(self, to_obj, **kwargs):
         if isinstance(to_obj, dict):
             to_obj = self.to_class(**to_obj)
-        return self.dao.save_if_up_to_date(to_obj, **kwargs)
+        return self._written(self.dao.save_if_up_to_date(to_obj, **kwargs))
 
     def search_by_field_value_range(self, field_to_search, value, initial_range, final_range, step, *fields, **args):
         def iterate():
@@ -125,3 +200,7 @@ class BaseBus(object):
 
     def get_all(self, **kwargs):
         return self.dao.get_all(**kwargs)
+
+    # Run any bus method without blocking the caller. Returns a handle whose get() waits for the result
+    def submit(self, method_name, *args, **kwargs):
+        return AsyncExecutor.get().submit(getattr(self, method_name), *args, **kwargs)
@@ -2,16 +2,30 @@ __author__ = 'luiz'
 
 from base import BaseBus
 from taxi_api.helpers.helpers import Helpers
+from taxi_api.helpers.finder_cache import FinderResultCache
 
 
 class DriverBus(BaseBus):
     _ref = "driver"
 
+    def _after_write(self, to_obj):
+        # drop cached finder candidates affected by the driver's new status
+        cache = FinderResultCache.get()
+        if cache and to_obj:
+            location = getattr(to_obj, "location", None)
+            cache.on_driver_write(to_obj.driver_id, Helpers.validate_geo_point(location) if location else None,
+                                  getattr(to_obj, "available", None))
+        return to_obj
+
     def list_in_rectangle(self, top_left, bottom_right, only_active=True,
-                          top_left_exclude=None, bottom_right_exclude=None):
+                          top_left_exclude=None, bottom_right_exclude=None, fields=()):
         return self.dao.list_in_rectangle(
             Helpers.validate_geo_point(top_left),
             Helpers.validate_geo_point(bottom_right),
             only_active,
-            top_left_exclude, bottom_right_exclude
+            top_left_exclude, bottom_right_exclude,
+            fields
         )
+
+    def list_nearest(self, location, size, max_distance, only_active=True, fields=()):
+        return self.dao.list_nearest(Helpers.validate_geo_point(location), size, max_distance, only_active, fields)
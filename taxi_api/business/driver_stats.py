@@ -0,0 +1,14 @@
+__author__ = 'luiz'
+
+from base import BaseBus
+from taxi_api.helpers.driver_features import DriverFeatureStore
+
+
+class DriverStatsBus(BaseBus):
+    _ref = "driver_stats"
+
+    def _after_write(self, to_obj):
+        store = DriverFeatureStore.get()
+        if store and to_obj:
+            store.on_stats_write(to_obj)
+        return to_obj
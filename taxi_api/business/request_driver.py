@@ -3,28 +3,49 @@ __author__ = 'luiz'
 from base import BaseBus
 from taxi_api.helpers.exceptions import UserHasActiveRequest
 from taxi_api.helpers.helpers import Helpers
+from taxi_api.helpers.request_notifier import RequestNotifier
+from taxi_api.helpers.driver_notifier import DriverNotifier
+from active_request_slot import ActiveRequestSlotBus
+from taxi_api.dao.unit_of_work import UnitOfWork
 
 
 class RequestDriverBus(BaseBus):
     _ref = "request_driver"
 
-    def list_active_per_user(self, requester_id):
+    def __init__(self, ds_name, environment):
+        super(RequestDriverBus, self).__init__(ds_name, environment)
+        self.slot_bus = ActiveRequestSlotBus(ds_name, environment)
+
+    def _after_write(self, to_obj):
+        # wake up the driver involved in the request (if any) waiting on the watch endpoint
+        driver_id = getattr(to_obj, "driver_id", None) if to_obj else None
+        if driver_id:
+            RequestNotifier.get().publish(driver_id, to_obj.serialize())
+        # assigned/canceled/finished requests are no longer offered to drivers
+        if to_obj and (driver_id or getattr(to_obj, "status", "active") != "active"):
+            DriverNotifier.get().close_request(to_obj.request_id)
+        return to_obj
+
+    def list_active_per_user(self, requester_id, *fields):
         return self.search_by_field_value(
-            ["requester_id", "status"], [requester_id, "active"])
+            ["requester_id", "status"], [requester_id, "active"], *fields)
 
-    def list_active_per_driver(self, driver_id):
+    def list_active_per_driver(self, driver_id, *fields):
         return self.search_by_field_value(
-            ["driver_id", "status"], [driver_id, "active"])
+            ["driver_id", "status"], [driver_id, "active"], *fields)
 
     def cancel_active_requests(self, requester_id):
-        for request in self.list_active_per_user(requester_id):
-            request.status = "canceled"
+        canceled = self.update_by_field_value(
+            ["requester_id", "status"], [requester_id, "active"], dict(status="canceled"))
+
+        for request in canceled:
             if hasattr(request, "driver_id") and request.driver_id:
                 Helpers.dispatch(
                     "notify_driver_request_canceled",
                     "Request canceled: %s" % request.serialize()
                 )
-            self.save(request)
+            self.slot_bus.release(requester_id, request.request_id)
+        return canceled
 
     def assign_driver(self, request_id, driver_id):
         to_obj = self.get_by_pk(request_id)
@@ -38,21 +59,33 @@ class RequestDriverBus(BaseBus):
         if isinstance(to_obj, dict):
             to_obj = self.to_class(**to_obj)
 
-        # check if user already has an active request
-        active_requests = list(self.list_active_per_user(to_obj.requester_id))
+        # serialize to validate and fill request_id
+        to_obj.serialize()
 
-        if len(active_requests) > 0:
+        # check if user already has an active request
+        if not self.slot_bus.acquire(to_obj.requester_id, to_obj.request_id, self):
             raise UserHasActiveRequest()
 
-        result = self.create(to_obj, **args)
         try:
-            # send message to external service to find and notify drivers
-            # to meet the request
-            Helpers.dispatch(
-                "find_and_notify_drivers",
-                "New driver request: %s" % result.serialize()
-            )
+            result = self.create(to_obj, **args)
+        except Exception:
+            self._abort_request(to_obj)
+            raise
+
+        try:
+            # find and notify drivers to meet the request in background
+            DriverNotifier.get().notify_request(result)
             return result
         except Exception as e:
-            self.cancel_active_requests(to_obj.requester_id)
-            raise e
\ No newline at end of file
+            # only this request, searching by requester could miss it (near real time) or hit others
+            result.status = "canceled"
+            self.save(result)
+            self._abort_request(to_obj)
+            raise e
+
+    def _abort_request(self, to_obj):
+        self.slot_bus.release(to_obj.requester_id, to_obj.request_id)
+        # the unit of work discards queued writes when the request fails, send them now
+        uow = UnitOfWork.current()
+        if uow:
+            uow.flush()
\ No newline at end of file
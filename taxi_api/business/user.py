@@ -1,10 +1,17 @@
 __author__ = 'luiz'
 
 from base import BaseBus
+from taxi_api.helpers.driver_features import DriverFeatureStore
 
 
 class UserBus(BaseBus):
     _ref = "user"
 
+    def _after_write(self, to_obj):
+        store = DriverFeatureStore.get()
+        if store and to_obj:
+            store.on_user_write(to_obj)
+        return to_obj
+
     def login(self, username, password, **kwargs):
         return self.dao.login(username, password, **kwargs)
\ No newline at end of file
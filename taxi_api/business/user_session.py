@@ -10,4 +10,7 @@ class UserSessionBus(BaseBus):
         return self.dao.get_user_from_session(api_token, **kwargs)
 
     def logout(self, api_token, **kwargs):
-        return self.dao.logout(api_token, **kwargs)
\ No newline at end of file
+        return self.dao.logout(api_token, **kwargs)
+
+    def delete_expired(self, batch_size, **kwargs):
+        return self.dao.delete_expired(batch_size, **kwargs)
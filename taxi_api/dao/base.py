@@ -1,4 +1,5 @@
 from abc import ABCMeta, abstractmethod
+from taxi_api.helpers.async_executor import AsyncExecutor
 
 __author__ = 'luiz'
 
@@ -13,6 +14,10 @@ class BaseDao(object):
         self.ds_provider = ds_provider
         self.data_source = data_source
 
+    # Run any dao method without blocking the caller. Returns a handle whose get() waits for the result
+    def submit(self, method_name, *args, **kwargs):
+        return AsyncExecutor.get().submit(getattr(self, method_name), *args, **kwargs)
+
     @abstractmethod
     def _record_to_to(self, record):
         pass
@@ -29,6 +34,18 @@ class BaseDao(object):
     def save_if_up_to_date(self, to_obj, **kwargs):
         pass
 
+    @abstractmethod
+    def bulk_save(self, to_objs, **kwargs):
+        pass
+
+    @abstractmethod
+    def bulk_update_if_exists(self, to_objs, **kwargs):
+        pass
+
+    @abstractmethod
+    def bulk_delete(self, to_objs, **kwargs):
+        pass
+
     @abstractmethod
     def create(self, to_obj, **kwargs):
         pass
@@ -49,6 +66,10 @@ class BaseDao(object):
     def search_by_field_range(self, field_to_search, initial_range, final_range, *fields, **kwargs):
         pass
 
+    @abstractmethod
+    def update_by_field_value(self, field_to_search, value_to_search, values, **kwargs):
+        pass
+
     @abstractmethod
     def create_db(self, **kwargs):
         pass
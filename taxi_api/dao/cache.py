@@ -0,0 +1,211 @@
+__author__ = 'luiz'
+
+import copy
+import json
+import threading
+import time
+from hashlib import md5
+from collections import OrderedDict
+from taxi_api.helpers.helpers import Helpers
+
+
+class LRUCache(object):
+    """
+        Bounded in-process cache with LRU and TTL eviction. Values are deep copied in and out
+        because callers mutate the TOs built from them, copy_values=False skips the copies for
+        values nobody mutates.
+    """
+
+    _default_max_size = 10000
+    _default_ttl = 60
+
+    def __init__(self, max_size, ttl, copy_values=True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.copy_values = copy_values
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _get(self, key, is_valid=None):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, value = item
+            if expires < time.time() or (is_valid and not is_valid(value)):
+                self.expirations += 1
+                self.misses += 1
+                self._dropped(key, value)
+                return None
+            # reinsert as most recently used
+            self._items[key] = item
+            self.hits += 1
+        return copy.deepcopy(value) if self.copy_values else value
+
+    def _set(self, key, value):
+        # must be called holding self._lock
+        self._items.pop(key, None)
+        self._items[key] = (time.time() + self.ttl, value)
+        while len(self._items) > self.max_size:
+            old_key, (_, old_value) = self._items.popitem(last=False)
+            self.evictions += 1
+            self._dropped(old_key, old_value)
+
+    def get(self, key):
+        return self._get(key)
+
+    def set(self, key, value):
+        if self.copy_values:
+            value = copy.deepcopy(value)
+        with self._lock:
+            self._set(key, value)
+
+    # called holding self._lock for every item expired or evicted
+    def _dropped(self, key, value):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        return dict(size=len(self._items), max_size=self.max_size, ttl=self.ttl, hits=self.hits,
+                    misses=self.misses, evictions=self.evictions, expirations=self.expirations)
+
+    @staticmethod
+    def _load_config(section, doc_type):
+        cfg = ((Helpers.load_config().get("cache") or {}).get(section) or {}).get(doc_type)
+        if cfg and cfg.get("enabled", True):
+            return cfg
+
+
+class RecordCache(LRUCache):
+    """
+        Read-through cache of raw records. There is one cache per doc_type (so entries are keyed
+        by (doc_type, pk)) shared by every dao instance of that type, and each dao invalidates it
+        on its own writes. Writes made by other processes are only seen after ttl, so it ships
+        disabled and should only be enabled (with a ttl the records can be stale for) when a single
+        API process writes them.
+        Enabled per doc_type in config, i.e: "cache": {"records": {"user": {"max_size": 1000, "ttl": 60}}}
+    """
+
+    _caches = {}
+    _caches_lock = threading.Lock()
+
+    def __init__(self, doc_type, max_size, ttl):
+        super(RecordCache, self).__init__(max_size, ttl)
+        self.doc_type = doc_type
+        self._writes = 0
+
+    @staticmethod
+    def get(doc_type):
+        # returns None when cache is disabled for doc_type
+        with RecordCache._caches_lock:
+            if doc_type not in RecordCache._caches:
+                cfg = LRUCache._load_config("records", doc_type)
+                RecordCache._caches[doc_type] = cfg and RecordCache(
+                    doc_type, cfg.get("max_size", LRUCache._default_max_size), cfg.get("ttl", LRUCache._default_ttl))
+            return RecordCache._caches[doc_type]
+
+    @staticmethod
+    def all_stats():
+        return {doc_type: cache.stats() for doc_type, cache in RecordCache._caches.items() if cache}
+
+    @property
+    def write_mark(self):
+        # take it before reading from database and pass it to set_record
+        return self._writes
+
+    def get_record(self, pk):
+        return self._get(pk)
+
+    def set_record(self, pk, record, write_mark):
+        record = copy.deepcopy(record)
+        with self._lock:
+            # a write happened while record was being read, it might be stale already
+            if write_mark != self._writes:
+                return
+            self._set(pk, record)
+
+    def invalidate(self, pk):
+        with self._lock:
+            self._writes += 1
+            self._items.pop(pk, None)
+
+
+class QueryCache(LRUCache):
+    """
+        Cache of query results (raw hits) keyed by a canonical hash of the query body and read args
+        (which include _source fields). Each doc_type has a write generation bumped by every write
+        made through its daos; entries from older generations are never served, so a write
+        invalidates all cached queries of the doc_type in O(1) and they are evicted as LRU.
+        Results are not stored while the last write may still be invisible to searches
+        (refresh_interval seconds, Elasticsearch is near real time).
+        Like RecordCache, generations are per process and writes of other processes are only seen
+        after ttl, so it ships disabled.
+        Enabled per doc_type in config, i.e: "cache": {"queries": {"request_driver": {"ttl": 10}}}
+    """
+
+    _caches = {}
+    _caches_lock = threading.Lock()
+
+    _default_refresh_interval = 1.0
+
+    def __init__(self, doc_type, max_size, ttl, refresh_interval):
+        super(QueryCache, self).__init__(max_size, ttl)
+        self.doc_type = doc_type
+        self.refresh_interval = refresh_interval
+        self.generation = 0
+        self._last_write = 0
+
+    @staticmethod
+    def get(doc_type):
+        # returns None when cache is disabled for doc_type
+        with QueryCache._caches_lock:
+            if doc_type not in QueryCache._caches:
+                cfg = LRUCache._load_config("queries", doc_type)
+                QueryCache._caches[doc_type] = cfg and QueryCache(
+                    doc_type, cfg.get("max_size", LRUCache._default_max_size), cfg.get("ttl", LRUCache._default_ttl),
+                    cfg.get("refresh_interval", QueryCache._default_refresh_interval))
+            return QueryCache._caches[doc_type]
+
+    @staticmethod
+    def all_stats():
+        return {doc_type: cache.stats() for doc_type, cache in QueryCache._caches.items() if cache}
+
+    @staticmethod
+    def build_key(query, read_args):
+        return md5(json.dumps([query, read_args], sort_keys=True, separators=(",", ":"), default=str)).hexdigest()
+
+    @property
+    def write_mark(self):
+        # take it before running the query and pass it to set_records
+        return self.generation
+
+    def get_records(self, key):
+        generation = self.generation
+        value = self._get(key, lambda value: value[0] == generation)
+        if value is not None:
+            return value[1]
+
+    def set_records(self, key, records, write_mark):
+        records = copy.deepcopy(records)
+        with self._lock:
+            if write_mark != self.generation or time.time() - self._last_write < self.refresh_interval:
+                return
+            self._set(key, (self.generation, records))
+
+    def bump(self):
+        with self._lock:
+            self.generation += 1
+            self._last_write = time.time()
+
+    def stats(self):
+        stats = super(QueryCache, self).stats()
+        stats["generation"] = self.generation
+        return stats
@@ -0,0 +1,9 @@
+__author__ = 'luiz'
+
+from base import DBBaseDao
+from taxi_api.to.active_request_slot import ActiveRequestSlotTO
+
+
+class ActiveRequestSlotDao(DBBaseDao):
+    _default_table = "active_request_slot"
+    _to_class = ActiveRequestSlotTO
@@ -3,9 +3,16 @@ __author__ = 'luiz'
 from ..base import BaseDao
 from elasticsearch.exceptions import ElasticsearchException, NotFoundError
 import logging
+import json
+import threading
 from taxi_api.to.fields import *
 from taxi_api.helpers.helpers import Helpers
-from taxi_api.helpers.exceptions import OutDatedRecordException
+from taxi_api.helpers.exceptions import OutDatedRecordException, RecordAlreadyExistsException, BulkWriteException
+from taxi_api.dao.cache import RecordCache, QueryCache
+from taxi_api.helpers.single_flight import SingleFlight
+from taxi_api.helpers.batch_loader import BatchLoader
+from taxi_api.dao.unit_of_work import UnitOfWork
+from lookup import LookupIndex
 
 
 def add_defaults(properties, defaults):
@@ -22,31 +29,125 @@ class DBBaseDao(BaseDao):
     _EXCEPTION_IGNORE_ON_QUERY = []
     _EXCEPTION_IGNORE_ON_READ = [NotFoundError]
     _EXCEPTION_IGNORE_ON_WRITE = []
-    _EXCEPTION_IGNORE_ON_DELETE = [2]  # 2 = AEROSPIKE_ERR_RECORD_NOT_FOUND
+    _EXCEPTION_IGNORE_ON_DELETE = [NotFoundError]
     _UPDATE_ARGS_LABEL = "update_args"
     _WRITE_ARGS_LABEL = "index_args"
     _READ_ARGS_LABEL = "read_args"
     _default_write_args = {}
     _default_update_args = {"retry_on_conflict": 10}
     _default_read_args = {}
+    _default_update_by_query_size = 1000
+    _max_update_by_query_attempts = 3
+    _DEFERRABLE_WRITE_ARGS = ("upsert", "rec_id")
+    _single_flight = SingleFlight()
+    _batch_loaders = {}
+    _batch_loaders_lock = threading.Lock()
+
+    def __init__(self, ds_provider, data_source):
+        super(DBBaseDao, self).__init__(ds_provider, data_source)
+        self.record_cache = RecordCache.get(self._default_table)
+        self.query_cache = QueryCache.get(self._default_table)
+        dao_cfg = Helpers.load_config().get("dao") or {}
+        self.single_flight = DBBaseDao._single_flight if dao_cfg.get("single_flight") else None
+        self.batch_loader = self._get_batch_loader((dao_cfg.get("batch_loader") or {}).get(self._default_table))
+        self.lookup_index = LookupIndex(self) if self._to_class and self._to_class._indexes else None
+
+    def _get_batch_loader(self, cfg):
+        # one loader per doc type, shared by every dao instance of that type
+        if not cfg or not cfg.get("enabled", True):
+            return None
+        with DBBaseDao._batch_loaders_lock:
+            if self._default_table not in DBBaseDao._batch_loaders:
+                DBBaseDao._batch_loaders[self._default_table] = BatchLoader(
+                    self._load_records, cfg.get("window_ms", 2) / 1000.0, cfg.get("max_keys", 50))
+            return DBBaseDao._batch_loaders[self._default_table]
+
+    def _load_records(self, pks):
+        records = self._coalesce("mget", self._get_records, pks) or []
+        return {record["_id"]: record for record in records if record["found"]}
+
+    # concurrent identical reads share a single in flight call and its result
+    def _coalesce(self, operation, func, *args, **kwargs):
+        if self.single_flight is None:
+            return func(*args, **kwargs)
+        key = (operation, self.data_source.index, self._get_table_name(),
+               json.dumps([args, kwargs], sort_keys=True, default=str))
+        return self.single_flight.do(key, func, *args, **kwargs)
+
+    # called after every write attempt (successful or not) on rec_id
+    def _on_write(self, rec_id):
+        if self.record_cache:
+            self.record_cache.invalidate(rec_id)
+        if self.query_cache:
+            self.query_cache.bump()
+        if self.single_flight:
+            # searches are near real time anyway, only realtime gets must see the write
+            table_name = self._get_table_name()
+            self.single_flight.forget(lambda key: key[2] == table_name and key[0] != "search")
+
+    # lookup changes must be taken BEFORE the write and applied after it succeeds
+    def _get_lookup_changes(self, rec_id, to_obj, operation):
+        if self.lookup_index:
+            return self.lookup_index.get_changes(rec_id, to_obj, operation)
+
+    def _apply_lookup_changes(self, rec_id, to_obj, lookup_changes):
+        if lookup_changes:
+            self.lookup_index.apply(rec_id, to_obj, lookup_changes)
+
+    # entries are (rec_id, to_obj, lookup_changes) of records written by the same call
+    def _apply_many_lookup_changes(self, entries):
+        entries = [entry for entry in entries if entry[2]]
+        if entries:
+            self.lookup_index.apply_many(entries)
+
+    # Inside a unit of work plain writes (and deferred creates) are queued and sent in a single bulk at its end.
+    # Any other write flushes the queue first, so writes are applied in order.
+    def _queue_write(self, operation, to_obj, **kwargs):
+        uow = UnitOfWork.current()
+        if uow is None:
+            return False
+        if [k for k in kwargs if k not in self._DEFERRABLE_WRITE_ARGS]:
+            uow.flush()
+            return False
+        uow.add_write(self, operation, to_obj, **kwargs)
+        return True
+
+    def _get_update_body(self, to_obj, upsert=None):
+        # records already stored only send the fields changed since they were loaded/written,
+        # upsert defaults to True only for records that were never stored
+        if upsert is None:
+            upsert = not to_obj._stored
+        dirty = to_obj.dirty_fields
+        if to_obj._stored and dirty and not upsert:
+            return dict(doc=to_obj.serialize(*dirty))
+
+        _serialized = to_obj.serialize()
+        doc_body = dict(doc=_serialized)
+        if upsert:
+            doc_body["upsert"] = _serialized
+        return doc_body
 
     def save(self, to_obj, **kwargs):
+        if to_obj._stored and not to_obj.dirty_fields and self._UPDATE_ARGS_LABEL not in kwargs:
+            # nothing changed since it was loaded or written
+            return to_obj
+
+        if self._queue_write("save", to_obj, **kwargs):
+            return to_obj
+
         update_args = add_defaults(kwargs.get(self._UPDATE_ARGS_LABEL, {}), self._default_update_args)
 
         if "version" in update_args:
             update_args.pop("retry_on_conflict")
 
         # call serialize BEFORE _build_pk
-        _serialized = to_obj.serialize()
-        doc_body = dict(doc=_serialized)
-
-        # check upsert
-        if kwargs.pop("upsert", True):
-            doc_body["upsert"] =_serialized
+        doc_body = self._get_update_body(to_obj, kwargs.pop("upsert", None))
+        written = to_obj.dirty_fields
 
         rec_id = kwargs.get("rec_id")
         if rec_id is None:
             rec_id = self._build_pk(to_obj)
+        lookup_changes = self._get_lookup_changes(rec_id, to_obj, "save")
         try:
             self.data_source.connection.update(
                 index=self.data_source.index,
@@ -55,6 +156,8 @@ class DBBaseDao(BaseDao):
                 id=rec_id,
                 params=update_args
             )
+            to_obj.mark_stored(written)
+            self._apply_lookup_changes(rec_id, to_obj, lookup_changes)
             return to_obj
         except ElasticsearchException as e:
             if e.__class__ in self._EXCEPTION_IGNORE_ON_WRITE:
@@ -63,6 +166,8 @@ class DBBaseDao(BaseDao):
             if e.args[0] == 409:
                 raise OutDatedRecordException()
             raise
+        finally:
+            self._on_write(rec_id)
 
     def update_if_exists(self, to_obj, **kwargs):
         kwargs["upsert"] = False
@@ -77,15 +182,133 @@ class DBBaseDao(BaseDao):
                 kwargs[self._UPDATE_ARGS_LABEL]["version_type"] = kwargs["version_type"]
         return self.save(to_obj, **kwargs)
 
+    def _get_bulk_action(self, operation, to_obj, **kwargs):
+        # call serialize BEFORE _build_pk
+        if operation == "save":
+            source = self._get_update_body(to_obj, kwargs.get("upsert"))
+        else:
+            source = to_obj.serialize()
+        rec_id = kwargs.get("rec_id")
+        if rec_id is None:
+            rec_id = self._build_pk(to_obj)
+        action = dict(_type=self._get_table_name(), _id=rec_id)
+
+        if operation == "save":
+            action["_retry_on_conflict"] = self._default_update_args["retry_on_conflict"]
+            return dict(update=action), source
+        elif operation == "replace":
+            return dict(index=action), source
+        elif operation == "create":
+            return dict(create=action), source
+        elif operation == "delete":
+            return dict(delete=action), None
+        raise Exception("Unknown bulk operation %s" % operation)
+
+    def _bulk(self, actions, **kwargs):
+        return [(rec_id, error) for rec_id, error, _ in self._bulk_items(actions, **kwargs)]
+
+    # (pk, error, status) of every action
+    def _bulk_items(self, actions, **kwargs):
+        # actions is a list of (action, source) tuples, source is None for deletes
+        body = []
+        for action, source in actions:
+            body.append(action)
+            if source is not None:
+                body.append(source)
+
+        write_args = add_defaults(kwargs.get(self._WRITE_ARGS_LABEL, {}), self._default_write_args)
+        response = self.data_source.connection.bulk(
+            index=self.data_source.index,
+            body=body,
+            params=write_args
+        )
+
+        results = []
+        for item in response["items"]:
+            op_result = item.values()[0]
+            error = op_result.get("error")
+            if isinstance(error, dict):
+                error = error.get("reason") or error.get("type")
+            results.append((op_result["_id"], error, op_result.get("status")))
+        return results
+
+    # Write many records in a single call. Returns a list of (pk, error) in the same order of to_objs,
+    # error is None when the record was written.
+    def bulk_save(self, to_objs, **kwargs):
+        upsert = kwargs.pop("upsert", None)
+        actions = []
+        written = []
+        lookup_changes = []
+        for to_obj in to_objs:
+            action = self._get_bulk_action("save", to_obj, upsert=upsert)
+            actions.append(action)
+            written.append(to_obj.dirty_fields)
+            lookup_changes.append(self._get_lookup_changes(action[0]["update"]["_id"], to_obj, "save"))
+        if not actions:
+            return []
+        # pending writes of a unit of work must be applied before
+        uow = UnitOfWork.current()
+        if uow:
+            uow.flush()
+        try:
+            results = self._bulk(actions, **kwargs)
+        finally:
+            for action, _ in actions:
+                self._on_write(action["update"]["_id"])
+        written_entries = []
+        for to_obj, to_obj_written, to_obj_lookup_changes, (rec_id, error) in zip(
+                to_objs, written, lookup_changes, results):
+            if error is None:
+                to_obj.mark_stored(to_obj_written)
+                written_entries.append((rec_id, to_obj, to_obj_lookup_changes))
+        self._apply_many_lookup_changes(written_entries)
+        return results
+
+    def bulk_update_if_exists(self, to_objs, **kwargs):
+        kwargs["upsert"] = False
+        return self.bulk_save(to_objs, **kwargs)
+
+    # versioned=True only deletes records not changed since they were loaded (with version read arg)
+    def bulk_delete(self, to_objs, **kwargs):
+        versioned = kwargs.pop("versioned", False)
+        actions = []
+        lookup_changes = []
+        for to_obj in to_objs:
+            action = self._get_bulk_action("delete", to_obj)
+            if versioned:
+                action[0]["delete"]["_version"] = to_obj._version
+            actions.append(action)
+            lookup_changes.append(self._get_lookup_changes(action[0]["delete"]["_id"], to_obj, "delete"))
+        if not actions:
+            return []
+        # pending writes of a unit of work must be applied before
+        uow = UnitOfWork.current()
+        if uow:
+            uow.flush()
+        try:
+            results = self._bulk(actions, **kwargs)
+        finally:
+            for action, _ in actions:
+                self._on_write(action["delete"]["_id"])
+        written_entries = []
+        for to_obj, to_obj_lookup_changes, (rec_id, error) in zip(to_objs, lookup_changes, results):
+            if error is None:
+                written_entries.append((rec_id, to_obj, to_obj_lookup_changes))
+        self._apply_many_lookup_changes(written_entries)
+        return results
+
     def _index(self, to_obj, **kwargs):
         write_args = add_defaults(kwargs.get(self._WRITE_ARGS_LABEL, {}), self._default_write_args)
 
         # call serialize BEFORE _build_pk
         doc_body = to_obj.serialize()
+        written = to_obj.dirty_fields
 
         rec_id = kwargs.get("rec_id")
         if rec_id is None:
             rec_id = self._build_pk(to_obj)
+        lookup_changes = self._get_lookup_changes(
+            rec_id, to_obj, "create" if write_args.get("op_type") == "create" else "replace")
         try:
             self.data_source.connection.index(
                 index=self.data_source.index,
@@ -93,44 +316,80 @@ class DBBaseDao(BaseDao):
                 body=doc_body,
                 id=rec_id,
                 params=write_args)
+            to_obj.mark_stored(written)
+            self._apply_lookup_changes(rec_id, to_obj, lookup_changes)
             return to_obj
         except ElasticsearchException as e:
             if e.__class__ in self._EXCEPTION_IGNORE_ON_WRITE:
                 self._log_exception(*e.args)
                 return None
+            if e.args[0] == 409 and write_args.get("op_type") == "create":
+                raise RecordAlreadyExistsException("Record %s already exists" % rec_id)
             raise
+        finally:
+            self._on_write(rec_id)
 
     def replace(self, to_obj, **kwargs):
+        if self._queue_write("replace", to_obj, **kwargs):
+            return to_obj
+
         if self._WRITE_ARGS_LABEL not in kwargs:
             kwargs[self._WRITE_ARGS_LABEL] = {}
         kwargs[self._WRITE_ARGS_LABEL]["op_type"] = "index"
         return self._index(to_obj, **kwargs)
 
+    # deferred=True queues the create in the current unit of work like plain writes, so it is sent in
+    # the same bulk. A record that already exists then raises RecordAlreadyExistsException on flush.
     def create(self, to_obj, **kwargs):
+        if kwargs.pop("deferred", False) and self._queue_write("create", to_obj, **kwargs):
+            return to_obj
+        uow = UnitOfWork.current()
+        if uow:
+            # the conditional write must run after the queued ones
+            uow.flush()
+
         if self._WRITE_ARGS_LABEL not in kwargs:
             kwargs[self._WRITE_ARGS_LABEL] = {}
         kwargs[self._WRITE_ARGS_LABEL]["op_type"] = "create"
-        return self._index(to_obj, **kwargs)
+        result = self._index(to_obj, **kwargs)
+        uow = UnitOfWork.current()
+        if uow and result is not None:
+            uow.register(self._get_table_name(), self._build_pk(to_obj), to_obj)
+        return result
 
     def delete(self, to_obj, **kwargs):
+        if self._queue_write("delete", to_obj, **kwargs):
+            return True
+
         # call serialize BEFORE _build_pk
         to_obj.serialize()
 
         rec_id = kwargs.get("rec_id")
         if rec_id is None:
             rec_id = self._build_pk(to_obj)
+        lookup_changes = self._get_lookup_changes(rec_id, to_obj, "delete")
+        delete_args = {}
+        if "version" in kwargs:
+            # only deletes the record if it wasn't changed since this version
+            delete_args["params"] = dict(version=kwargs["version"])
         try:
             self.data_source.connection.delete(
                 index=self.data_source.index,
                 doc_type=self._get_table_name(),
-                id=rec_id
+                id=rec_id,
+                **delete_args
             )
+            self._apply_lookup_changes(rec_id, to_obj, lookup_changes)
             return True
         except ElasticsearchException as e:
             if e.__class__ in self._EXCEPTION_IGNORE_ON_DELETE:
                 self._log_exception(*e.args)
                 return
+            if e.args[0] == 409:
+                raise OutDatedRecordException()
             raise
+        finally:
+            self._on_write(rec_id)
 
     def exists(self, pk):
         return self.data_source.connection.exists(
@@ -145,29 +404,29 @@ class DBBaseDao(BaseDao):
         for k, v in record.iteritems():
             if not hasattr(to_obj, k):
                 setattr(to_obj, k, v)
+        # record metadata (i.e. _id of PKUUIDTO) doesn't count as a change
+        to_obj.mark_stored()
         return to_obj
 
-    def get_by_pk(self, pk, *fields, **kwargs):
+    def _get_record(self, pk, *fields, **kwargs):
         read_args = add_defaults(kwargs.get(self._READ_ARGS_LABEL, {}), self._default_read_args)
         if fields:
             read_args["_source"] = Helpers.concat(fields, ",")
 
         try:
-            record = self.data_source.connection.get(
+            return self.data_source.connection.get(
                 index=self.data_source.index,
                 doc_type=self._get_table_name(),
                 id=pk,
                 params=read_args
             )
-            if record is not None:
-                return self._record_to_to(record)
         except ElasticsearchException as e:
             if e.__class__ in self._EXCEPTION_IGNORE_ON_READ:
                 self._log_exception(*e.args)
                 return None
             raise
 
-    def get_by_pks(self, pks, *fields, **kwargs):
+    def _get_records(self, pks, *fields, **kwargs):
         read_args = add_defaults(kwargs.get(self._READ_ARGS_LABEL, {}), self._default_read_args)
         if fields:
             read_args["_source"] = Helpers.concat(fields, ",")
@@ -179,19 +438,90 @@ class DBBaseDao(BaseDao):
                 body=dict(ids=list(pks)),
                 params=read_args
             )
-            return {record["_id"]: self._record_to_to(record) if record["found"] else None
-                    for record in records["docs"]}
+            return records["docs"]
         except ElasticsearchException as e:
             if e.__class__ in self._EXCEPTION_IGNORE_ON_READ:
                 self._log_exception(*e.args)
                 return None
             raise
 
+    def _use_record_cache(self, **kwargs):
+        # records read with custom read args (i.e. routing, versions) are never cached
+        return self.record_cache is not None and not kwargs.get(self._READ_ARGS_LABEL)
+
+    def _get_unit_of_work(self, **kwargs):
+        # records read with custom read args (i.e. routing, versions) bypass the identity map
+        if not kwargs.get(self._READ_ARGS_LABEL):
+            return UnitOfWork.current()
+
+    def _register(self, uow, to_obj, *fields):
+        # only full records are shared by the identity map
+        if uow is None or fields:
+            return to_obj
+        return uow.register(self._get_table_name(), self._build_pk(to_obj), to_obj)
+
+    def get_by_pk(self, pk, *fields, **kwargs):
+        uow = self._get_unit_of_work(**kwargs)
+        if uow:
+            found, to_obj = uow.get(self._get_table_name(), pk)
+            if found:
+                return to_obj
+
+        use_cache = self._use_record_cache(**kwargs)
+        if use_cache:
+            # a full record also serves requests for some fields
+            record = self.record_cache.get_record(pk)
+            if record is not None:
+                return self._register(uow, self._record_to_to(record))
+            write_mark = self.record_cache.write_mark
+
+        if self.batch_loader and not fields and not kwargs.get(self._READ_ARGS_LABEL):
+            # wait a few ms for other gets and send them all as a single mget
+            record = self.batch_loader.load(pk)
+        else:
+            record = self._coalesce("get", self._get_record, pk, *fields, **kwargs)
+        if record is not None:
+            if use_cache and not fields and record.get("found", True):
+                self.record_cache.set_record(pk, record, write_mark)
+            return self._register(uow, self._record_to_to(record), *fields)
+
+    def get_by_pks(self, pks, *fields, **kwargs):
+        result = {}
+        missing = []
+        uow = self._get_unit_of_work(**kwargs)
+        use_cache = self._use_record_cache(**kwargs)
+        for pk in pks:
+            if uow:
+                found, to_obj = uow.get(self._get_table_name(), pk)
+                if found:
+                    result[pk] = to_obj
+                    continue
+            record = self.record_cache.get_record(pk) if use_cache else None
+            if record is not None:
+                result[pk] = self._register(uow, self._record_to_to(record))
+            else:
+                missing.append(pk)
+        if use_cache:
+            write_mark = self.record_cache.write_mark
+
+        if missing:
+            records = self._coalesce("mget", self._get_records, missing, *fields, **kwargs)
+            if records is None:
+                return None
+            for record in records:
+                if not record["found"]:
+                    result[record["_id"]] = None
+                    continue
+                if use_cache and not fields:
+                    self.record_cache.set_record(record["_id"], record, write_mark)
+                result[record["_id"]] = self._register(uow, self._record_to_to(record), *fields)
+        return result
+
     def get_all(self, table_name=None, **kwargs):
         raise NotImplementedError("get_all disabled")
 
-    def search_by_field_value(self, field_to_search, value_to_search, *fields, **kwargs):
-
+    @staticmethod
+    def _build_field_value_query(field_to_search, value_to_search):
         must = []
         if isinstance(field_to_search, list) and isinstance(value_to_search, list):
             for i in xrange(0, len(field_to_search)):
@@ -199,7 +529,7 @@ class DBBaseDao(BaseDao):
         else:
             must.append({"term": {field_to_search: value_to_search}})
 
-        query = {
+        return {
             "query": {
                 "filtered": {
                     "filter": {
@@ -210,8 +540,98 @@ class DBBaseDao(BaseDao):
                 }
             }
         }
+
+    def search_by_field_value(self, field_to_search, value_to_search, *fields, **kwargs):
+        if self.lookup_index and not kwargs.get(self._READ_ARGS_LABEL):
+            # realtime gets through the lookups of indexed fields
+            to_objs = self.lookup_index.search(field_to_search, value_to_search, *fields)
+            if to_objs is not None:
+                return iter(to_objs)
+
+        query = self._build_field_value_query(field_to_search, value_to_search)
         return self._run_query(query, *fields, **kwargs)
 
+    def update_by_field_value(self, field_to_search, value_to_search, values, **kwargs):
+        query = self._build_field_value_query(field_to_search, value_to_search)
+        return self.update_by_query(query, values, **kwargs)
+
+    # Set based update: assigns values (field name -> value) to every record matching query and
+    # returns the updated TOs. Takes one search and one bulk call regardless of how many records match
+    # (plus one of each per retry).
+    # Each record is only written if it didn't change since it was found, records changed meanwhile are
+    # searched again (if they still match) and retried up to _max_update_by_query_attempts times.
+    # Raises BulkWriteException (with the updated TOs in written) when some record could not be written.
+    # Elasticsearch _update_by_query only reports counters (and needs scripting), so it isn't used here.
+    def update_by_query(self, query, values, **kwargs):
+        # pending writes of a unit of work must be applied and visible to the search before
+        uow = UnitOfWork.current()
+        if uow and uow.flush():
+            self.data_source.connection.indices.refresh(index=self.data_source.index)
+
+        read_args = add_defaults(kwargs.get(self._READ_ARGS_LABEL, {}), self._default_read_args)
+        read_args["version"] = "true"
+        read_args.setdefault("size", self._default_update_by_query_size)
+
+        updated = []
+        errors = []
+        conflicts = []
+        pending_query = query
+        for attempt in xrange(self._max_update_by_query_attempts):
+            if attempt > 0:
+                # only the conflicting records, once their last write is visible to the search
+                self.data_source.connection.indices.refresh(index=self.data_source.index)
+                pending_query = dict(query, query=dict(filtered=dict(
+                    query=query.get("query") or dict(match_all={}),
+                    filter=dict(ids=dict(values=[rec_id for rec_id, _ in conflicts])))))
+            records = self._search(pending_query, read_args)
+            conflicts = []
+            if records:
+                self._update_records(records, values, uow, updated, errors, conflicts, **kwargs)
+            if not conflicts:
+                break
+        errors.extend(conflicts)
+        if errors:
+            raise BulkWriteException(errors, updated)
+        return updated
+
+    # writes values to records (search hits with version), adding the TOs written to updated, the
+    # (pk, error) of failed writes to errors and of writes that lost to a concurrent one to conflicts
+    def _update_records(self, records, values, uow, updated, errors, conflicts, **kwargs):
+        to_objs = []
+        actions = []
+        lookup_changes = []
+        for record in records:
+            version = record["_version"]
+            to_obj = self._record_to_to(record)
+            for field_name, value in values.iteritems():
+                setattr(to_obj, field_name, value)
+            doc = to_obj.serialize(*to_obj.dirty_fields)
+            rec_id = self._build_pk(to_obj)
+            to_objs.append(to_obj)
+            actions.append((dict(update=dict(_type=self._get_table_name(), _id=rec_id, _version=version)),
+                            dict(doc=doc)))
+            lookup_changes.append(self._get_lookup_changes(rec_id, to_obj, "save"))
+
+        try:
+            results = self._bulk_items(actions, **kwargs)
+        finally:
+            for action, _ in actions:
+                self._on_write(action["update"]["_id"])
+
+        for to_obj, to_obj_lookup_changes, (rec_id, error, status) in zip(to_objs, lookup_changes, results):
+            if error is not None:
+                (conflicts if status == 409 else errors).append((rec_id, error))
+                continue
+            to_obj.mark_stored()
+            self._apply_lookup_changes(rec_id, to_obj, to_obj_lookup_changes)
+            if uow:
+                known = uow.register(self._get_table_name(), self._build_pk(to_obj), to_obj)
+                if known is not None and known is not to_obj:
+                    for field_name in values:
+                        setattr(known, field_name, getattr(to_obj, field_name))
+                    known.mark_stored(values.keys())
+            updated.append(to_obj)
+
     def search_by_field_range(self, field_to_search, initial_range, final_range, *fields, **kwargs):
         query = {
             "query": {
@@ -245,11 +665,33 @@ class DBBaseDao(BaseDao):
     def _log_exception(self, *args):
         logging.warning("{0} - {1} [{2}]".format(args[0], args[1], args[2]))
 
-    def _run_query(self, query, *fields, **kwargs):
+    # raw hits of query
+    def _get_query_records(self, query, *fields, **kwargs):
         read_args = add_defaults(kwargs.get(self._READ_ARGS_LABEL, {}), self._default_read_args)
         if fields:
             read_args["_source"] = Helpers.concat(fields, ",")
 
+        if self.query_cache:
+            key = QueryCache.build_key(query, read_args)
+            records = self.query_cache.get_records(key)
+            if records is None:
+                write_mark = self.query_cache.write_mark
+                records = self._coalesce("search", self._search, query, read_args)
+                self.query_cache.set_records(key, records, write_mark)
+        else:
+            records = self._coalesce("search", self._search, query, read_args)
+        return records
+
+    def _run_query(self, query, *fields, **kwargs):
+        records = self._get_query_records(query, *fields, **kwargs)
+        uow = self._get_unit_of_work(**kwargs)
+        for record in records:
+            to_obj = self._register(uow, self._record_to_to(record), *fields)
+            # skip records deleted in the current unit of work
+            if to_obj is not None:
+                yield to_obj
+
+    def _search(self, query, read_args):
         try:
             records = self.data_source.connection.search(
                 index=self.data_source.index,
@@ -257,8 +699,7 @@ class DBBaseDao(BaseDao):
                 body=query,
                 params=read_args
             )
-            for record in records["hits"]["hits"]:
-                yield self._record_to_to(record)
+            return records["hits"]["hits"]
         except ElasticsearchException as e:
             if e.__class__ in self._EXCEPTION_IGNORE_ON_QUERY:
                 self._log_exception(*e.args)
@@ -283,6 +724,9 @@ class DBBaseDao(BaseDao):
             body=mappings,
             index=self.data_source.index)
 
+        if self.lookup_index:
+            self.lookup_index.create_table()
+
     def _get_field_mapping(self, field):
         if isinstance(field, StringField) or isinstance(field, UUIDField):
             return dict(type="string", index="not_analyzed")
@@ -9,7 +9,7 @@ class DriverDao(DBBaseDao):
     _to_class = DriverTO
 
     def list_in_rectangle(self, top_left, bottom_right, only_active=True,
-                          top_left_exclude=None, bottom_right_exclude=None):
+                          top_left_exclude=None, bottom_right_exclude=None, fields=()):
         #{"lat":40.722, "lon":-73.989}
         must = [
             {
@@ -48,4 +48,49 @@ class DriverDao(DBBaseDao):
                 }
             }
         }
-        return self._run_query(query)
\ No newline at end of file
+        return self._run_query(query, *fields)
+
+    # Returns a list of (driver, distance in km) for the size drivers nearest to location
+    # within max_distance km, nearest first
+    def list_nearest(self, location, size, max_distance, only_active=True, fields=()):
+        must = [
+            {
+                "geo_distance": {
+                    "distance": "%skm" % max_distance,
+                    "location": location
+                }
+            }
+        ]
+
+        if only_active:
+            must.append({"term": {"available": True}})
+
+        query = {
+            "query": {
+                "filtered": {
+                    "filter": {
+                        "bool": dict(must=must)
+                    }
+                }
+            },
+            "sort": [
+                {
+                    "_geo_distance": {
+                        "location": location,
+                        "order": "asc",
+                        "unit": "km"
+                    }
+                }
+            ],
+            "size": size
+        }
+
+        result = []
+        uow = self._get_unit_of_work()
+        for record in self._get_query_records(query, *fields):
+            # sort value of each hit is its distance
+            distance = record.pop("sort")[0]
+            to_obj = self._register(uow, self._record_to_to(record), *fields)
+            if to_obj is not None:
+                result.append((to_obj, distance))
+        return result
@@ -0,0 +1,9 @@
+__author__ = 'luiz'
+
+from base import DBBaseDao
+from taxi_api.to.driver_stats import DriverStatsTO
+
+
+class DriverStatsDao(DBBaseDao):
+    _default_table = "driver_stats"
+    _to_class = DriverStatsTO
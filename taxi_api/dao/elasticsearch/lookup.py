@@ -0,0 +1,256 @@
+__author__ = 'luiz'
+
+import logging
+from elasticsearch.exceptions import NotFoundError, ConflictError
+from elasticsearch.helpers import bulk as es_bulk
+
+
+class LookupIndex(object):
+    """
+        Secondary lookups for the TO fields declared with index=True. Each (field, value) pair has a
+        small document with id "field:value" in the "<table>_lookup" doc type, listing the pks of the
+        records holding that value. The dao keeps them up to date on every write (optimistic
+        concurrency using document versions) and search_by_field_value resolves them with realtime
+        GETs instead of near real time searches.
+        Lookups might list pks that no longer match (i.e. a failed write), so records are always checked
+        against the searched values. Values with more than max_pks records fall back to searches.
+    """
+
+    _max_retries = 10
+    _max_pks = 100
+
+    def __init__(self, dao):
+        self.dao = dao
+        self.fields = dao._to_class._indexes
+        self.doc_type = "%s_lookup" % dao._get_table_name()
+
+    @property
+    def connection(self):
+        return self.dao.data_source.connection
+
+    @staticmethod
+    def _get_id(field_name, value):
+        return "%s:%s" % (field_name, value)
+
+    def _serialize(self, field_name, value):
+        if value is None:
+            return None
+        return self.dao._to_class.get_field(field_name).serialize(value)
+
+    def get_pks(self, field_name, value):
+        try:
+            record = self.connection.get(
+                index=self.dao.data_source.index,
+                doc_type=self.doc_type,
+                id=self._get_id(field_name, value))
+            return record["_source"]["pks"]
+        except NotFoundError:
+            return []
+
+    def add(self, field_name, value, pk):
+        self._modify(field_name, value, pk, True)
+
+    def remove(self, field_name, value, pk):
+        self._modify(field_name, value, pk, False)
+
+    def _modify(self, field_name, value, pk, add):
+        lookup_id = self._get_id(field_name, value)
+        index = self.dao.data_source.index
+        for _ in xrange(self._max_retries):
+            try:
+                record = self.connection.get(index=index, doc_type=self.doc_type, id=lookup_id)
+            except NotFoundError:
+                record = None
+
+            try:
+                if record is None:
+                    if add:
+                        self.connection.index(index=index, doc_type=self.doc_type, id=lookup_id,
+                                              body=dict(pks=[pk]), params=dict(op_type="create"))
+                    return
+
+                pks = record["_source"]["pks"]
+                if add == (pk in pks):
+                    return
+                if add:
+                    pks.append(pk)
+                else:
+                    pks.remove(pk)
+
+                if pks:
+                    self.connection.index(index=index, doc_type=self.doc_type, id=lookup_id,
+                                          body=dict(pks=pks), params=dict(version=record["_version"]))
+                else:
+                    self.connection.delete(index=index, doc_type=self.doc_type, id=lookup_id,
+                                           params=dict(version=record["_version"]))
+                return
+            except (ConflictError, NotFoundError):
+                # changed or removed by someone else, try again
+                continue
+        raise Exception("Could not update lookup %s/%s" % (self.doc_type, lookup_id))
+
+    # Must be called BEFORE writing to_obj, returns a list of (field_name, old_value, new_value) to be
+    # passed to apply after the write succeeds.
+    def get_changes(self, rec_id, to_obj, operation):
+        if operation == "delete" or not to_obj._stored:
+            names = self.fields
+        else:
+            names = self.fields.intersection(to_obj.dirty_fields)
+
+        new_values = {}
+        for name in names:
+            if operation == "delete":
+                new_values[name] = None
+                continue
+            new_value = self._serialize(name, to_obj._values.get(name))
+            if new_value is None and operation == "save" and not to_obj.get_field(name).store_null:
+                # partial updates don't remove fields without value
+                continue
+            new_values[name] = new_value
+
+        old_values = dict((name, to_obj._stored_values[name])
+                          for name in new_values if name in to_obj._stored_values)
+        unknown = [name for name in new_values if name not in old_values]
+        if unknown:
+            if operation == "create":
+                old_values.update((name, None) for name in unknown)
+            else:
+                # record might exist already, read what is stored
+                record = self.dao._get_record(rec_id, *unknown)
+                _source = record.get("_source", {}) if record and record.get("found") else {}
+                old_values.update((name, _source.get(name)) for name in unknown)
+
+        return [(name, old_values[name], new_value) for name, new_value in new_values.iteritems()]
+
+    def apply(self, pk, to_obj, changes):
+        self.apply_many([(pk, to_obj, changes)])
+
+    # Applies the changes of many written records, entries are (pk, to_obj, changes). Every lookup
+    # involved is read with one mget and written with one bulk of versioned writes, lookups changed
+    # meanwhile are retried one pk at a time.
+    def apply_many(self, entries):
+        # lookup id -> (field_name, value, [(pk, add)]), in order
+        modifications = {}
+        for pk, to_obj, changes in entries:
+            for name, old_value, new_value in changes:
+                if old_value == new_value:
+                    continue
+                if old_value is not None:
+                    modifications.setdefault(self._get_id(name, old_value), (name, old_value, []))[2].append(
+                        (pk, False))
+                if new_value is not None:
+                    modifications.setdefault(self._get_id(name, new_value), (name, new_value, []))[2].append(
+                        (pk, True))
+
+        failed = set()
+        if modifications:
+            try:
+                retry = self._write_many(modifications)
+            except Exception as e:
+                logging.warning("Lookups of %s not updated in bulk: %s" % (self.doc_type, e))
+                retry = modifications.keys()
+            for lookup_id in retry:
+                name, value, operations = modifications[lookup_id]
+                for pk, add in operations:
+                    try:
+                        self._modify(name, value, pk, add)
+                    except Exception as e:
+                        # the record is already written, lookup will be fixed by rebuild
+                        logging.warning("Lookup %s of %s not updated: %s" % (name, pk, e))
+                        failed.add((pk, name))
+
+        for pk, to_obj, changes in entries:
+            for name, _, new_value in changes:
+                if (pk, name) in failed:
+                    to_obj._stored_values.pop(name, None)
+                else:
+                    to_obj._stored_values[name] = new_value
+
+    # Writes modifications with one mget and one bulk, returns the lookup ids that were not written
+    def _write_many(self, modifications):
+        index = self.dao.data_source.index
+        lookup_ids = modifications.keys()
+        docs = self.connection.mget(index=index, doc_type=self.doc_type, body=dict(ids=lookup_ids))["docs"]
+
+        body = []
+        written = []
+        for lookup_id, doc in zip(lookup_ids, docs):
+            found = doc.get("found")
+            pks = list(doc["_source"]["pks"]) if found else []
+            for pk, add in modifications[lookup_id][2]:
+                if add and pk not in pks:
+                    pks.append(pk)
+                elif not add and pk in pks:
+                    pks.remove(pk)
+
+            action = dict(_type=self.doc_type, _id=lookup_id)
+            if not found:
+                if not pks:
+                    continue
+                body.extend([dict(create=action), dict(pks=pks)])
+            elif pks == doc["_source"]["pks"]:
+                continue
+            elif pks:
+                action["_version"] = doc["_version"]
+                body.extend([dict(index=action), dict(pks=pks)])
+            else:
+                action["_version"] = doc["_version"]
+                body.append(dict(delete=action))
+            written.append(lookup_id)
+
+        if not body:
+            return []
+        response = self.connection.bulk(index=index, body=body)
+        return [lookup_id for lookup_id, item in zip(written, response["items"])
+                if item.values()[0].get("error")]
+
+    # Returns the records matching all field/value pairs or None when lookups can't be used
+    def search(self, field_to_search, value_to_search, *fields):
+        if not isinstance(field_to_search, list):
+            field_to_search, value_to_search = [field_to_search], [value_to_search]
+        lookup_fields = [name for name in field_to_search if name in self.fields]
+        if not lookup_fields:
+            return None
+
+        lookup_field = lookup_fields[0]
+        pks = self.get_pks(lookup_field, value_to_search[field_to_search.index(lookup_field)])
+        if len(pks) > self._max_pks:
+            return None
+        if not pks:
+            return []
+
+        if fields:
+            fields = tuple(fields) + tuple(name for name in field_to_search if name not in fields)
+        records = self.dao.get_by_pks(pks, *fields) or {}
+
+        result = []
+        for pk in pks:
+            to_obj = records.get(pk)
+            if to_obj is None:
+                continue
+            if all(self._serialize(name, getattr(to_obj, name, None)) == value
+                   for name, value in zip(field_to_search, value_to_search)):
+                result.append(to_obj)
+        return result
+
+    def create_table(self):
+        self.connection.indices.put_mapping(
+            doc_type=self.doc_type,
+            body=dict(_all=dict(enabled=False),
+                      properties=dict(pks=dict(type="string", index="no"))),
+            index=self.dao.data_source.index)
+
+    # Rebuild every lookup from the records, lookups not listed by any record are not removed
+    def rebuild(self):
+        lookups = {}
+        for record in self.dao.data_source.scan(doc_type=self.dao._get_table_name(),
+                                                query=dict(_source=list(self.fields))):
+            for name in self.fields:
+                value = record["_source"].get(name)
+                if value is not None:
+                    lookups.setdefault(self._get_id(name, value), []).append(record["_id"])
+
+        actions = (dict(_op_type="index", _index=self.dao.data_source.index, _type=self.doc_type,
+                        _id=lookup_id, _source=dict(pks=pks)) for lookup_id, pks in lookups.iteritems())
+        es_bulk(self.connection, actions)
+        return len(lookups)
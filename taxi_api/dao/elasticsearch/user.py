@@ -4,8 +4,8 @@ from base import DBBaseDao
 from taxi_api.to.user import UserTO
 from taxi_api.to.driver import DriverTO
 from taxi_api.dao.elasticsearch.driver import DriverDao
+from taxi_api.dao.unit_of_work import UnitOfWork
 from hashlib import md5
-from uuid import uuid4
 
 
 class UserDao(DBBaseDao):
@@ -26,20 +26,22 @@ class UserDao(DBBaseDao):
         return UserDao._user_session_dao
 
     def create(self, to_obj, **args):
+        # user and initial driver status are sent in a single bulk inside a unit of work
+        deferred = args.setdefault("deferred", True) and UnitOfWork.current() is not None
         super(UserDao, self).create(to_obj, **args)
 
         if to_obj.role == "driver":
             # post initial status for driver
             # enabling future update_if_exists
             driver_to = DriverTO(driver_id=to_obj.user_id, available=True, location=(0, 0))
-            self._get_driver_dao().save(driver_to)
+            if deferred:
+                # bulks aren't atomic, must fail instead of resetting the status when the user exists
+                self._get_driver_dao().create(driver_to, deferred=True)
+            else:
+                self._get_driver_dao().save(driver_to)
 
     def login(self, username, password, **kwargs):
         user_to = self.get_by_pk(md5(username).hexdigest())
         if user_to and user_to.password == md5(password).hexdigest():
-            api_token = md5(str(uuid4)).hexdigest()
-            self._get_user_session_dao().save(
-                self._get_user_session_dao()._to_class(
-                    **dict(api_token=api_token, user_id=user_to.user_id))
-            )
+            api_token = self._get_user_session_dao().create_session(user_to.user_id)
             return user_to, api_token
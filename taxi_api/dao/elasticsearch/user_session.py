@@ -3,27 +3,113 @@ __author__ = 'luiz'
 from base import DBBaseDao
 from taxi_api.to.user_session import UserSessionTO
 from taxi_api.dao.elasticsearch.user import UserDao
+from taxi_api.to.user import UserTO
+from taxi_api.to.fields import DateTimeField
+from taxi_api.helpers.helpers import Helpers
+from datetime import datetime, timedelta
+from uuid import uuid4
 
 
 class UserSessionDao(DBBaseDao):
     _default_table = "user_session"
     _to_class = UserSessionTO
     _user_dao = None
+    _default_ttl = 86400
+    _legacy_deadline = None
 
     def _get_user_dao(self):
         if UserSessionDao._user_dao is None:
             UserSessionDao._user_dao = UserDao(self.ds_provider, self.data_source)
         return UserSessionDao._user_dao
 
+    @staticmethod
+    def _get_ttl():
+        return (Helpers.load_config().get("session") or {}).get("ttl", UserSessionDao._default_ttl)
+
+    # sessions without expiration (created before sessions expired, i.e. by a server not updated yet)
+    # are valid until ttl after this process started, create_table gives the existing ones an expiration
+    @staticmethod
+    def _get_legacy_deadline():
+        if UserSessionDao._legacy_deadline is None:
+            UserSessionDao._legacy_deadline = datetime.now() + timedelta(seconds=UserSessionDao._get_ttl())
+        return UserSessionDao._legacy_deadline
+
+    def create_table(self, **kwargs):
+        super(UserSessionDao, self).create_table(**kwargs)
+        self.set_missing_expiration()
+
+    # sets the expiration of sessions without one to ttl from now, returns how many were updated
+    def set_missing_expiration(self, **kwargs):
+        query = {
+            "query": {
+                "filtered": {
+                    "filter": {"missing": {"field": "expires_in"}}
+                }
+            }
+        }
+        expires_in = datetime.now() + timedelta(seconds=self._get_ttl())
+        total = 0
+        while True:
+            updated = self.update_by_query(query, dict(expires_in=expires_in), **kwargs)
+            total += len(updated)
+            if len(updated) < self._default_update_by_query_size:
+                return total
+            # the next search must not find the sessions just updated
+            self.data_source.connection.indices.refresh(index=self.data_source.index)
+
+    # token starts with the user_id (the session pk), so sessions are read with a realtime get
+    @staticmethod
+    def _build_api_token(user_id):
+        return "%s.%s" % (user_id, uuid4().hex)
+
+    def create_session(self, user_id, **kwargs):
+        api_token = self._build_api_token(user_id)
+        self.save(self._to_class(
+            user_id=user_id,
+            api_token=api_token,
+            expires_in=datetime.now() + timedelta(seconds=self._get_ttl())
+        ), **kwargs)
+        return api_token
+
+    def get_session(self, api_token, **kwargs):
+        user_id, sep, _ = api_token.partition(".")
+        if sep:
+            session_to = self.get_by_pk(user_id, **kwargs)
+        else:
+            # tokens created before they carried the user_id
+            session_to = next(self.search_by_field_value("api_token", api_token, **kwargs), None)
+
+        if session_to and session_to.api_token == api_token and \
+                (session_to.expires_in or self._get_legacy_deadline()) > datetime.now():
+            return session_to
+
     def get_user_from_session(self, api_token, **kwargs):
-        for session_to in self.search_by_field_value("api_token", api_token, **kwargs):
+        session_to = self.get_session(api_token, **kwargs)
+        if session_to:
             user_to = self._get_user_dao().get_by_pk(session_to.user_id)
             if user_to:
+                # copy it, the loaded TO might be shared by the current unit of work
+                user_to = UserTO(**user_to._values)
                 user_to.password = "_"
                 return user_to
-            return
 
     def logout(self, api_token, **kwargs):
-        user_to = self.get_user_from_session(api_token)
-        if user_to:
-            self.delete(self.get_by_pk(user_to.user_id))
+        session_to = self.get_session(api_token, **kwargs)
+        if session_to:
+            self.delete(session_to)
+
+    # Deletes up to batch_size expired sessions in a single bulk call, sessions without expiration are kept.
+    # Returns a tuple (found, deleted), sessions renewed after being found are kept.
+    def delete_expired(self, batch_size, **kwargs):
+        query = {
+            "query": {
+                "filtered": {
+                    "filter": {
+                        "range": {"expires_in": {"lt": DateTimeField.serialize(datetime.now())}}
+                    }
+                }
+            }
+        }
+        records = self._search(query, dict(version="true", size=batch_size))
+        results = self.bulk_delete([self._record_to_to(record) for record in records], versioned=True, **kwargs)
+        return len(records), len([error for _, error in results if error is None])
@@ -0,0 +1,123 @@
+__author__ = 'luiz'
+
+import logging
+import threading
+from taxi_api.helpers.exceptions import BulkWriteException, RecordAlreadyExistsException
+
+
+class UnitOfWork(object):
+    """
+        Request scoped identity map and write queue used by the daos of the current thread.
+        Repeated loads of the same record return the same TO, plain writes (save, update_if_exists,
+        replace, delete and deferred creates) are queued and flushed as a single bulk call when the
+        unit of work ends. Conditional writes (creates, versioned saves) flush the queue and run right
+        away, so the caller still gets their result/error and the writes keep their order.
+        Hooks of queued writes (see after_write) only run once the flush wrote them.
+    """
+
+    _local = threading.local()
+    _DELETED = object()
+
+    def __init__(self):
+        self._identity_map = {}
+        self._pending = []
+        self._previous = None
+
+    @staticmethod
+    def current():
+        return getattr(UnitOfWork._local, "current", None)
+
+    def __enter__(self):
+        self._previous = UnitOfWork.current()
+        UnitOfWork._local.current = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        UnitOfWork._local.current = self._previous
+        if exc_type is None:
+            self.flush()
+        else:
+            # request failed, queued writes are discarded
+            self.discard()
+        return False
+
+    def discard(self):
+        # queued writes (and their hooks) are dropped without being sent
+        self._pending = []
+
+    def get(self, doc_type, pk):
+        # returns a tuple (found, to_obj), to_obj is None when record was deleted in this unit of work
+        to_obj = self._identity_map.get((doc_type, pk))
+        if to_obj is None:
+            return False, None
+        if to_obj is UnitOfWork._DELETED:
+            return True, None
+        return True, to_obj
+
+    def register(self, doc_type, pk, to_obj):
+        # returns the TO already known for pk (if any) so every load shares the same instance
+        # or None when it was deleted in this unit of work
+        known = self._identity_map.get((doc_type, pk))
+        if known is UnitOfWork._DELETED:
+            return None
+        if known is not None:
+            return known
+        self._identity_map[(doc_type, pk)] = to_obj
+        return to_obj
+
+    def add_write(self, dao, operation, to_obj, **kwargs):
+        # build action now, so the queued write doesn't change if caller keeps changing to_obj
+        action = dao._get_bulk_action(operation, to_obj, **kwargs)
+        rec_id = action[0].values()[0]["_id"]
+        written = to_obj.dirty_fields if operation != "delete" else None
+        lookup_changes = dao._get_lookup_changes(rec_id, to_obj, operation)
+        self._pending.append((dao, rec_id, action, to_obj, written, lookup_changes, []))
+        self._identity_map[(dao._get_table_name(), rec_id)] = \
+            UnitOfWork._DELETED if operation == "delete" else to_obj
+
+    # Runs callback(to_obj) after the queued write of to_obj is flushed successfully.
+    # Returns False when to_obj has no queued write (caller must run it now)
+    def after_write(self, to_obj, callback):
+        for entry in reversed(self._pending):
+            if entry[3] is to_obj:
+                entry[6].append(callback)
+                return True
+        return False
+
+    # Returns the number of writes sent
+    def flush(self):
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, []
+        # all daos share the same data source, any of them can send the bulk
+        try:
+            results = pending[0][0]._bulk_items([entry[2] for entry in pending])
+        finally:
+            for entry in pending:
+                entry[0]._on_write(entry[1])
+
+        written_entries = []
+        for (dao, rec_id, _, to_obj, written, lookup_changes, hooks), (_, error, _) in zip(pending, results):
+            if error is not None:
+                continue
+            if written is not None:
+                to_obj.mark_stored(written)
+            dao._apply_lookup_changes(rec_id, to_obj, lookup_changes)
+            written_entries.append((to_obj, hooks))
+
+        for to_obj, hooks in written_entries:
+            for callback in hooks:
+                try:
+                    callback(to_obj)
+                except Exception as e:
+                    # the record is already written, a hook can't undo it
+                    logging.warning("After write hook of %s failed: %s" % (to_obj, e))
+
+        errors = [(rec_id, error) for rec_id, error, _ in results if error is not None]
+        if errors:
+            existing = [rec_id for entry, (rec_id, error, status) in zip(pending, results)
+                        if error is not None and status == 409 and "create" in entry[2][0]]
+            if len(existing) == len(errors):
+                raise RecordAlreadyExistsException("Record %s already exists" % ", ".join(existing))
+            raise BulkWriteException(errors)
+        return len(pending)
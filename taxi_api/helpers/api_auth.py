@@ -1,5 +1,6 @@
 __author__ = 'luiz'
 
+import hmac
 from flask_restful import abort as rest_abort, wraps
 from flask_restful import request
 from taxi_api.business.user_session import UserSessionBus
@@ -12,6 +13,9 @@ class ApiAuth(object):
     _ds_name = _cfg["api"]["database"]
     _environ = _cfg["env"]
     _session_bus = UserSessionBus(_ds_name, _environ)
+    # fleet gateways allowed to write driver statuses, i.e:
+    # "gateways": [{"name": "fleet_a", "access_key": "...", "drivers": ["driver_id", ...]}], "drivers": "*" is any driver
+    _gateways = _cfg.get("gateways") or []
 
     def __init__(self, *args, **kwargs):
         self.role = kwargs.get("role")
@@ -33,6 +37,28 @@ class ApiAuth(object):
             rest_abort(401)
         return wrapper
 
+    def gateway_key_required(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if self._validate_gateway_key():
+                return func(*args, **kwargs)
+            rest_abort(401)
+        return wrapper
+
+    @staticmethod
+    def gateway_allows(gateway, driver_id):
+        drivers = gateway.get("drivers") or []
+        return drivers == "*" or driver_id in drivers
+
+    def _validate_gateway_key(self):
+        access_key = request.environ.get('HTTP_GATEWAY_ACCESS_KEY')
+        if not access_key:
+            return
+        for gateway in ApiAuth._gateways:
+            if gateway.get("access_key") and hmac.compare_digest(str(gateway["access_key"]), str(access_key)):
+                setattr(request, "current_gateway", gateway)
+                return gateway
+
     def _validate_token(self):
         api_token = request.environ.get('HTTP_API_TOKEN')
         if not api_token:
@@ -0,0 +1,60 @@
+__author__ = 'luiz'
+
+import types
+from multiprocessing.pool import ThreadPool
+from taxi_api.helpers.helpers import Helpers
+
+
+def _materialize(func, args, kwargs):
+    # DAO queries are lazy generators, force them to run inside the worker
+    result = func(*args, **kwargs)
+    if isinstance(result, types.GeneratorType):
+        result = list(result)
+    return result
+
+
+class AsyncExecutor(object):
+    """
+        Runs blocking bus/dao calls concurrently. When the process was started
+        with gevent monkey patching (server.py -s gevent) calls are spawned as
+        greenlets, otherwise they run in a bounded thread pool.
+        Every submit returns an object whose get() waits and returns the result
+        (or raises the exception raised by the call).
+    """
+
+    __instance = None
+
+    _default_pool_size = 20
+
+    def __init__(self):
+        assert AsyncExecutor.__instance is None, "Please use AsyncExecutor.get() to get a singleton instead"
+        cfg = Helpers.load_config().get("async") or {}
+        self.pool_size = cfg.get("pool_size", AsyncExecutor._default_pool_size)
+        self.green = AsyncExecutor._is_gevent_patched()
+        if self.green:
+            from gevent.pool import Pool
+            self._pool = Pool(self.pool_size)
+        else:
+            self._pool = ThreadPool(self.pool_size)
+
+    @staticmethod
+    def get():
+        if AsyncExecutor.__instance is None:
+            AsyncExecutor.__instance = AsyncExecutor()
+        return AsyncExecutor.__instance
+
+    @staticmethod
+    def _is_gevent_patched():
+        try:
+            from gevent import monkey
+        except ImportError:
+            return False
+        return monkey.is_module_patched("socket")
+
+    def submit(self, func, *args, **kwargs):
+        if self.green:
+            return self._pool.spawn(_materialize, func, args, kwargs)
+        return self._pool.apply_async(_materialize, (func, args, kwargs))
+
+    def map(self, func, iterable):
+        return [result.get() for result in [self.submit(func, item) for item in iterable]]
@@ -0,0 +1,92 @@
+__author__ = 'luiz'
+
+import copy
+import threading
+
+
+class _Batch(object):
+
+    def __init__(self):
+        self.keys = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class BatchLoader(object):
+    """
+        Gathers concurrent single key loads and resolves them with one load_many(keys) call, which
+        must return a dict of key -> value. A load arriving while no other is in flight runs right
+        away (no added latency when idle); loads arriving while one is in flight join a batch whose
+        first caller waits until nothing is in flight, window seconds or max_keys (whichever comes
+        first) and runs the load for everybody.
+    """
+
+    def __init__(self, load_many, window, max_keys):
+        self._load_many = load_many
+        self.window = window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._batch = None
+        self._in_flight = 0
+        self.loads = 0
+        self.batches = 0
+
+    def load(self, key):
+        with self._lock:
+            self.loads += 1
+            batch = self._batch
+            if batch is None and not self._in_flight:
+                self._in_flight += 1
+                self.batches += 1
+                alone = True
+            else:
+                alone = False
+                leader = batch is None
+                if leader:
+                    batch = self._batch = _Batch()
+                    self.batches += 1
+                if key not in batch.keys:
+                    batch.keys.append(key)
+                if len(batch.keys) >= self.max_keys:
+                    # close batch, next caller starts a new one
+                    self._batch = None
+                    batch.full.set()
+
+        if alone:
+            try:
+                return self._load_many([key]).get(key)
+            finally:
+                self._loaded()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+                self._in_flight += 1
+            try:
+                batch.results = self._load_many(batch.keys)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+                self._loaded()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        # the same key might have been requested by many callers
+        return copy.deepcopy(batch.results.get(key))
+
+    def _loaded(self):
+        with self._lock:
+            self._in_flight -= 1
+            if not self._in_flight and self._batch is not None:
+                # nothing else to wait for, the pending batch can run now
+                self._batch.full.set()
+
+    def stats(self):
+        return dict(loads=self.loads, batches=self.batches)
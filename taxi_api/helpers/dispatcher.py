@@ -0,0 +1,202 @@
+__author__ = 'luiz'
+
+import json
+import logging
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from Queue import Queue, Full, Empty
+from taxi_api.helpers.helpers import Helpers
+
+
+class Transport(object):
+
+    # sends a batch of messages to service, must raise on failure so the batch is retried
+    def send(self, service, messages):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class PrintTransport(Transport):
+
+    def send(self, service, messages):
+        for message in messages:
+            print "Will dispatch message %s to service %s" % (message, service)
+
+
+class FileTransport(Transport):
+    # one json line per batch, i.e: {"service": "find_and_notify_drivers", "messages": [...]}
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, service, messages):
+        line = json.dumps(dict(service=service, messages=messages), default=str)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+class SocketTransport(Transport):
+    # same json lines as FileTransport written to a TCP connection, reconnecting after failures
+
+    def __init__(self, host, port, timeout=5):
+        self.address = (host, port)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._socket = None
+
+    def send(self, service, messages):
+        line = json.dumps(dict(service=service, messages=messages), default=str)
+        with self._lock:
+            try:
+                if self._socket is None:
+                    self._socket = socket.create_connection(self.address, self.timeout)
+                self._socket.sendall(line + "\n")
+            except socket.error:
+                self._close()
+                raise
+
+    def _close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except socket.error:
+                pass
+            self._socket = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class Dispatcher(object):
+    """
+        Sends messages to other services out of the request path. dispatch() only puts the message in
+        a bounded queue (dropping it when full), worker threads take up to batch_size messages
+        (waiting at most batch_wait_ms for more), group them per service and send each group with a
+        single transport call, retrying with exponential backoff.
+        Configured in "dispatch" config, transport is one of print|file|socket.
+    """
+
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    _transports = {
+        "print": PrintTransport,
+        "file": FileTransport,
+        "socket": SocketTransport
+    }
+
+    def __init__(self):
+        assert Dispatcher.__instance is None, "Please use Dispatcher.get() to get a singleton instead"
+        cfg = Helpers.load_config().get("dispatch") or {}
+        self.transport = self._transports[cfg.get("transport", "print")](**(cfg.get("transport_args") or {}))
+        self.workers = cfg.get("workers", 2)
+        self.batch_size = cfg.get("batch_size", 100)
+        self.batch_wait = cfg.get("batch_wait_ms", 5) / 1000.0
+        self.max_retries = cfg.get("max_retries", 3)
+        self.retry_backoff = cfg.get("retry_backoff_ms", 50) / 1000.0
+        self._queue = Queue(cfg.get("queue_size", 10000))
+        self._lock = threading.Lock()
+        self._threads = []
+        # counters are updated by request and worker threads
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+
+    @staticmethod
+    def get():
+        with Dispatcher.__instance_lock:
+            if Dispatcher.__instance is None:
+                Dispatcher.__instance = Dispatcher()
+            return Dispatcher.__instance
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, value in increments.iteritems():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in xrange(self.workers):
+                thread = threading.Thread(target=self._run, name="dispatcher_%i" % i)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    # Returns False when the message was dropped
+    def dispatch(self, service, message):
+        if not self._threads:
+            self._start()
+        try:
+            self._queue.put_nowait((service, message))
+            self._count(enqueued=1)
+            return True
+        except Full:
+            self._count(dropped=1)
+            logging.warning("Dispatch queue full, message to %s dropped" % service)
+            return False
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.time()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            per_service = OrderedDict()
+            for service, message in self._next_batch():
+                per_service.setdefault(service, []).append(message)
+            for service, messages in per_service.iteritems():
+                self._send(service, messages)
+
+    def _send(self, service, messages):
+        for attempt in xrange(self.max_retries + 1):
+            try:
+                self.transport.send(service, messages)
+                self._count(batches=1, sent=len(messages))
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self._count(failed=len(messages))
+                    logging.warning("Could not dispatch %i messages to %s: %s" % (len(messages), service, e))
+                    return False
+                self._count(retries=1)
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(queue_depth=self._queue.qsize(), enqueued=self.enqueued, dropped=self.dropped,
+                        sent=self.sent, failed=self.failed, retries=self.retries, batches=self.batches)
+
+
+if __name__ == '__main__':
+    # local stand-in for the services reached by SocketTransport: prints every batch received
+    # i.e: python -m taxi_api.helpers.dispatcher 9999
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", int(sys.argv[1]) if len(sys.argv) > 1 else 9999))
+    server.listen(5)
+    while True:
+        conn, _ = server.accept()
+        for line in conn.makefile():
+            print line.strip()
+        conn.close()
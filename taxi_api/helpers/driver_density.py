@@ -0,0 +1,49 @@
+__author__ = 'luiz'
+
+import math
+import threading
+from taxi_api.helpers import geo
+
+
+class DriverDensity(object):
+    """
+        Estimate of available drivers per km2 in each geohash cell, learned from the results of
+        nearest driver queries (exponentially weighted moving average). Used to pick the search radius
+        expected to find a given number of drivers in a single query.
+    """
+
+    def __init__(self, precision=5, alpha=0.2, initial_density=1.0, min_radius=0.5, max_cells=100000):
+        self.precision = precision
+        self.alpha = alpha
+        self.initial_density = initial_density
+        self.min_radius = min_radius
+        self.max_cells = max_cells
+        self._densities = {}
+        self._lock = threading.Lock()
+
+    def get_cell(self, location):
+        return geo.geohash(location["lat"], location["lon"], self.precision)
+
+    def get(self, cell):
+        return self._densities.get(cell, self.initial_density)
+
+    def radius_for(self, cell, count, max_radius):
+        # radius of the circle expected to have count drivers
+        radius = math.sqrt(count / (math.pi * max(self.get(cell), 1e-6)))
+        return min(max(radius, self.min_radius), max_radius)
+
+    # found drivers within radius km of a point in cell, on a query limited to size drivers.
+    # last_distance is the distance of the farthest driver found
+    def observe(self, cell, found, size, radius, last_distance=None):
+        if found >= size and last_distance:
+            # result was truncated, the circle of the farthest driver holds all of them
+            radius = max(last_distance, 0.01)
+        density = found / (math.pi * radius * radius)
+        with self._lock:
+            current = self._densities.get(cell)
+            if current is None:
+                if len(self._densities) >= self.max_cells:
+                    self._densities.clear()
+                self._densities[cell] = density
+            else:
+                self._densities[cell] = current + self.alpha * (density - current)
@@ -0,0 +1,222 @@
+__author__ = 'luiz'
+
+import logging
+import threading
+import time
+from taxi_api.helpers.helpers import Helpers
+from taxi_api.helpers import geo
+
+numpy = geo.numpy
+
+
+class _FeatureColumns(object):
+    # one row per driver in every column, row 0 holds the defaults for unknown drivers.
+    # Not thread safe, see DriverFeatureStore
+
+    _stats_fields = ("rating", "acceptance_rate", "recent_cancellations")
+
+    def __init__(self, defaults, capacity=1024):
+        self.defaults = defaults
+        self.rows = {}
+        # category code 0 means no category
+        self.categories = {None: 0}
+        self.size = 1
+        self.columns = dict(
+            rating=self._new_column(capacity, defaults["rating"], float),
+            acceptance_rate=self._new_column(capacity, defaults["acceptance_rate"], float),
+            recent_cancellations=self._new_column(capacity, defaults["recent_cancellations"], int),
+            category=self._new_column(capacity, 0, int))
+
+    @staticmethod
+    def _new_column(size, value, dtype):
+        if numpy is not None:
+            return numpy.full(size, value, dtype=dtype)
+        return [value] * size
+
+    def get_row(self, driver_id):
+        row = self.rows.get(driver_id)
+        if row is None:
+            row = self.size
+            self.size += 1
+            capacity = len(self.columns["category"])
+            if row >= capacity:
+                # double every column, new rows start with the defaults
+                for name, column in self.columns.items():
+                    default = self.defaults.get(name, 0)
+                    if numpy is not None:
+                        extra = numpy.full(capacity, default, dtype=column.dtype)
+                        self.columns[name] = numpy.concatenate((column, extra))
+                    else:
+                        column.extend([default] * capacity)
+            self.rows[driver_id] = row
+        return row
+
+    def set_stats(self, driver_id, values):
+        # values missing or None are left unchanged
+        row = self.get_row(driver_id)
+        for name in self._stats_fields:
+            value = values.get(name)
+            if value is not None:
+                self.columns[name][row] = value
+
+    def set_category(self, driver_id, category):
+        code = self.categories.get(category)
+        if code is None:
+            code = self.categories[category] = len(self.categories)
+        self.columns["category"][self.get_row(driver_id)] = code
+
+    def gather(self, driver_ids, category):
+        # returns rating, acceptance_rate, recent_cancellations and (when category is given) category matches
+        rows = [self.rows.get(driver_id, 0) for driver_id in driver_ids]
+        columns = self.columns
+        category_code = self.categories.get(category, -1) if category is not None else None
+        if numpy is not None:
+            rows = numpy.array(rows, dtype=numpy.intp)
+            matches = columns["category"][rows] == category_code if category_code is not None else None
+            return (columns["rating"][rows], columns["acceptance_rate"][rows],
+                    columns["recent_cancellations"][rows], matches)
+        matches = [columns["category"][row] == category_code for row in rows] if category_code is not None else None
+        return ([columns["rating"][row] for row in rows], [columns["acceptance_rate"][row] for row in rows],
+                [columns["recent_cancellations"][row] for row in rows], matches)
+
+
+class DriverFeatureStore(object):
+    """
+        In memory driver features used by DriverFinder scoring: rating, acceptance_rate and
+        recent_cancellations (driver_stats records) and car_category (users with role driver).
+        Features are kept in column arrays (numpy when available) indexed by a row per driver, so
+        scoring gathers them for all candidates at once without any I/O.
+        Bulk loaded with scans on start (and every reload_interval seconds, 0 disables it) and kept up
+        to date by the writes made through DriverStatsBus and UserBus of this process (writes made
+        while a load is running are replayed on the loaded features before they are swapped in).
+        Drivers without stats get the configured defaults.
+        Enabled in config, i.e: "driver_finder": {"features": {"rating_weight": 10}}
+    """
+
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self, cfg):
+        self.rating_weight = cfg.get("rating_weight", 10.0)
+        self.acceptance_weight = cfg.get("acceptance_weight", 10.0)
+        self.cancellation_penalty = cfg.get("cancellation_penalty", 2.0)
+        self.max_rating = float(cfg.get("max_rating", 5.0))
+        self.defaults = dict(rating=cfg.get("default_rating", 4.5),
+                             acceptance_rate=cfg.get("default_acceptance_rate", 0.8),
+                             recent_cancellations=0)
+        self.reload_interval = cfg.get("reload_interval", 3600)
+        config = Helpers.load_config()
+        self._ds_name = config["api"]["database"]
+        self._environ = config["env"]
+        self._lock = threading.Lock()
+        self._thread = None
+        self._features = _FeatureColumns(self.defaults)
+        # writes seen while a load is running, list of (apply function, args)
+        self._loading = None
+
+    @staticmethod
+    def get():
+        # returns None when the store is disabled
+        with DriverFeatureStore.__instance_lock:
+            if DriverFeatureStore.__instance is None:
+                cfg = (Helpers.load_config().get("driver_finder") or {}).get("features")
+                if cfg and cfg.get("enabled", True):
+                    DriverFeatureStore.__instance = DriverFeatureStore(cfg)
+                else:
+                    DriverFeatureStore.__instance = False
+            return DriverFeatureStore.__instance or None
+
+    def start(self):
+        try:
+            self.load()
+        except Exception as e:
+            # defaults are used until the next reload
+            logging.warning("Could not load driver features: %s" % e)
+        if self._thread is None and self.reload_interval:
+            self._thread = threading.Thread(target=self._run, name="driver_features")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                self.load()
+            except Exception as e:
+                logging.warning("Could not reload driver features: %s" % e)
+
+    def load(self):
+        from taxi_api.business.driver_stats import DriverStatsBus
+        from taxi_api.business.user import UserBus
+        stats_bus = DriverStatsBus(self._ds_name, self._environ)
+        user_bus = UserBus(self._ds_name, self._environ)
+
+        with self._lock:
+            self._loading = []
+        try:
+            return self._load(stats_bus, user_bus)
+        finally:
+            with self._lock:
+                self._loading = None
+
+    def _load(self, stats_bus, user_bus):
+        stats = [(record["_id"], record["_source"]) for record in stats_bus.data_source.scan(
+            doc_type=stats_bus.dao._get_table_name(),
+            query=dict(_source=list(_FeatureColumns._stats_fields)))]
+        categories = [(record["_id"], record["_source"].get("car_category")) for record in user_bus.data_source.scan(
+            doc_type=user_bus.dao._get_table_name(),
+            query=dict(query=dict(filtered=dict(filter=dict(term=dict(role="driver")))),
+                       _source=["car_category"]))]
+
+        # built aside and swapped, so scoring never sees a partial load
+        features = _FeatureColumns(self.defaults, max(1024, len(stats) + len(categories) + 1))
+        for driver_id, values in stats:
+            features.set_stats(driver_id, values)
+        for driver_id, category in categories:
+            features.set_category(driver_id, category)
+        with self._lock:
+            # the scans may have missed writes made meanwhile
+            for apply, args in self._loading:
+                apply(features, *args)
+            self._features = features
+        return len(features.rows)
+
+    def _write(self, apply, *args):
+        with self._lock:
+            apply(self._features, *args)
+            if self._loading is not None:
+                self._loading.append((apply, args))
+
+    def on_stats_write(self, to_obj):
+        self._write(_FeatureColumns.set_stats, to_obj.driver_id, dict(to_obj._values))
+
+    def on_user_write(self, to_obj):
+        values = to_obj._values
+        user_id = values.get("user_id")
+        if user_id is None or "car_category" not in values:
+            return
+        self._write(DriverFeatureStore._set_user_category, user_id, values.get("role"), values["car_category"])
+
+    @staticmethod
+    def _set_user_category(features, user_id, role, category):
+        if role == "driver" or (role is None and user_id in features.rows):
+            features.set_category(user_id, category)
+
+    # Returns (bonuses, eligible) for drivers (list of driver ids). Bonuses are the score points given
+    # by the driver features, eligible is None or flags of drivers with the given car category
+    def get_scores(self, driver_ids, category=None):
+        with self._lock:
+            rating, acceptance_rate, cancellations, eligible = self._features.gather(driver_ids, category)
+
+        if numpy is not None:
+            bonuses = (self.rating_weight / self.max_rating) * rating + self.acceptance_weight * acceptance_rate \
+                - self.cancellation_penalty * cancellations
+            return bonuses, eligible
+
+        bonuses = [self.rating_weight * rating[i] / self.max_rating + self.acceptance_weight * acceptance_rate[i] -
+                   self.cancellation_penalty * cancellations[i] for i in xrange(len(rating))]
+        return bonuses, eligible
+
+    def stats(self):
+        features = self._features
+        return dict(drivers=len(features.rows), categories=len(features.categories) - 1)
@@ -1,61 +1,179 @@
 __author__ = 'luiz'
 
 from taxi_api.helpers.helpers import Helpers
+from taxi_api.helpers import geo
+from taxi_api.helpers.driver_density import DriverDensity
+from taxi_api.helpers.finder_cache import FinderResultCache
+from taxi_api.helpers.driver_features import DriverFeatureStore
+from taxi_api.helpers.eta_engine import EtaEngine
 from taxi_api.business.driver import DriverBus
-import math
-from random import randint
+from taxi_api.business.user import UserBus
+
+
+def score_arrays(lats, lons, available, preferred, bonuses, etas, requester_lat, requester_lon,
+                 distance_scale, preferred_bonus, max_distance=None, eta_scale=None):
+    # up to 100 for a driver at the requester location decreasing with distance (half at distance_scale km)
+    # or with etas when given (seconds, half at eta_scale), plus a bonus for preferred drivers and the
+    # driver feature bonuses (see DriverFeatureStore). 0 for unavailable drivers or drivers farther
+    # than max_distance
+    distances = geo.haversine_many(lats, lons, requester_lat, requester_lon)
+
+    numpy = geo.numpy
+    if numpy is not None:
+        if etas is not None:
+            scores = 100.0 / (1.0 + numpy.asarray(etas) / eta_scale)
+        else:
+            scores = 100.0 / (1.0 + distances / distance_scale)
+        if preferred is not None:
+            scores += preferred_bonus * numpy.asarray(preferred, dtype=bool)
+        if bonuses is not None:
+            scores += bonuses
+        scores *= numpy.asarray(available, dtype=bool)
+        if max_distance is not None:
+            scores[distances > max_distance] = 0
+        return scores
+
+    scores = []
+    for i, distance in enumerate(distances):
+        if not available[i] or (max_distance is not None and distance > max_distance):
+            scores.append(0)
+            continue
+        if etas is not None:
+            score = 100.0 / (1.0 + etas[i] / eta_scale)
+        else:
+            score = 100.0 / (1.0 + distance / distance_scale)
+        if preferred is not None and preferred[i]:
+            score += preferred_bonus
+        if bonuses is not None:
+            score += bonuses[i]
+        scores.append(score)
+    return scores
 
 
 class DriverFinder(object):
 
-    _lat_inc = 3
     _score_cutoff = 10
+    _default_distance_scale = 5.0
+    _default_preferred_bonus = 20
+    _default_max_distance = 50
+    _default_candidates_per_driver = 5
+    _default_max_candidates = 10000
+    _default_eta_scale = 600
+
+    # shared by every finder
+    _density = None
 
     def __init__(self):
         self.cfg = Helpers.load_config()
         self.ds_name = self.cfg["api"]["database"]
         self.environ = self.cfg["env"]
         self.driver_bus = DriverBus(self.ds_name, self.environ)
+        self.user_bus = UserBus(self.ds_name, self.environ)
         self.score_cutoff = 10  # ignore drivers with score lower than cutoff
+        finder_cfg = self.cfg.get("driver_finder") or {}
+        self.max_distance = finder_cfg.get("max_distance_km", DriverFinder._default_max_distance)
+        # nearest drivers fetched (per desired driver) to be ranked by score
+        self.candidates_per_driver = finder_cfg.get("candidates_per_driver", DriverFinder._default_candidates_per_driver)
+        self.max_candidates = finder_cfg.get("max_candidates", DriverFinder._default_max_candidates)
+        if DriverFinder._density is None:
+            density_cfg = finder_cfg.get("density") or {}
+            DriverFinder._density = DriverDensity(
+                precision=density_cfg.get("geohash_precision", 5),
+                alpha=density_cfg.get("alpha", 0.2),
+                initial_density=density_cfg.get("initial_density", 1.0),
+                min_radius=density_cfg.get("min_radius_km", 0.5))
+        self.density = DriverFinder._density
+        self.result_cache = FinderResultCache.get()
+        self.features = DriverFeatureStore.get()
+        # road network travel times instead of straight line distances, when a graph is configured
+        self.eta = EtaEngine.get()
+        self.eta_scale = (finder_cfg.get("eta") or {}).get("eta_scale_s", DriverFinder._default_eta_scale)
+        # distance (km) where the distance score drops to half
+        self.distance_scale = finder_cfg.get("distance_scale_km", DriverFinder._default_distance_scale)
+        self.preferred_bonus = finder_cfg.get("preferred_driver_bonus", DriverFinder._default_preferred_bonus)
 
-    def run(self, requester_location, desired_drivers, max_depth=5, requester_preferences=None):
+    def run(self, requester_location, desired_drivers, max_distance=None, requester_preferences=None):
         requester_location = Helpers.validate_geo_point(requester_location)
-        result = []
-        last_bounding_box = (None, None)
-        exp_factor = 1
-        while len(result) < desired_drivers and exp_factor <= max_depth:
-            # TODO check if calculation of bounding_box is correct
-            left = requester_location["lat"] + (pow(DriverFinder._lat_inc, exp_factor) / 69.0)
-            top = 3960 * 2 * math.pi / 360 * math.cos(left)
-            top_left = Helpers.validate_geo_point((left, top))
-
-            right = requester_location["lat"] - (pow(DriverFinder._lat_inc, exp_factor) / 69.0)
-            bottom = 3960 * 2 * math.pi / 360 * math.cos(right)
-            bottom_right = Helpers.validate_geo_point((right, bottom))
-
-            drivers_in_area = self.driver_bus.list_in_rectangle(
-                top_left, bottom_right, True,
-                last_bounding_box[0], last_bounding_box[1]  # area to exclude
-            )
-
-            # TODO parallel processing of calculate drivers scores
-            for driver in drivers_in_area:
-                score = self.calculate_driver_score(driver, requester_location, requester_preferences)
-                if score > DriverFinder._score_cutoff:
-                    result.append((driver, score))
-
-            last_bounding_box = (top_left, bottom_right)
-            print last_bounding_box
-            exp_factor += 1
-
-        def get_score(item):
-            return item[1]
-        # return drivers ordered by score
-        return [driver[0] for driver in sorted(result, key=get_score, reverse=True)]
+        drivers = self._get_candidates(requester_location, desired_drivers, max_distance or self.max_distance)
+        if not drivers:
+            return []
+
+        scores = self.calculate_driver_scores(drivers, requester_location, requester_preferences)
+        selected = geo.indexes_above(scores, DriverFinder._score_cutoff)
+        scores = geo.take(scores, selected)
+        # return best drivers ordered by score
+        return [drivers[selected[i]] for i in geo.top_k(scores, desired_drivers)]
+
+    # Candidates of requesters close to each other are shared for a few seconds (see FinderResultCache),
+    # each requester ranks them for its own location
+    def _get_candidates(self, requester_location, desired_drivers, max_distance):
+        cache = self.result_cache
+        if cache is None or max_distance != self.max_distance:
+            return self._find_nearest(requester_location, desired_drivers, max_distance)
+
+        cached = cache.get_candidates(requester_location, desired_drivers)
+        if cached is not None:
+            return [self.driver_bus.to_class.deserialize(driver) for driver in cached]
+
+        # enough candidates for any desired_drivers of the bucket
+        drivers = self._find_nearest(requester_location, cache.bucket(desired_drivers), max_distance)
+        cache.set_candidates(requester_location, desired_drivers, [driver.serialize() for driver in drivers])
+        return drivers
+
+    # Nearest drivers to be ranked by score. Starts with the radius expected to have enough candidates
+    # given the learned density of the requester cell, usually a single query, doubling it while
+    # less than desired_drivers are found.
+    def _find_nearest(self, requester_location, desired_drivers, max_distance):
+        size = min(desired_drivers * self.candidates_per_driver, self.max_candidates)
+        cell = self.density.get_cell(requester_location)
+        radius = self.density.radius_for(cell, size, max_distance)
+        while True:
+            nearest = self.driver_bus.list_nearest(requester_location, size, radius)
+            self.density.observe(cell, len(nearest), size, radius, nearest[-1][1] if nearest else None)
+            if len(nearest) >= desired_drivers or radius >= max_distance:
+                return [driver for driver, _ in nearest]
+            radius = min(radius * 2, max_distance)
 
     def calculate_driver_score(self, driver, requester_location, requester_preferences):
-        # TODO implement real score calculation
-        return randint(0, 99)
+        return self.calculate_driver_scores([driver], requester_location, requester_preferences)[0]
+
+    # Scores all drivers at once (numpy arrays when available), see score_arrays.
+    # requester_preferences may have "max_distance_km", "preferred_drivers" (list of driver ids)
+    # and "car_category" (only drivers of that category).
+    def calculate_driver_scores(self, drivers, requester_location, requester_preferences=None):
+        lats, lons, available, preferred, bonuses, etas, score_args = self._get_score_arrays(
+            drivers, requester_location, requester_preferences)
+        return score_arrays(lats, lons, available, preferred, bonuses, etas, *score_args)
+
+    def _get_score_arrays(self, drivers, requester_location, requester_preferences):
+        preferences = requester_preferences or {}
+        preferred_ids = set(preferences.get("preferred_drivers") or ())
+        lats, lons = geo.to_arrays(driver.location for driver in drivers)
+        available = geo.to_flags(getattr(driver, "available", True) for driver in drivers)
+        preferred = geo.to_flags(driver.driver_id in preferred_ids for driver in drivers) if preferred_ids else None
+        bonuses = None
+        eligible = None
+        if self.features is not None:
+            bonuses, eligible = self.features.get_scores([driver.driver_id for driver in drivers],
+                                                         preferences.get("car_category"))
+        elif preferences.get("car_category"):
+            eligible = self._get_category_flags(drivers, preferences["car_category"])
+        if eligible is not None:
+            if geo.numpy is not None:
+                available = available & eligible
+            else:
+                available = [is_available and is_eligible for is_available, is_eligible in zip(available, eligible)]
+        etas = self.eta.etas(requester_location, lats, lons) if self.eta is not None else None
+        score_args = (requester_location["lat"], requester_location["lon"], self.distance_scale,
+                      self.preferred_bonus, preferences.get("max_distance_km"), self.eta_scale)
+        return lats, lons, available, preferred, bonuses, etas, score_args
+
+    # Flags of drivers of category read from their user records (one mget), used without the feature store
+    def _get_category_flags(self, drivers, category):
+        users = self.user_bus.get_by_pks([driver.driver_id for driver in drivers], "role", "car_category") or {}
+        return geo.to_flags(
+            user is not None and getattr(user, "role", None) == "driver" and getattr(user, "car_category", None) == category
+            for user in (users.get(driver.driver_id) for driver in drivers))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,129 @@
+__author__ = 'luiz'
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from taxi_api.helpers.helpers import Helpers
+from taxi_api.helpers.async_executor import AsyncExecutor
+
+
+class DriverNotifier(object):
+    """
+        Fan-out of new requests to nearby drivers. Drivers are found off the request path and each
+        request is added to the pending set of every driver found. Every window_ms the pending sets are
+        sent as a single "notify_drivers" message per driver, skipping requests closed meanwhile
+        (assigned, canceled or finished), keeping at most max_requests_per_message requests (most
+        recent first) and sending at most one message per driver every min_interval_ms.
+        So messages grow with the number of drivers near open requests, not with requests x drivers.
+        Note: only requests closed in this process are known to be closed, others are dropped after
+        request_ttl seconds.
+    """
+
+    __instance = None
+
+    def __init__(self):
+        assert DriverNotifier.__instance is None, "Please use DriverNotifier.get() to get a singleton instead"
+        cfg = Helpers.load_config().get("driver_notifier") or {}
+        self.window = cfg.get("window_ms", 500) / 1000.0
+        self.desired_drivers = cfg.get("desired_drivers", 10)
+        self.max_requests_per_message = cfg.get("max_requests_per_message", 5)
+        self.min_interval = cfg.get("min_interval_ms", 2000) / 1000.0
+        self.request_ttl = cfg.get("request_ttl", 300)
+        self._lock = threading.Lock()
+        self._open = {}
+        self._pending = {}
+        self._last_sent = {}
+        self._finder = None
+        self._thread = None
+        self.notified = 0
+        self.messages = 0
+        self.dropped_closed = 0
+
+    @staticmethod
+    def get():
+        if DriverNotifier.__instance is None:
+            DriverNotifier.__instance = DriverNotifier()
+        return DriverNotifier.__instance
+
+    def _get_finder(self):
+        if self._finder is None:
+            from taxi_api.helpers.driver_finder import DriverFinder
+            self._finder = DriverFinder()
+        return self._finder
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="driver_notifier")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def notify_request(self, request):
+        if self._thread is None:
+            self._start()
+        payload = request.serialize()
+        with self._lock:
+            self._open[request.request_id] = (time.time() + self.request_ttl, payload)
+        AsyncExecutor.get().submit(self._find_drivers, request.request_id, payload["requester_location"])
+
+    def close_request(self, request_id):
+        with self._lock:
+            self._open.pop(request_id, None)
+
+    def _find_drivers(self, request_id, requester_location):
+        try:
+            drivers = self._get_finder().run(requester_location, self.desired_drivers)
+        except Exception as e:
+            logging.warning("Could not find drivers for request %s: %s" % (request_id, e))
+            return
+        with self._lock:
+            if request_id not in self._open:
+                return
+            for driver in drivers:
+                # most recent requests last
+                pending = self._pending.setdefault(driver.driver_id, OrderedDict())
+                pending.pop(request_id, None)
+                pending[request_id] = True
+                self.notified += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.warning("Driver notification failed: %s" % e)
+
+    def flush(self):
+        now = time.time()
+        messages = []
+        with self._lock:
+            for request_id in [request_id for request_id, (expires, _) in self._open.iteritems() if expires < now]:
+                del self._open[request_id]
+
+            for driver_id in self._pending.keys():
+                if now - self._last_sent.get(driver_id, 0) < self.min_interval:
+                    continue
+                pending = self._pending.pop(driver_id)
+                open_requests = [self._open[request_id][1] for request_id in reversed(pending)
+                                 if request_id in self._open]
+                self.dropped_closed += len(pending) - len(open_requests)
+                if not open_requests:
+                    continue
+                self._last_sent[driver_id] = now
+                messages.append(dict(driver_id=driver_id, requests=open_requests[:self.max_requests_per_message]))
+
+            # forget drivers not notified for a while
+            for driver_id in [driver_id for driver_id, sent in self._last_sent.iteritems()
+                              if now - sent >= self.min_interval and driver_id not in self._pending]:
+                del self._last_sent[driver_id]
+
+        for message in messages:
+            Helpers.dispatch("notify_drivers", message)
+        self.messages += len(messages)
+        return len(messages)
+
+    def stats(self):
+        return dict(open_requests=len(self._open), pending_drivers=len(self._pending),
+                    notified=self.notified, messages=self.messages, dropped_closed=self.dropped_closed)
@@ -0,0 +1,351 @@
+__author__ = 'luiz'
+
+import csv
+import heapq
+import json
+import logging
+import math
+import os
+import sys
+import threading
+from taxi_api.dao.cache import LRUCache
+from taxi_api.helpers.helpers import Helpers
+from taxi_api.helpers import geo
+
+numpy = geo.numpy
+
+INF = float("inf")
+
+_GRAPH_FORMAT = 1
+# arrays of a graph directory, each one saved as <name>.npy and memory-mapped on load
+_GRAPH_ARRAYS = ("node_lat", "node_lon", "up_offsets", "up_targets", "up_weights",
+                 "down_offsets", "down_targets", "down_weights", "grid_keys", "grid_offsets", "grid_nodes")
+
+
+def _cell_keys(lats, lons, cell_size):
+    # grid cell of each point, cells are cell_size x cell_size degrees
+    ncols = int(math.ceil(360.0 / cell_size)) + 1
+    rows = numpy.floor((numpy.asarray(lats, dtype=numpy.float64) + 90.0) / cell_size).astype(numpy.int64)
+    cols = numpy.floor((numpy.asarray(lons, dtype=numpy.float64) + 180.0) / cell_size).astype(numpy.int64)
+    return rows, cols, ncols
+
+
+class EtaEngine(object):
+    """
+        Travel times (seconds) over a road graph preprocessed with contraction hierarchies (CH), see
+        build_graph. The graph is a directory of .npy arrays memory-mapped on load:
+          - up_*: CSR of edges (shortcuts included) from each node to nodes of higher rank
+          - down_*: CSR of reversed edges, from each node to the higher rank nodes reaching it
+          - grid_*: nodes of each grid cell, used to snap points to the nearest node
+        Travel time from s to t is the min of up(s, x) + down(t, x) over the nodes x reached by both
+        upward searches. Upward search spaces don't depend on anything but the node, so they are cached
+        (LRU) and a query for many drivers is one vectorized join of their cached spaces with the
+        requester's one.
+        Points are snapped to the nearest node of their grid cell (and neighbors), the snap distance is
+        added at access_speed_kmh. Points that can't be snapped or routed use the straight line distance
+        at fallback_speed_kmh.
+        Requires numpy. Enabled in config, i.e: "driver_finder": {"eta": {"graph_path": "/data/city_graph"}}
+    """
+
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self, path, access_speed_kmh=15.0, fallback_speed_kmh=25.0, search_cache_size=100000):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != _GRAPH_FORMAT:
+            raise ValueError("Unsupported graph format %s in %s" % (self.meta.get("format"), path))
+        for name in _GRAPH_ARRAYS:
+            setattr(self, name, numpy.load(os.path.join(path, name + ".npy"), mmap_mode="r"))
+        self.cell_size = self.meta["cell_size"]
+        self.access_speed = access_speed_kmh / 3600.0
+        self.fallback_speed = fallback_speed_kmh / 3600.0
+        # search spaces only change with the graph, never expire and are read only
+        self._up_spaces = LRUCache(search_cache_size, INF, copy_values=False)
+        self._down_spaces = LRUCache(search_cache_size, INF, copy_values=False)
+
+    @staticmethod
+    def get():
+        # returns None when disabled (no graph_path) or unavailable
+        with EtaEngine.__instance_lock:
+            if EtaEngine.__instance is None:
+                cfg = (Helpers.load_config().get("driver_finder") or {}).get("eta") or {}
+                EtaEngine.__instance = False
+                if cfg.get("graph_path"):
+                    if numpy is None:
+                        logging.warning("ETA engine disabled, numpy is required")
+                    else:
+                        try:
+                            EtaEngine.__instance = EtaEngine(
+                                cfg["graph_path"], cfg.get("access_speed_kmh", 15.0),
+                                cfg.get("fallback_speed_kmh", 25.0), cfg.get("search_cache_size", 100000))
+                        except (IOError, ValueError) as e:
+                            logging.warning("ETA engine disabled, could not load graph: %s" % e)
+            return EtaEngine.__instance or None
+
+    # Nearest node of each point (-1 when there is no node in its 3x3 cells) and its distance in km
+    def snap(self, lats, lons):
+        lats = numpy.asarray(lats, dtype=numpy.float64)
+        lons = numpy.asarray(lons, dtype=numpy.float64)
+        rows, cols, ncols = _cell_keys(lats, lons, self.cell_size)
+        offsets = numpy.array([(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1)], dtype=numpy.int64)
+        keys = ((rows[:, None] + offsets[:, 0]) * ncols + cols[:, None] + offsets[:, 1]).ravel()
+
+        # nodes of the 9 cells of each point, as one flat array
+        indexes = numpy.searchsorted(self.grid_keys, keys)
+        clipped = numpy.minimum(indexes, len(self.grid_keys) - 1)
+        found = self.grid_keys[clipped] == keys
+        starts = numpy.asarray(self.grid_offsets[clipped])
+        counts = numpy.where(found, numpy.asarray(self.grid_offsets[clipped + 1]) - starts, 0)
+        total = int(counts.sum())
+        nodes = numpy.full(len(lats), -1, dtype=numpy.int64)
+        distances = numpy.full(len(lats), INF)
+        if not total:
+            return nodes, distances
+        owners = numpy.repeat(numpy.arange(len(keys)) // 9, counts)
+        positions = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts) + \
+            numpy.repeat(starts, counts)
+        candidates = numpy.asarray(self.grid_nodes[positions], dtype=numpy.int64)
+
+        # equirectangular distance is enough to pick the nearest among close nodes
+        point_lats = numpy.radians(lats[owners])
+        dlat = numpy.radians(numpy.asarray(self.node_lat[candidates])) - point_lats
+        dlon = (numpy.radians(numpy.asarray(self.node_lon[candidates])) - numpy.radians(lons[owners])) * \
+            numpy.cos(point_lats)
+        candidate_distances = geo.EARTH_RADIUS_KM * numpy.sqrt(dlat * dlat + dlon * dlon)
+        order = numpy.lexsort((candidate_distances, owners))
+        snapped, first = numpy.unique(owners[order], return_index=True)
+        nodes[snapped] = candidates[order[first]]
+        distances[snapped] = candidate_distances[order[first]]
+        return nodes, distances
+
+    def _upward_search(self, node, offsets, targets, weights):
+        # every node reachable through edges to higher rank nodes, sorted by node
+        dist = {node: 0.0}
+        settled = {}
+        heap = [(0.0, node)]
+        while heap:
+            d, v = heapq.heappop(heap)
+            if v in settled:
+                continue
+            settled[v] = d
+            start, end = int(offsets[v]), int(offsets[v + 1])
+            for x, w in zip(targets[start:end].tolist(), weights[start:end].tolist()):
+                nd = d + w
+                if nd < dist.get(x, INF):
+                    dist[x] = nd
+                    heapq.heappush(heap, (nd, x))
+        nodes = numpy.fromiter(settled.iterkeys(), numpy.int64, len(settled))
+        dists = numpy.fromiter(settled.itervalues(), numpy.float64, len(settled))
+        order = numpy.argsort(nodes)
+        return nodes[order], dists[order]
+
+    def _get_space(self, cache, node, offsets, targets, weights):
+        space = cache.get(node)
+        if space is None:
+            space = self._upward_search(node, offsets, targets, weights)
+            cache.set(node, space)
+        return space
+
+    def travel_times(self, sources, target):
+        # CH travel times (seconds) from every source node to target node, INF when unreachable
+        sources = numpy.asarray(sources, dtype=numpy.int64)
+        unique_sources, inverse = numpy.unique(sources, return_inverse=True)
+        target_nodes, target_dists = self._get_space(
+            self._down_spaces, int(target), self.down_offsets, self.down_targets, self.down_weights)
+
+        spaces = [self._get_space(self._up_spaces, int(source), self.up_offsets, self.up_targets, self.up_weights)
+                  for source in unique_sources.tolist()]
+        nodes = numpy.concatenate([space[0] for space in spaces])
+        dists = numpy.concatenate([space[1] for space in spaces])
+        owners = numpy.repeat(numpy.arange(len(spaces)), [len(space[0]) for space in spaces])
+
+        indexes = numpy.minimum(numpy.searchsorted(target_nodes, nodes), len(target_nodes) - 1)
+        met = target_nodes[indexes] == nodes
+        best = numpy.full(len(spaces), INF)
+        numpy.minimum.at(best, owners[met], dists[met] + target_dists[indexes[met]])
+        return best[inverse]
+
+    # Seconds to drive from each (lats[i], lons[i]) to location
+    def etas(self, location, lats, lons):
+        lats = numpy.asarray(lats, dtype=numpy.float64)
+        lons = numpy.asarray(lons, dtype=numpy.float64)
+        etas = geo.haversine_many(lats, lons, location["lat"], location["lon"]) / self.fallback_speed
+        if not len(lats):
+            return etas
+
+        target_nodes, target_distances = self.snap([location["lat"]], [location["lon"]])
+        if target_nodes[0] < 0:
+            return etas
+        nodes, distances = self.snap(lats, lons)
+        routed = numpy.flatnonzero(nodes >= 0)
+        if len(routed):
+            times = self.travel_times(nodes[routed], target_nodes[0])
+            times += (distances[routed] + target_distances[0]) / self.access_speed
+            etas[routed] = numpy.where(numpy.isfinite(times), times, etas[routed])
+        return etas
+
+    def stats(self):
+        return dict(nodes=self.meta["nodes"], edges=self.meta["edges"], shortcuts=self.meta["shortcuts"],
+                    up_spaces=self._up_spaces.stats(), down_spaces=self._down_spaces.stats())
+
+
+def _witness_search(out_edges, source, skip, max_cost, targets, settle_limit):
+    # shortest distances from source not passing through skip, limited to max_cost and settle_limit nodes
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    remaining = set(targets)
+    settled = 0
+    while heap and remaining and settled < settle_limit:
+        d, v = heapq.heappop(heap)
+        if d > dist[v]:
+            continue
+        if d > max_cost:
+            break
+        settled += 1
+        remaining.discard(v)
+        for x, w in out_edges[v].iteritems():
+            nd = d + w
+            if x != skip and nd < dist.get(x, INF):
+                dist[x] = nd
+                heapq.heappush(heap, (nd, x))
+    return dist
+
+
+def _shortcuts(out_edges, in_edges, v, settle_limit):
+    # shortcuts needed to contract v: (u, x, cost) for each u -> v -> x with no shorter witness path
+    shortcuts = []
+    for u, wu in in_edges[v].iteritems():
+        costs = dict((x, wu + wx) for x, wx in out_edges[v].iteritems() if x != u)
+        if not costs:
+            continue
+        dist = _witness_search(out_edges, u, v, max(costs.itervalues()), costs, settle_limit)
+        shortcuts.extend((u, x, cost) for x, cost in costs.iteritems() if dist.get(x, INF) > cost)
+    return shortcuts
+
+
+# Contracts every node of the graph (n nodes, edges as (source, target, seconds)).
+# Returns (rank, edges) where edges are the original ones plus shortcuts, shortest per pair.
+def contract_graph(n, edges, settle_limit=500):
+    out_edges = [{} for _ in xrange(n)]
+    in_edges = [{} for _ in xrange(n)]
+    for u, v, w in edges:
+        if u != v and w < out_edges[u].get(v, INF):
+            out_edges[u][v] = w
+            in_edges[v][u] = w
+    all_edges = dict(((u, v), w) for u in xrange(n) for v, w in out_edges[u].iteritems())
+
+    deleted_neighbors = [0] * n
+
+    def priority(v):
+        # edge difference plus deleted neighbors, keeps contraction spread over the graph
+        return len(_shortcuts(out_edges, in_edges, v, settle_limit)) - len(in_edges[v]) - len(out_edges[v]) + \
+            deleted_neighbors[v]
+
+    heap = [(priority(v), v) for v in xrange(n)]
+    heapq.heapify(heap)
+    rank = [-1] * n
+    order = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        if rank[v] >= 0:
+            continue
+        # lazy update, contract v only if it is still the best
+        current = priority(v)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, v))
+            continue
+
+        for u, x, cost in _shortcuts(out_edges, in_edges, v, settle_limit):
+            if cost < out_edges[u].get(x, INF):
+                out_edges[u][x] = cost
+                in_edges[x][u] = cost
+                if cost < all_edges.get((u, x), INF):
+                    all_edges[(u, x)] = cost
+
+        rank[v] = order
+        order += 1
+        neighbors = set(in_edges[v]) | set(out_edges[v])
+        for u in in_edges[v]:
+            del out_edges[u][v]
+        for x in out_edges[v]:
+            del in_edges[x][v]
+        in_edges[v], out_edges[v] = {}, {}
+        for u in neighbors:
+            deleted_neighbors[u] += 1
+
+    return rank, [(u, v, w) for (u, v), w in all_edges.iteritems()]
+
+
+def _to_csr(n, sources, targets, weights):
+    order = numpy.lexsort((targets, sources))
+    offsets = numpy.zeros(n + 1, dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum(numpy.bincount(sources, minlength=n))
+    return offsets, targets[order].astype(numpy.int32), weights[order].astype(numpy.float32)
+
+
+# Builds a graph directory for EtaEngine from node_lats/node_lons and edges as (source, target, seconds)
+def build_graph(path, node_lats, node_lons, edges, cell_size=0.01, settle_limit=500):
+    n = len(node_lats)
+    rank, ch_edges = contract_graph(n, edges, settle_limit)
+    rank = numpy.asarray(rank, dtype=numpy.int64)
+    sources = numpy.array([edge[0] for edge in ch_edges], dtype=numpy.int64)
+    targets = numpy.array([edge[1] for edge in ch_edges], dtype=numpy.int64)
+    weights = numpy.array([edge[2] for edge in ch_edges], dtype=numpy.float64)
+    up = rank[sources] < rank[targets]
+
+    arrays = dict(node_lat=numpy.asarray(node_lats, dtype=numpy.float64),
+                  node_lon=numpy.asarray(node_lons, dtype=numpy.float64))
+    arrays["up_offsets"], arrays["up_targets"], arrays["up_weights"] = \
+        _to_csr(n, sources[up], targets[up], weights[up])
+    # reversed edges going down, stored at their target
+    arrays["down_offsets"], arrays["down_targets"], arrays["down_weights"] = \
+        _to_csr(n, targets[~up], sources[~up], weights[~up])
+
+    rows, cols, ncols = _cell_keys(arrays["node_lat"], arrays["node_lon"], cell_size)
+    keys = rows * ncols + cols
+    order = numpy.argsort(keys, kind="mergesort")
+    grid_keys, starts = numpy.unique(keys[order], return_index=True)
+    arrays["grid_keys"] = grid_keys
+    arrays["grid_offsets"] = numpy.append(starts, n).astype(numpy.int64)
+    arrays["grid_nodes"] = order.astype(numpy.int32)
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for name in _GRAPH_ARRAYS:
+        numpy.save(os.path.join(path, name + ".npy"), arrays[name])
+    meta = dict(format=_GRAPH_FORMAT, nodes=n, edges=len(edges), shortcuts=len(ch_edges) - len(edges),
+                cell_size=cell_size)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def load_csv(nodes_file, edges_file):
+    # nodes csv columns: id,lat,lon
+    # edges csv columns: source,target,seconds[,oneway], roads are two way unless oneway is 1
+    ids, lats, lons = {}, [], []
+    with open(nodes_file) as f:
+        for row in csv.DictReader(f):
+            ids[row["id"]] = len(lats)
+            lats.append(float(row["lat"]))
+            lons.append(float(row["lon"]))
+    edges = []
+    with open(edges_file) as f:
+        for row in csv.DictReader(f):
+            source, target, seconds = ids[row["source"]], ids[row["target"]], float(row["seconds"])
+            edges.append((source, target, seconds))
+            if row.get("oneway", "0") not in ("1", "true", "yes"):
+                edges.append((target, source, seconds))
+    return lats, lons, edges
+
+
+if __name__ == '__main__':
+    # i.e: python -m taxi_api.helpers.eta_engine nodes.csv edges.csv /data/city_graph [cell_size]
+    if len(sys.argv) < 4:
+        print "usage: eta_engine.py nodes.csv edges.csv output_dir [cell_size]"
+        sys.exit(1)
+    node_lats, node_lons, graph_edges = load_csv(sys.argv[1], sys.argv[2])
+    print "Contracting %i nodes and %i edges" % (len(node_lats), len(graph_edges))
+    print build_graph(sys.argv[3], node_lats, node_lons, graph_edges,
+                      float(sys.argv[4]) if len(sys.argv) > 4 else 0.01)
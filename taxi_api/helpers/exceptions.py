@@ -7,3 +7,17 @@ class UserHasActiveRequest(Exception):
 
 class OutDatedRecordException(Exception):
     pass
+
+
+class RecordAlreadyExistsException(Exception):
+    pass
+
+
+class BulkWriteException(Exception):
+
+    def __init__(self, errors, written=None):
+        super(BulkWriteException, self).__init__(
+            "Failed to write %i record(s): %s" % (len(errors), "; ".join("%s: %s" % e for e in errors)))
+        self.errors = errors
+        # records of the same call that were written
+        self.written = written or []
@@ -0,0 +1,111 @@
+__author__ = 'luiz'
+
+import threading
+from taxi_api.dao.cache import LRUCache
+from taxi_api.helpers import geo
+from taxi_api.helpers.helpers import Helpers
+
+
+class FinderResultCache(LRUCache):
+    """
+        Short lived cache of DriverFinder candidates (serialized drivers, before ranking) keyed by the
+        requester geohash cell and desired_drivers bucket (next power of 2), so requesters close to each
+        other share the nearest driver query and only re-rank the candidates for their exact location.
+        Entries are dropped when one of their drivers becomes unavailable or when an available driver
+        not listed yet is written in their cell. Writes made while candidates were being searched
+        (or made by other processes) are only seen after ttl, so keep it short.
+        Enabled in config, i.e: "driver_finder": {"result_cache": {"geohash_precision": 7, "ttl": 5}}
+    """
+
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self, precision, max_size, ttl):
+        super(FinderResultCache, self).__init__(max_size, ttl)
+        self.precision = precision
+        self._by_cell = {}
+        self._by_driver = {}
+        self.invalidations = 0
+
+    @staticmethod
+    def get():
+        # returns None when cache is disabled
+        with FinderResultCache.__instance_lock:
+            if FinderResultCache.__instance is None:
+                cfg = (Helpers.load_config().get("driver_finder") or {}).get("result_cache")
+                if cfg and cfg.get("enabled", True):
+                    FinderResultCache.__instance = FinderResultCache(
+                        cfg.get("geohash_precision", 7), cfg.get("max_size", LRUCache._default_max_size),
+                        cfg.get("ttl", 5))
+                else:
+                    FinderResultCache.__instance = False
+            return FinderResultCache.__instance or None
+
+    @staticmethod
+    def bucket(desired_drivers):
+        bucket = 1
+        while bucket < desired_drivers:
+            bucket <<= 1
+        return bucket
+
+    def get_cell(self, location):
+        return geo.geohash(location["lat"], location["lon"], self.precision)
+
+    def get_candidates(self, location, desired_drivers):
+        value = self._get((self.get_cell(location), self.bucket(desired_drivers)))
+        if value is not None:
+            return value[1]
+
+    def set_candidates(self, location, desired_drivers, drivers):
+        key = (self.get_cell(location), self.bucket(desired_drivers))
+        value = (frozenset(driver["driver_id"] for driver in drivers), list(drivers))
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        # must be called holding self._lock
+        self._remove(key)
+        super(FinderResultCache, self)._set(key, value)
+        self._by_cell.setdefault(key[0], set()).add(key)
+        for driver_id in value[0]:
+            self._by_driver.setdefault(driver_id, set()).add(key)
+
+    def _remove(self, key):
+        # must be called holding self._lock
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._dropped(key, item[1])
+
+    def _dropped(self, key, value):
+        # remove key from reverse indexes
+        for index, index_key in [(self._by_cell, key[0])] + [(self._by_driver, driver_id) for driver_id in value[0]]:
+            keys = index.get(index_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[index_key]
+
+    # location and available are None when unknown (i.e. partial writes)
+    def on_driver_write(self, driver_id, location=None, available=None):
+        with self._lock:
+            stale = set()
+            if available is not None and not available:
+                stale.update(self._by_driver.get(driver_id, ()))
+            elif location is not None:
+                # an available driver was written in the cell, only location changed for listed ones
+                stale.update(key for key in self._by_cell.get(self.get_cell(location), ())
+                             if driver_id not in self._items[key][1][0])
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._by_cell.clear()
+            self._by_driver.clear()
+
+    def stats(self):
+        stats = super(FinderResultCache, self).stats()
+        stats["invalidations"] = self.invalidations
+        return stats
@@ -0,0 +1,97 @@
+__author__ = 'luiz'
+
+import heapq
+import math
+
+try:
+    import numpy
+except ImportError:
+    # optional, pure python fallbacks below are used without it
+    numpy = None
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    # great circle distance in km
+    lat1, lon1, lat2, lon2 = math.radians(lat1), math.radians(lon1), math.radians(lat2), math.radians(lon2)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def to_arrays(points):
+    # points are (lat, lon) tuples, returns (lats, lons) as numpy arrays (or lists without numpy)
+    points = list(points)
+    if numpy is not None:
+        coords = numpy.array(points, dtype=numpy.float64).reshape(len(points), 2)
+        return coords[:, 0], coords[:, 1]
+    return [point[0] for point in points], [point[1] for point in points]
+
+
+def haversine_many(lats, lons, lat, lon):
+    # distances in km from (lat, lon) to every point
+    if numpy is not None:
+        lats, lons = numpy.radians(lats), numpy.radians(lons)
+        lat, lon = math.radians(lat), math.radians(lon)
+        a = numpy.sin((lats - lat) / 2) ** 2 + math.cos(lat) * numpy.cos(lats) * numpy.sin((lons - lon) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(a))
+    return [haversine(point_lat, point_lon, lat, lon) for point_lat, point_lon in zip(lats, lons)]
+
+
+def top_k(scores, k):
+    # indexes of the k highest scores, highest first, without sorting all of them
+    if k <= 0:
+        return []
+    if numpy is not None:
+        scores = numpy.asarray(scores)
+        if k < len(scores):
+            indexes = numpy.argpartition(-scores, k - 1)[:k]
+        else:
+            indexes = numpy.arange(len(scores))
+        return indexes[numpy.argsort(-scores[indexes], kind="mergesort")].tolist()
+    return heapq.nlargest(k, xrange(len(scores)), key=scores.__getitem__)
+
+
+def to_flags(values):
+    # iterable of booleans as a numpy bool array (or list without numpy)
+    if numpy is not None:
+        return numpy.fromiter(values, bool)
+    return [bool(value) for value in values]
+
+
+def indexes_above(values, threshold):
+    if numpy is not None:
+        return numpy.flatnonzero(numpy.asarray(values) > threshold).tolist()
+    return [i for i, value in enumerate(values) if value > threshold]
+
+
+def take(values, indexes):
+    # values at indexes as a list
+    if numpy is not None:
+        return numpy.asarray(values)[indexes].tolist()
+    return [values[i] for i in indexes]
+
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat, lon, precision=5):
+    # precision 5 cells are about 4.9 x 4.9 km, 6 about 1.2 x 0.6 km
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    result = []
+    bit, char, even = 0, 0, True
+    while len(result) < precision:
+        value, value_range = (lon, lon_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            char = (char << 1) | 1
+            value_range[0] = mid
+        else:
+            char <<= 1
+            value_range[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            result.append(_GEOHASH_BASE32[char])
+            bit, char = 0, 0
+    return "".join(result)
@@ -63,8 +63,9 @@ class Helpers(object):
 
     @staticmethod
     def dispatch(service, message):
-        # TODO implement real dispatch. For now it just print emulating a dispatch to another service
-        print "Will dispatch message %s to service %s" % (message, service)
+        # message is queued and sent by background workers, returns False if it was dropped (queue full)
+        from taxi_api.helpers.dispatcher import Dispatcher
+        return Dispatcher.get().dispatch(service, message)
 
     @staticmethod
     def file_name_to_class_name(file_name):
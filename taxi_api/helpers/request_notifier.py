@@ -0,0 +1,117 @@
+__author__ = 'luiz'
+
+import threading
+import time
+from collections import deque
+
+
+class RequestNotifier(object):
+    """
+        In-process channel used to wake up drivers waiting for changes on
+        their requests. Each driver has a monotonic sequence number and a
+        short backlog of the last published request payloads, so waiting
+        clients never touch the database while nothing happens.
+        Drivers without waiters and without events for idle_timeout seconds are forgotten, their
+        next sequences continue from the highest sequence ever published so clients still holding
+        an old one reload (clients holding 0, the sequence of unknown drivers, get the new events).
+    """
+
+    __instance = None
+
+    _max_events = 50
+    # at least the longest watch timeout
+    _idle_timeout = 60
+
+    def __init__(self):
+        assert RequestNotifier.__instance is None, "Please use RequestNotifier.get() to get a singleton instead"
+        self._lock = threading.Lock()
+        self._conditions = {}
+        self._sequences = {}
+        self._events = {}
+        self._waiters = {}
+        self._last_event = {}
+        self._first_sequences = {}
+        self._last_sequence = 0
+        self._last_prune = time.time()
+
+    @staticmethod
+    def get():
+        if RequestNotifier.__instance is None:
+            RequestNotifier.__instance = RequestNotifier()
+        return RequestNotifier.__instance
+
+    def _get_condition(self, driver_id):
+        # must be called holding self._lock
+        condition = self._conditions.get(driver_id)
+        if condition is None:
+            condition = threading.Condition(self._lock)
+            self._conditions[driver_id] = condition
+        return condition
+
+    def sequence(self, driver_id):
+        with self._lock:
+            return self._sequences.get(driver_id, 0)
+
+    def _prune(self, now):
+        # must be called holding self._lock
+        if now - self._last_prune < RequestNotifier._idle_timeout:
+            return
+        self._last_prune = now
+        for driver_id in [driver_id for driver_id, last in self._last_event.iteritems()
+                          if now - last > RequestNotifier._idle_timeout and not self._waiters.get(driver_id)]:
+            del self._last_event[driver_id]
+            self._conditions.pop(driver_id, None)
+            self._sequences.pop(driver_id, None)
+            self._events.pop(driver_id, None)
+            self._first_sequences.pop(driver_id, None)
+
+    def publish(self, driver_id, payload):
+        with self._lock:
+            now = time.time()
+            self._prune(now)
+            seq = self._sequences.get(driver_id)
+            if seq is None:
+                seq = self._first_sequences[driver_id] = self._last_sequence + 1
+            else:
+                seq += 1
+            self._last_sequence = max(self._last_sequence, seq)
+            self._sequences[driver_id] = seq
+            self._last_event[driver_id] = now
+            events = self._events.get(driver_id)
+            if events is None:
+                events = self._events[driver_id] = deque(maxlen=RequestNotifier._max_events)
+            events.append((seq, payload))
+            self._get_condition(driver_id).notify_all()
+        return seq
+
+    def wait(self, driver_id, since, timeout):
+        """
+            Blocks until driver_id has events newer than since or timeout expires.
+            Returns a tuple (sequence, events), where events is None when the
+            backlog no longer covers since (caller must reload full state).
+        """
+        with self._lock:
+            seq = self._sequences.get(driver_id, 0)
+            if seq == since:
+                self._waiters[driver_id] = self._waiters.get(driver_id, 0) + 1
+                try:
+                    self._get_condition(driver_id).wait(timeout)
+                finally:
+                    self._waiters[driver_id] -= 1
+                    if not self._waiters[driver_id]:
+                        del self._waiters[driver_id]
+                        if driver_id not in self._last_event:
+                            # nothing published, condition was only created for this wait
+                            self._conditions.pop(driver_id, None)
+                seq = self._sequences.get(driver_id, 0)
+
+            if seq == since:
+                return seq, []
+
+            events = self._events.get(driver_id) or ()
+            if since > seq or not events:
+                return seq, None
+            first = self._first_sequences[driver_id] - 1 if since == 0 else since
+            if events[0][0] > first + 1:
+                return seq, None
+            return seq, [payload for event_seq, payload in events if event_seq > since]
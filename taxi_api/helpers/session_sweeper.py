@@ -0,0 +1,61 @@
+__author__ = 'luiz'
+
+import logging
+import threading
+import time
+from taxi_api.helpers.helpers import Helpers
+
+
+class SessionSweeper(object):
+    """
+        Background thread deleting expired sessions every sweep_interval seconds,
+        in bulk calls of sweep_batch_size sessions.
+    """
+
+    __instance = None
+
+    def __init__(self):
+        assert SessionSweeper.__instance is None, "Please use SessionSweeper.get() to get a singleton instead"
+        cfg = Helpers.load_config()
+        session_cfg = cfg.get("session") or {}
+        self.interval = session_cfg.get("sweep_interval", 300)
+        self.batch_size = session_cfg.get("sweep_batch_size", 500)
+        self._ds_name = cfg["api"]["database"]
+        self._environ = cfg["env"]
+        self._session_bus = None
+        self._thread = None
+
+    @staticmethod
+    def get():
+        if SessionSweeper.__instance is None:
+            SessionSweeper.__instance = SessionSweeper()
+        return SessionSweeper.__instance
+
+    def _get_session_bus(self):
+        if self._session_bus is None:
+            from taxi_api.business.user_session import UserSessionBus
+            self._session_bus = UserSessionBus(self._ds_name, self._environ)
+        return self._session_bus
+
+    def start(self):
+        if self._thread is None and self.interval:
+            self._thread = threading.Thread(target=self._run, name="session_sweeper")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.warning("Session sweep failed: %s" % e)
+
+    def sweep(self):
+        total = 0
+        while True:
+            found, deleted = self._get_session_bus().delete_expired(self.batch_size)
+            total += deleted
+            # deleted sessions are still found until the index is refreshed, leave them for the next sweep
+            if found < self.batch_size or deleted < found:
+                return total
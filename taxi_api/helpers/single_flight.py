@@ -0,0 +1,75 @@
+__author__ = 'luiz'
+
+import copy
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+        Coalesces concurrent identical calls: the first caller of a key runs it and
+        every caller arriving while it is in flight waits and gets a copy of the same result
+        (or the same exception, a RuntimeError when the leader was interrupted, i.e. GreenletExit).
+        Nothing is kept once the call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # results are raw records, each caller builds its own TOs from them
+            return copy.deepcopy(call.result)
+
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except BaseException as e:
+            # followers were not interrupted themselves, they just can't get a result
+            call.error = e if isinstance(e, Exception) else RuntimeError(
+                "Coalesced call interrupted by %s" % e.__class__.__name__)
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                waiters = call.waiters
+            if waiters and call.error is None:
+                # leader's caller is free to mutate result, followers get their own snapshot
+                call.result = copy.deepcopy(result)
+            call.done.set()
+
+    # calls started before a write may return stale data, callers arriving after it must not join them
+    def forget(self, predicate):
+        with self._lock:
+            for key in [key for key in self._calls if predicate(key)]:
+                del self._calls[key]
+
+    def stats(self):
+        return dict(in_flight=len(self._calls), calls=self.calls, shared=self.shared)
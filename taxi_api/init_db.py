@@ -4,9 +4,12 @@ __author__ = 'luiz'
 from taxi_api.helpers.helpers import Helpers
 from taxi_api.ds_provider.ds_provider import DSProvider
 import os
+import argparse
 
 
-def run_main():
+# rebuild_lookups recreates the lookup documents of indexed fields from the records, it scans whole
+# tables so it only runs when asked (i.e. after adding an indexed field or loading records)
+def run_main(rebuild_lookups=False):
     cfg = Helpers.load_config()
     db_cfg = Helpers.load_ds_config()
 
@@ -24,7 +27,7 @@ def run_main():
     if not isinstance(cur_dir, unicode):
         cur_dir = cur_dir.decode("utf-8")
     _dao_path = cur_dir + "/dao/" + cfg["api"]["database"]
-    _ignore_in_load = ["__init__.py", "base.py", "init_db.py"]
+    _ignore_in_load = ["__init__.py", "base.py", "lookup.py", "init_db.py"]
     for file_in_dir in os.listdir(_dao_path):
         if file_in_dir.endswith(".py") and not file_in_dir in _ignore_in_load:
             module_name = file_in_dir[:-3]
@@ -34,7 +37,18 @@ def run_main():
                 "dao.%s.%s.%s" % (cfg["api"]["database"], module_name, dao_class_name))
             dao_obj = clazz(ds_provider, datasource)
             dao_obj.create_table(**db_cfg)
+            if rebuild_lookups and dao_obj.lookup_index:
+                print "Rebuilding lookups for %s" % dao_class_name
+                dao_obj.lookup_index.rebuild()
     print "Database created !"
 
 if __name__ == '__main__':
-    run_main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-e", "--env", type=str, default="test",
+                        help="Environment to run (prod|test). Default: test")
+    parser.add_argument("--rebuild-lookups", action="store_true",
+                        help="Rebuild the lookup documents of indexed fields")
+    args = parser.parse_args()
+
+    os.environ["api_env"] = args.env
+    run_main(rebuild_lookups=args.rebuild_lookups)
@@ -2,10 +2,13 @@ __author__ = 'luiz'
 
 from driver import Driver
 from driver_in_area import DriverInArea
+from driver_status_batch import DriverStatusBatch
+from drivers import Drivers
 from user_create import UserCreate
 from user_login import UserLogin
 from user_logout import UserLogout
 from request_driver import RequestDriver
 from request_history import RequestHistory
 from request_assignment import RequestAssignment
+from request_assignment_watch import RequestAssignmentWatch
 from find_drivers import FindDrivers
\ No newline at end of file
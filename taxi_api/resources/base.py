@@ -1,12 +1,34 @@
 __author__ = 'luiz'
 
-from flask_restful import Resource
+from flask_restful import Resource, request, wraps
 from taxi_api.helpers.helpers import Helpers
 from taxi_api.helpers.api_auth import ApiAuth
+from taxi_api.business.base import BaseBus
+
+
+def unit_of_work(func):
+    # every request runs in its own unit of work (including authentication)
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        uow = BaseBus.unit_of_work()
+        with uow:
+            result = func(*args, **kwargs)
+            if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int) and result[1] >= 400:
+                # handler failed and returned its error, writes it queued are not applied
+                uow.discard()
+                return result
+            try:
+                uow.flush()
+            except Exception as e:
+                return {"message": e.message or str(e)}, 500
+        return result
+    return wrapper
 
 
 class BaseResource(Resource):
 
+    method_decorators = [unit_of_work]
+
     _cfg = Helpers.load_config()
     _ds_name = _cfg["api"]["database"]
     _environ = _cfg["env"]
@@ -19,6 +41,18 @@ class BaseResource(Resource):
     def register(api):
         pass
 
+    @staticmethod
+    def get_fields(to_class):
+        # sparse fieldsets, i.e: ?fields=driver_id,location
+        fields = request.args.get("fields")
+        if not fields:
+            return ()
+        fields = tuple(field.strip() for field in fields.split(",") if field.strip())
+        invalid = [field for field in fields if field not in to_class._fields]
+        if invalid:
+            raise ValueError("Unknown fields: %s" % Helpers.concat(invalid, ","))
+        return fields
+
     def return_exception(self, e, code):
         return self.return_message(e.message or e.args[1], code)
 
@@ -4,6 +4,7 @@ import json
 from flask_restful_swagger import swagger
 from base import BaseResource
 from taxi_api.business.driver import DriverBus
+from taxi_api.to.driver import DriverTO
 from flask_restful import reqparse, request
 
 parser = reqparse.RequestParser()
@@ -24,6 +25,14 @@ class Driver(BaseResource):
                 "allowMultiple": False,
                 "dataType": "string",
                 "paramType": "header"
+            },
+            {
+                "name": "fields",
+                "description": 'Comma separated list of fields to return, i.e: driver_id,location. Default: all',
+                "required": False,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "query"
             }
         ],
         responseMessages=[
@@ -40,11 +49,12 @@ class Driver(BaseResource):
     @BaseResource._user_auth.login_required
     def get(self, driver_id):
         try:
-            driver_to = Driver._driver_bus.get_by_pk(driver_id)
+            fields = self.get_fields(DriverTO)
+            driver_to = Driver._driver_bus.get_by_pk(driver_id, *fields)
             if driver_to:
-                return driver_to.serialize()
+                return driver_to.serialize(*fields)
             else:
-                return self.return_message("Driver %i not found" % driver_id, 201)
+                return self.return_message("Driver %s not found" % driver_id, 201)
         except Exception as e:
             return self.return_exception(e, 500)
 
@@ -4,6 +4,7 @@ import json
 from flask_restful_swagger import swagger
 from base import BaseResource
 from taxi_api.business.driver import DriverBus
+from taxi_api.to.driver import DriverTO
 from flask_restful import reqparse
 
 parser = reqparse.RequestParser()
@@ -34,6 +35,14 @@ class DriverInArea(BaseResource):
                 "dataType": "string",
                 "paramType": "query"
             },
+            {
+                "name": "fields",
+                "description": 'Comma separated list of fields to return. i.e: driver_id,location. Default: all',
+                "required": False,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "query"
+            },
             {
                 "name": "api_token",
                 "description": "API access token",
@@ -56,7 +65,9 @@ class DriverInArea(BaseResource):
             args = parser.parse_args()
             nw = json.loads(args["nw"])
             se = json.loads(args["se"])
-            return [driver.serialize() for driver in DriverInArea._driver_bus.list_in_rectangle(nw, se)]
+            fields = self.get_fields(DriverTO)
+            return [driver.serialize(*fields)
+                    for driver in DriverInArea._driver_bus.list_in_rectangle(nw, se, fields=fields)]
         except Exception as e:
             return self.return_exception(e, 500)
 
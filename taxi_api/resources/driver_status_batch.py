@@ -0,0 +1,86 @@
+__author__ = 'luiz'
+
+import json
+from flask_restful_swagger import swagger
+from base import BaseResource
+from taxi_api.business.driver import DriverBus
+from flask_restful import reqparse, request
+from taxi_api.helpers.api_auth import ApiAuth
+
+parser = reqparse.RequestParser()
+parser.add_argument('statuses', required=True, type=str, help='JSON string representation of a list of driver status')
+
+
+class DriverStatusBatch(BaseResource):
+    _driver_bus = DriverBus(BaseResource._ds_name, BaseResource._environ)
+    _max_batch_size = 1000
+
+    @swagger.operation(
+        nickname='set_drivers_status',
+        notes='Save the status of many drivers at once (used by fleet gateways). '
+              'Returns the result of each item in the same order they were sent.',
+        parameters=[
+            {
+                "name": "gateway_access_key",
+                "description": 'Gateway access key (see "gateways" config)',
+                "required": True,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "header"
+            },
+            {
+                "name": "statuses",
+                "description": 'JSON string representation of a list of driver status. i.e: '
+                               '[{"driver_id":"abc","available":true,"location":{"lat":20,"lon":30}}]',
+                "required": True,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "query"
+            }
+        ],
+        responseMessages=[
+            {
+                "code": 401,
+                "message": "Unknown gateway access key"
+            },
+            {
+                "code": 500,
+                "message": "Exception during execution"
+            }
+        ]
+    )
+    @BaseResource._user_auth.gateway_key_required
+    def post(self):
+        try:
+            args = parser.parse_args()
+            statuses = json.loads(args.statuses)
+            if not isinstance(statuses, list):
+                raise Exception("statuses must be a list")
+            if len(statuses) > DriverStatusBatch._max_batch_size:
+                raise Exception("statuses must have at most %i items" % DriverStatusBatch._max_batch_size)
+
+            # current_gateway attr was injected in gateway_key_required method
+            gateway = request.current_gateway
+            allowed = [status for status in statuses
+                       if isinstance(status, dict) and ApiAuth.gateway_allows(gateway, status.get("driver_id"))]
+            # update_if_exists ensures each item is a driver
+            results = iter(DriverStatusBatch._driver_bus.bulk_update_if_exists(allowed) if allowed else [])
+
+            result = []
+            for status in statuses:
+                if not isinstance(status, dict) or not ApiAuth.gateway_allows(gateway, status.get("driver_id")):
+                    result.append({"driver_id": status.get("driver_id") if isinstance(status, dict) else None,
+                                   "status": "error", "message": "Not allowed to update this driver"})
+                    continue
+                driver_id, error = next(results)
+                if error is None:
+                    result.append({"driver_id": driver_id, "status": "ok"})
+                else:
+                    result.append({"driver_id": driver_id, "status": "error", "message": error})
+            return result
+        except Exception as e:
+            return self.return_exception(e, 500)
+
+    @staticmethod
+    def register(api):
+        api.add_resource(DriverStatusBatch, '/drivers/status', endpoint="drivers_status")
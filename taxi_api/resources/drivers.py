@@ -0,0 +1,80 @@
+__author__ = 'luiz'
+
+from flask_restful_swagger import swagger
+from base import BaseResource
+from taxi_api.business.driver import DriverBus
+from taxi_api.to.driver import DriverTO
+from flask_restful import reqparse
+
+parser = reqparse.RequestParser()
+parser.add_argument('ids', required=True, type=str, help='Comma separated list of driver ids')
+
+
+class Drivers(BaseResource):
+    _driver_bus = DriverBus(BaseResource._ds_name, BaseResource._environ)
+    _max_ids = 500
+
+    @swagger.operation(
+        nickname='get_drivers_status',
+        notes='Retrieve the status of many drivers in a single call',
+        parameters=[
+            {
+                "name": "ids",
+                "description": 'Comma separated list of driver ids',
+                "required": True,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "query"
+            },
+            {
+                "name": "fields",
+                "description": 'Comma separated list of fields to return, i.e: driver_id,location. Default: all',
+                "required": False,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "query"
+            },
+            {
+                "name": "api_token",
+                "description": "API access token",
+                "required": True,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "header"
+            }
+        ],
+        responseMessages=[
+            {
+                "code": 500,
+                "message": "Exception during execution"
+            }
+        ]
+    )
+    @BaseResource._user_auth.login_required
+    def get(self):
+        try:
+            args = parser.parse_args()
+            ids = []
+            for driver_id in args.ids.split(","):
+                driver_id = driver_id.strip()
+                if driver_id and driver_id not in ids:
+                    ids.append(driver_id)
+            if len(ids) > Drivers._max_ids:
+                raise Exception("ids must have at most %i items" % Drivers._max_ids)
+
+            fields = self.get_fields(DriverTO)
+            if fields and "driver_id" not in fields:
+                fields += ("driver_id",)
+
+            drivers = Drivers._driver_bus.get_by_pks(ids, *fields) if ids else {}
+            drivers = drivers or {}
+            return {
+                "drivers": [drivers[driver_id].serialize(*fields) for driver_id in ids if drivers.get(driver_id)],
+                "not_found": [driver_id for driver_id in ids if not drivers.get(driver_id)]
+            }
+        except Exception as e:
+            return self.return_exception(e, 500)
+
+    @staticmethod
+    def register(api):
+        api.add_resource(Drivers, '/drivers', endpoint="drivers_by_ids")
@@ -10,6 +10,7 @@ from taxi_api.helpers.driver_finder import DriverFinder
 parser = reqparse.RequestParser()
 parser.add_argument('location', required=True, type=str, help='JSON string representing geo point location of requester (must have "lat" and "lon" keys)')
 parser.add_argument('desired_drivers', required=True, type=int, help='Number of desired drivers to retrieve')
+parser.add_argument('car_category', required=False, type=str, help='Only drivers of this car category')
 
 
 class FindDrivers(BaseResource):
@@ -35,6 +36,14 @@ class FindDrivers(BaseResource):
                 "dataType": "integer",
                 "paramType": "query"
             },
+            {
+                "name": "car_category",
+                "description": 'Only drivers of this car category. Default: any',
+                "required": False,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "query"
+            },
             {
                 "name": "api_token",
                 "description": "API access token",
@@ -55,10 +64,12 @@ class FindDrivers(BaseResource):
     def get(self):
         try:
             args = parser.parse_args()
+            preferences = dict(car_category=args.car_category) if args.car_category else None
             return [
                 driver.serialize()
                 for driver in
-                FindDrivers._finder.run(json.loads(args.location), args.desired_drivers)
+                FindDrivers._finder.run(json.loads(args.location), args.desired_drivers,
+                                        requester_preferences=preferences)
             ]
         except Exception as e:
             return self.return_exception(e, 500)
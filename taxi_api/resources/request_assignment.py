@@ -3,6 +3,7 @@ __author__ = 'luiz'
 from flask_restful_swagger import swagger
 from base import BaseResource
 from taxi_api.business.request_driver import RequestDriverBus
+from taxi_api.to.request_driver import RequestDriverTO
 from flask_restful import reqparse, request
 from taxi_api.helpers.exceptions import OutDatedRecordException
 
@@ -17,6 +18,14 @@ class RequestAssignment(BaseResource):
         nickname='get_driver_active_request',
         notes="Get current driver's active request",
         parameters=[
+            {
+                "name": "fields",
+                "description": 'Comma separated list of fields to return. Default: all',
+                "required": False,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "query"
+            },
             {
                 "name": "api_token",
                 "description": "API access token",
@@ -40,12 +49,13 @@ class RequestAssignment(BaseResource):
     @BaseResource._driver_auth.login_required
     def get(self):
         try:
+            fields = self.get_fields(RequestDriverTO)
             active_requests = list(
                 RequestAssignment._request_driver_bus.list_active_per_driver(
-                    request.current_user.user_id))
+                    request.current_user.user_id, *fields))
             if active_requests:
                 return [
-                    r.serialize()
+                    r.serialize(*fields)
                     for r in
                     active_requests
                 ]
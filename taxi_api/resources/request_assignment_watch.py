@@ -0,0 +1,83 @@
+__author__ = 'luiz'
+
+from flask_restful_swagger import swagger
+from base import BaseResource
+from taxi_api.business.request_driver import RequestDriverBus
+from taxi_api.helpers.request_notifier import RequestNotifier
+from flask_restful import reqparse, request
+
+parser = reqparse.RequestParser()
+parser.add_argument('since', required=False, type=int, help='Last sequence number received by the driver')
+parser.add_argument('timeout', required=False, type=int, default=30, help='Max seconds to hold the connection open')
+
+
+class RequestAssignmentWatch(BaseResource):
+    _request_driver_bus = RequestDriverBus(BaseResource._ds_name, BaseResource._environ)
+    _max_timeout = 60
+
+    @swagger.operation(
+        nickname='watch_driver_requests',
+        notes="Long poll for changes on current driver's requests. "
+              "Returns immediately when called without 'since' or when there are changes newer than 'since', "
+              "otherwise holds the connection until a change is published or timeout expires.",
+        parameters=[
+            {
+                "name": "since",
+                "description": "Last sequence number received by the driver",
+                "required": False,
+                "allowMultiple": False,
+                "dataType": "integer",
+                "paramType": "query"
+            },
+            {
+                "name": "timeout",
+                "description": "Max seconds to hold the connection open (default 30, max 60)",
+                "required": False,
+                "allowMultiple": False,
+                "dataType": "integer",
+                "paramType": "query"
+            },
+            {
+                "name": "api_token",
+                "description": "API access token",
+                "required": True,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "header"
+            }
+        ],
+        responseMessages=[
+            {
+                "code": 500,
+                "message": "Exception during execution"
+            }
+        ]
+    )
+    @BaseResource._driver_auth.login_required
+    def get(self):
+        try:
+            args = parser.parse_args()
+            driver_id = request.current_user.user_id
+            notifier = RequestNotifier.get()
+
+            if args.since is None:
+                seq, events = notifier.sequence(driver_id), None
+            else:
+                timeout = max(0, min(args.timeout, RequestAssignmentWatch._max_timeout))
+                seq, events = notifier.wait(driver_id, args.since, timeout)
+
+            if events is None:
+                # first call or backlog lost, load current state from database
+                events = [
+                    r.serialize()
+                    for r in
+                    RequestAssignmentWatch._request_driver_bus.list_active_per_driver(driver_id)
+                ]
+            return {"sequence": seq, "requests": events}
+        except Exception as e:
+            return self.return_exception(e, 500)
+
+    @staticmethod
+    def register(api):
+        api.add_resource(RequestAssignmentWatch, '/driver/request_assignment/watch',
+                         endpoint="driver_request_assignment_watch")
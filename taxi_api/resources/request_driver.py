@@ -19,6 +19,14 @@ class RequestDriver(BaseResource):
         nickname='get_user_active_request',
         notes="Get current user's active request",
         parameters=[
+            {
+                "name": "fields",
+                "description": 'Comma separated list of fields to return. Default: all',
+                "required": False,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "query"
+            },
             {
                 "name": "api_token",
                 "description": "API access token",
@@ -42,12 +50,13 @@ class RequestDriver(BaseResource):
     @BaseResource._user_auth.login_required
     def get(self):
         try:
+            fields = self.get_fields(RequestDriverTO)
             active_requests = list(
                 RequestDriver._request_driver_bus.list_active_per_user(
-                    request.current_user.user_id))
+                    request.current_user.user_id, *fields))
             if active_requests:
                 return [
-                    r.serialize()
+                    r.serialize(*fields)
                     for r in
                     active_requests
                 ]
@@ -3,6 +3,7 @@ __author__ = 'luiz'
 from flask_restful_swagger import swagger
 from base import BaseResource
 from taxi_api.business.request_driver import RequestDriverBus
+from taxi_api.to.request_driver import RequestDriverTO
 from flask_restful import request
 
 
@@ -13,6 +14,14 @@ class RequestHistory(BaseResource):
         nickname='list_user_driver_requests',
         notes='List all driver requests of the user',
         parameters=[
+            {
+                "name": "fields",
+                "description": 'Comma separated list of fields to return. Default: all',
+                "required": False,
+                "allowMultiple": False,
+                "dataType": "string",
+                "paramType": "query"
+            },
             {
                 "name": "api_token",
                 "description": "API access token",
@@ -32,11 +41,12 @@ class RequestHistory(BaseResource):
     @BaseResource._user_auth.login_required
     def get(self):
         try:
+            fields = self.get_fields(RequestDriverTO)
             return [
-                r.serialize()
+                r.serialize(*fields)
                 for r in
                 RequestHistory._request_driver_bus.search_by_field_value(
-                    "requester_id", request.current_user.user_id)
+                    "requester_id", request.current_user.user_id, *fields)
             ]
         except Exception as e:
             return self.return_exception(e, 500)
@@ -19,8 +19,15 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-e", "--env", type=str, default="test",
                         help="Environment to run (prod|test). Default: test")
+    parser.add_argument("-s", "--server", type=str, default="flask", choices=["flask", "gevent"],
+                        help="HTTP server to run (flask|gevent). Default: flask")
     args = parser.parse_args()
+
     os.environ["api_env"] = args.env
+    if args.server == "gevent":
+        # patch before elasticsearch/urllib3 get loaded so every blocking call yields to other requests
+        from gevent import monkey
+        monkey.patch_all()
 
     if not os.environ.get("db_loaded", None):
         run_init_db()
@@ -40,13 +47,27 @@ if __name__ == '__main__':
                        description='99taxis API Project')
 
     import resources  # import resources after configure environment
+
+    from taxi_api.helpers.session_sweeper import SessionSweeper
+    SessionSweeper.get().start()
+
+    from taxi_api.helpers.driver_features import DriverFeatureStore
+    if DriverFeatureStore.get():
+        DriverFeatureStore.get().start()
+
     _resources = [
-        resources.Driver, resources.DriverInArea, resources.UserCreate,
-        resources.UserLogin, resources.UserLogout, resources.RequestDriver,
-        resources.RequestHistory, resources.RequestAssignment, resources.FindDrivers]
+        resources.Driver, resources.Drivers, resources.DriverInArea, resources.DriverStatusBatch,
+        resources.UserCreate, resources.UserLogin, resources.UserLogout, resources.RequestDriver,
+        resources.RequestHistory, resources.RequestAssignment, resources.RequestAssignmentWatch,
+        resources.FindDrivers]
 
     for _res in _resources:
         _res.register(api)
 
-    app.run(debug=cfg["env"] != "prod", host=api_cfg["host"], port=api_cfg["port"])
+    if args.server == "gevent":
+        from gevent.pywsgi import WSGIServer
+        WSGIServer((api_cfg["host"], api_cfg["port"]), app).serve_forever()
+    else:
+        # threaded so long polling requests don't block the server
+        app.run(debug=cfg["env"] != "prod", host=api_cfg["host"], port=api_cfg["port"], threaded=True)
 
@@ -0,0 +1,12 @@
+__author__ = 'luiz'
+
+from base import TO
+import fields
+from datetime import datetime
+
+
+class ActiveRequestSlotTO(TO):
+    # at most one slot per requester, holding the requester's active request
+    requester_id = fields.StringField(pk=1)
+    request_id = fields.StringField()
+    created_in = fields.DateTimeField(default=datetime.now)
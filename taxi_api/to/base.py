@@ -2,7 +2,7 @@
 from binascii import hexlify
 from uuid import uuid4
 
-from fields import Field, StringField
+from fields import Field, StringField, GeoPointField
 from taxi_api.helpers.helpers import Helpers
 from itertools import chain
 
@@ -22,9 +22,11 @@ class FieldProperty(object):
 
     def __set__(self, instance, value):
         instance._values[self.name] = value
+        instance._changed(self.name)
 
     def __delete__(self, instance):
         del instance._values[self.name]
+        instance._changed(self.name)
 
 
 class TOMeta(type):
@@ -88,6 +90,7 @@ class TOMeta(type):
         attrs["_pks"] = pks
         attrs["_indexes"] = indexes
         attrs["_defaults"] = defaults
+        attrs["_geo_fields"] = [key for key, field in fields.iteritems() if isinstance(field, GeoPointField)]
 
         return super(TOMeta, mcs).__new__(mcs, name, bases, attrs)
 
@@ -103,13 +106,38 @@ class TO(object):
 
     def __init__(self, **kwargs):
         self._values = self._defaults.copy()
+        # _stored is True when values are known to match the database (loaded or written)
+        # _dirty has the fields changed since then
+        # Note: changes made inside mutable values (dicts, lists) are not tracked
+        self._stored = False
+        self._dirty = set()
+        self._serialized = None
+        # serialized values of indexed fields as they are in the database (when known), see dao lookups
+        self._stored_values = {}
         self.populate(**kwargs)
 
+    def _changed(self, name):
+        self._dirty.add(name)
+        self._serialized = None
+
+    @property
+    def dirty_fields(self):
+        return frozenset(self._dirty)
+
+    # fields is the dirty_fields snapshot taken when the write was built (default: all)
+    def mark_stored(self, fields=None):
+        self._stored = True
+        if fields is None:
+            self._dirty.clear()
+        else:
+            self._dirty.difference_update(fields)
+
     def populate(self, **kwargs):
         values = self._values
         for key, value in kwargs.iteritems():
             if key in self._fields:
                 values[key] = self._fields[key].deserialize(value)
+                self._changed(key)
 
     @classmethod
     def deserialize(cls, data):
@@ -119,7 +147,10 @@ class TO(object):
         for key, value in data.iteritems():
             if key in fields:
                 values[key] = fields[key].deserialize(value)
+                if key in instance._indexes:
+                    instance._stored_values[key] = value
 
+        instance.mark_stored()
         return instance
 
     @classmethod
@@ -144,9 +175,23 @@ class TO(object):
                 data[name] = s_value
         return data
 
-    def serialize(self):
-        self._before_serialize()
-        return self._serialize()
+    # fields restricts the output to the given field names (sparse TOs loaded with only some fields)
+    def serialize(self, *fields):
+        if fields:
+            self._before_serialize()
+            return self._serialize(fields_to_ignore=set(self._fields).difference(fields))
+        # unchanged objects reuse the last full serialization
+        if self._serialized is None:
+            self._before_serialize()
+            serialized = self._serialize()
+            self._serialized = serialized
+        # copied, callers may change it. Only geo points are new objects per serialization (other
+        # mutable values are the TO values themselves), so they're the only nested values copied
+        serialized = dict(self._serialized)
+        for name in self._geo_fields:
+            if serialized.get(name) is not None:
+                serialized[name] = dict(serialized[name])
+        return serialized
 
     @property
     def pk(self):
@@ -0,0 +1,13 @@
+__author__ = 'luiz'
+
+from base import TO
+import fields
+
+
+class DriverStatsTO(TO):
+    # written by the services computing them (not through the public driver status),
+    # see DriverFeatureStore
+    driver_id = fields.StringField(pk=1)
+    rating = fields.FloatField(null=True, store_null=False)
+    acceptance_rate = fields.FloatField(null=True, store_null=False)
+    recent_cancellations = fields.IntegerField(null=True, store_null=False)
@@ -13,6 +13,7 @@ class UserTO(TO):
     name = fields.StringField()
     role = fields.StringField(options=["driver", "passenger"])
     car_plate = fields.StringField(null=True)
+    car_category = fields.StringField(null=True, store_null=False)
 
     def _before_serialize(self):
         self.user_id = md5(self.email).hexdigest()
@@ -7,4 +7,5 @@ import fields
 class UserSessionTO(TO):
 
     user_id = fields.StringField(pk=1)
-    api_token = fields.StringField()
+    api_token = fields.StringField(index=True)
+    expires_in = fields.DateTimeField(null=True, store_null=False)
@@ -0,0 +1,227 @@
+__author__ = 'luiz'
+
+# In-memory stand-in for the Elasticsearch client used by the dao tests. Supports the calls and
+# query clauses the daos make (no geo queries) with versions and realtime GETs; with nrt=True
+# searches only see what was written before the last indices.refresh, like Elasticsearch.
+
+import copy
+from elasticsearch.exceptions import ConflictError, NotFoundError
+
+
+def _conflict(doc_type, rec_id):
+    return ConflictError(409, "version_conflict_engine_exception", "[%s][%s]: version conflict" % (doc_type, rec_id))
+
+
+def _missing(doc_type, rec_id):
+    return NotFoundError(404, "document_missing_exception", "[%s][%s]: document missing" % (doc_type, rec_id))
+
+
+def _select(source, fields):
+    if not fields:
+        return copy.deepcopy(source)
+    if not isinstance(fields, list):
+        fields = fields.split(",")
+    return dict((name, copy.deepcopy(source[name])) for name in fields if name in source)
+
+
+def _matches(clause, rec_id, source):
+    if not clause:
+        return True
+    name, args = clause.items()[0]
+    if name == "match_all":
+        return True
+    if name == "filtered":
+        return _matches(args.get("query"), rec_id, source) and _matches(args.get("filter"), rec_id, source)
+    if name == "bool":
+        must = args.get("must") or []
+        should = args.get("should") or []
+        must_not = args.get("must_not") or []
+        must, should, must_not = [[c] if isinstance(c, dict) else c for c in (must, should, must_not)]
+        return all(_matches(c, rec_id, source) for c in must) and \
+            (not should or any(_matches(c, rec_id, source) for c in should)) and \
+            not any(_matches(c, rec_id, source) for c in must_not)
+    if name == "term":
+        field, value = args.items()[0]
+        return source.get(field) == value
+    if name == "ids":
+        return rec_id in args["values"]
+    if name == "missing":
+        return source.get(args["field"]) is None
+    if name == "range":
+        field, bounds = args.items()[0]
+        value = source.get(field)
+        if value is None:
+            return False
+        checks = dict(lt=lambda b: value < b, lte=lambda b: value <= b, gt=lambda b: value > b,
+                      gte=lambda b: value >= b, to=lambda b: value <= b)
+        checks["from"] = lambda b: value >= b
+        return all(checks[op](bound) for op, bound in bounds.iteritems() if bound is not None)
+    raise NotImplementedError("Query clause %s" % name)
+
+
+class FakeIndices(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def refresh(self, index=None):
+        self.connection.calls.append("refresh")
+        self.connection.searchable = copy.deepcopy(self.connection.docs)
+
+    def exists(self, index):
+        return True
+
+    def create(self, index):
+        pass
+
+    def put_mapping(self, **kwargs):
+        pass
+
+
+class FakeConnection(object):
+
+    def __init__(self, nrt=False):
+        # (doc_type, id) -> (version, source)
+        self.docs = {}
+        self.searchable = {}
+        self.nrt = nrt
+        # name of every call made, to count round trips
+        self.calls = []
+        # called with the name of the method before running it and after reading (get, mget and search),
+        # i.e. to make concurrent writes
+        self.before = None
+        self.after = None
+        self.indices = FakeIndices(self)
+
+    def _call(self, name):
+        self.calls.append(name)
+        if self.before:
+            self.before(name)
+
+    def _read(self, name, result):
+        if self.after:
+            self.after(name)
+        return result
+
+    # writes made by "someone else" (no call is recorded)
+    def put(self, doc_type, rec_id, source):
+        version = self.docs.get((doc_type, rec_id), (0, None))[0] + 1
+        self.docs[(doc_type, rec_id)] = (version, copy.deepcopy(source))
+        return version
+
+    def _write(self, op, doc_type, rec_id, body, version=None):
+        # returns the http status of a single write, raising on conflicts and missing records
+        current = self.docs.get((doc_type, rec_id))
+        if version is not None and (current is None or current[0] != int(version)):
+            # updates and deletes of missing records fail as missing, not as conflicts
+            missing = current is None and op in ("update", "delete")
+            raise _missing(doc_type, rec_id) if missing else _conflict(doc_type, rec_id)
+        if op == "create":
+            if current is not None:
+                raise _conflict(doc_type, rec_id)
+            self.put(doc_type, rec_id, body)
+            return 201
+        if op == "index":
+            self.put(doc_type, rec_id, body)
+            return 200 if current else 201
+        if op == "update":
+            if current is None:
+                if "upsert" not in body:
+                    raise _missing(doc_type, rec_id)
+                self.put(doc_type, rec_id, body["upsert"])
+                return 201
+            source = copy.deepcopy(current[1])
+            source.update(body.get("doc") or {})
+            self.put(doc_type, rec_id, source)
+            return 200
+        if op == "delete":
+            if current is None:
+                raise _missing(doc_type, rec_id)
+            del self.docs[(doc_type, rec_id)]
+            return 200
+        raise NotImplementedError(op)
+
+    def get(self, index, doc_type, id, params=None):
+        self._call("get")
+        current = self.docs.get((doc_type, id))
+        if current is None:
+            raise NotFoundError(404, "not_found", dict(_id=id, found=False))
+        return self._read("get", dict(_index=index, _type=doc_type, _id=id, _version=current[0], found=True,
+                                      _source=_select(current[1], (params or {}).get("_source"))))
+
+    def mget(self, index, doc_type, body, params=None):
+        self._call("mget")
+        docs = []
+        for rec_id in body["ids"]:
+            current = self.docs.get((doc_type, rec_id))
+            if current is None:
+                docs.append(dict(_index=index, _type=doc_type, _id=rec_id, found=False))
+            else:
+                docs.append(dict(_index=index, _type=doc_type, _id=rec_id, _version=current[0], found=True,
+                                 _source=_select(current[1], (params or {}).get("_source"))))
+        return self._read("mget", dict(docs=docs))
+
+    def exists(self, index, doc_type, id):
+        self._call("exists")
+        return (doc_type, id) in self.docs
+
+    def index(self, index, doc_type, body, id, params=None):
+        self._call("index")
+        params = params or {}
+        self._write(params.get("op_type", "index"), doc_type, id, body, params.get("version"))
+        return dict(_id=id, _version=self.docs[(doc_type, id)][0])
+
+    def update(self, index, doc_type, body, id, params=None):
+        self._call("update")
+        self._write("update", doc_type, id, body, (params or {}).get("version"))
+        return dict(_id=id, _version=self.docs[(doc_type, id)][0])
+
+    def delete(self, index, doc_type, id, params=None):
+        self._call("delete")
+        self._write("delete", doc_type, id, None, (params or {}).get("version"))
+        return dict(_id=id, found=True)
+
+    def bulk(self, index, body, params=None):
+        self._call("bulk")
+        items = []
+        lines = iter(body)
+        for action in lines:
+            op, meta = action.items()[0]
+            source = next(lines) if op != "delete" else None
+            rec_id = meta["_id"]
+            try:
+                status = self._write(op, meta["_type"], rec_id, source, meta.get("_version"))
+                items.append({op: dict(_id=rec_id, status=status)})
+            except (ConflictError, NotFoundError) as e:
+                status = 409 if isinstance(e, ConflictError) else 404
+                items.append({op: dict(_id=rec_id, status=status, error=dict(type=e.args[1], reason=e.args[2]))})
+        return dict(errors=any("error" in item.values()[0] for item in items), items=items)
+
+    def _hits(self, doc_type, body, params=None):
+        params = params or {}
+        docs = self.searchable if self.nrt else self.docs
+        hits = []
+        for (hit_type, rec_id), (version, source) in sorted(docs.iteritems()):
+            if hit_type != doc_type or not _matches(body.get("query"), rec_id, source):
+                continue
+            hit = dict(_type=doc_type, _id=rec_id, _source=_select(source, params.get("_source") or body.get("_source")))
+            if params.get("version"):
+                hit["_version"] = version
+            hits.append(hit)
+        return hits[:int(params.get("size", body.get("size", 10)))]
+
+    def search(self, index, doc_type, body, params=None):
+        self._call("search")
+        return self._read("search", dict(hits=dict(hits=self._hits(doc_type, body, params))))
+
+
+class FakeDataSource(object):
+
+    def __init__(self, connection=None):
+        self.connection = connection or FakeConnection()
+        self.index = "api_test"
+
+    def scan(self, doc_type, query=None):
+        query = dict(query or {})
+        query["size"] = len(self.connection.docs) or 1
+        return iter(self.connection._hits(doc_type, query))
@@ -0,0 +1,117 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_active_request_slot
+
+import os
+import unittest
+
+os.environ.setdefault("api_env", "test")
+try:
+    from fake_es import FakeDataSource
+    from taxi_api.business.active_request_slot import ActiveRequestSlotBus
+    from taxi_api.ds_provider.ds_provider import DSProvider
+    from taxi_api.to.active_request_slot import ActiveRequestSlotTO
+    from taxi_api.to.request_driver import RequestDriverTO
+except ImportError:
+    FakeDataSource = None
+
+
+class FakeRequestBus(object):
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    def get_by_pk(self, request_id):
+        if request_id in self.statuses:
+            return RequestDriverTO(request_id=request_id, status=self.statuses[request_id])
+
+
+@unittest.skipIf(FakeDataSource is None, "requires elasticsearch")
+class ActiveRequestSlotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_source = FakeDataSource()
+        self.connection = self.data_source.connection
+        data_sources = DSProvider.get().data_sources
+        self.previous = data_sources.get(("elasticsearch", "test"))
+        data_sources[("elasticsearch", "test")] = self.data_source
+        self.bus = ActiveRequestSlotBus("elasticsearch", "test")
+        self.bus.dao.record_cache = None
+        self.bus.dao.batch_loader = None
+        self.bus.dao.single_flight = None
+        self.request_bus = FakeRequestBus({"r1": "active", "r2": "active"})
+
+    def tearDown(self):
+        data_sources = DSProvider.get().data_sources
+        if self.previous is None:
+            data_sources.pop(("elasticsearch", "test"), None)
+        else:
+            data_sources[("elasticsearch", "test")] = self.previous
+
+    def _put_slot(self, request_id):
+        slot = ActiveRequestSlotTO(requester_id="p1", request_id=request_id)
+        self.connection.put("active_request_slot", "p1", slot.serialize())
+
+    def _slot_request_id(self):
+        slot = self.connection.docs.get(("active_request_slot", "p1"))
+        return slot[1]["request_id"] if slot else None
+
+    # runs func once, right after the first read of the slot
+    def _after_first_get(self, func):
+        def after(name):
+            if name == "get":
+                self.connection.after = None
+                func()
+        self.connection.after = after
+
+    def test_acquire_free_slot(self):
+        self.assertTrue(self.bus.acquire("p1", "r1", self.request_bus))
+        self.assertEqual(self._slot_request_id(), "r1")
+
+    def test_acquire_slot_of_active_request(self):
+        self._put_slot("r1")
+        self.assertFalse(self.bus.acquire("p1", "r2", self.request_bus))
+        self.assertEqual(self._slot_request_id(), "r1")
+
+    def test_acquire_slot_released_meanwhile(self):
+        self._put_slot("r1")
+
+        def release():
+            del self.connection.docs[("active_request_slot", "p1")]
+        self.connection.before = lambda name: name == "get" and release()
+        self.assertTrue(self.bus.acquire("p1", "r2", self.request_bus))
+        self.assertEqual(self._slot_request_id(), "r2")
+
+    def test_takeover_abandoned_slot(self):
+        self._put_slot("r0")
+        self.request_bus.statuses["r0"] = "finished"
+        self.assertTrue(self.bus.acquire("p1", "r1", self.request_bus))
+        self.assertEqual(self._slot_request_id(), "r1")
+
+    def test_only_one_takeover_wins(self):
+        self._put_slot("r0")
+        self.request_bus.statuses["r0"] = "canceled"
+        # other request takes the slot over after it was read
+        self._after_first_get(lambda: self._put_slot("r2"))
+        self.assertFalse(self.bus.acquire("p1", "r1", self.request_bus))
+        self.assertEqual(self._slot_request_id(), "r2")
+
+    def test_release(self):
+        self._put_slot("r1")
+        self.assertTrue(self.bus.release("p1", "r1"))
+        self.assertIsNone(self._slot_request_id())
+
+    def test_release_slot_of_other_request(self):
+        self._put_slot("r2")
+        self.assertFalse(self.bus.release("p1", "r1"))
+        self.assertEqual(self._slot_request_id(), "r2")
+
+    def test_release_slot_taken_over_meanwhile(self):
+        self._put_slot("r1")
+        self._after_first_get(lambda: self._put_slot("r2"))
+        self.assertFalse(self.bus.release("p1", "r1"))
+        self.assertEqual(self._slot_request_id(), "r2")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_batch_loader
+
+import threading
+import time
+import unittest
+from taxi_api.helpers.batch_loader import BatchLoader
+
+
+class BatchLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.fail = False
+
+    def _load_many(self, keys):
+        self.batches.append(sorted(keys))
+        if keys == ["blocker"]:
+            self.release.wait(5)
+        if self.fail:
+            raise ValueError("boom")
+        return dict((key, dict(key=key)) for key in keys if key != "missing")
+
+    def _load(self, loader, key, outcomes):
+        def run():
+            try:
+                outcomes[key] = ("result", loader.load(key))
+            except Exception as e:
+                outcomes[key] = ("error", e)
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.001)
+        self.assertTrue(condition())
+
+    def _while_blocked(self, loader, keys):
+        # loads keys while another load is in flight, then lets everything finish
+        outcomes = {}
+        threads = [self._load(loader, "blocker", outcomes)]
+        self._wait_for(lambda: self.batches == [["blocker"]])
+        for key in keys:
+            threads.append(self._load(loader, key, outcomes))
+        self._wait_for(lambda: loader.loads == len(keys) + 1)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_load_without_concurrency_does_not_wait(self):
+        loader = BatchLoader(self._load_many, 5, 50)
+        self.release.set()
+        start = time.time()
+        self.assertEqual(loader.load("a"), dict(key="a"))
+        self.assertIsNone(loader.load("missing"))
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(self.batches, [["a"], ["missing"]])
+
+    def test_concurrent_loads_are_batched(self):
+        loader = BatchLoader(self._load_many, 5, 50)
+        start = time.time()
+        outcomes = self._while_blocked(loader, ["a", "b", "a", "missing"])
+        # the batch ran as soon as the blocker finished, not after the window
+        self.assertLess(time.time() - start, 4)
+        self.assertEqual(self.batches, [["blocker"], ["a", "b", "missing"]])
+        self.assertEqual(outcomes["a"], ("result", dict(key="a")))
+        self.assertEqual(outcomes["b"], ("result", dict(key="b")))
+        self.assertEqual(outcomes["missing"], ("result", None))
+
+    def test_max_keys_closes_the_batch(self):
+        loader = BatchLoader(self._load_many, 5, 2)
+        outcomes = {}
+        threads = [self._load(loader, "blocker", outcomes)]
+        self._wait_for(lambda: self.batches == [["blocker"]])
+        threads += [self._load(loader, key, outcomes) for key in ("a", "b")]
+        # a full batch doesn't wait for the load in flight
+        self._wait_for(lambda: len(self.batches) == 2)
+        self.assertEqual(self.batches[1], ["a", "b"])
+        threads.append(self._load(loader, "c", outcomes))
+        self._wait_for(lambda: loader.loads == 4)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.batches[2:], [["c"]])
+        self.assertEqual(outcomes["c"], ("result", dict(key="c")))
+
+    def test_errors_reach_every_caller(self):
+        loader = BatchLoader(self._load_many, 5, 50)
+        self.fail = True
+        outcomes = self._while_blocked(loader, ["a", "b"])
+        for key in ("blocker", "a", "b"):
+            self.assertEqual(outcomes[key][0], "error")
+            self.assertIsInstance(outcomes[key][1], ValueError)
+
+
+if __name__ == '__main__':
+    unittest.main()
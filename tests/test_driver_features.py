@@ -0,0 +1,83 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_driver_features
+
+import os
+import unittest
+
+os.environ.setdefault("api_env", "test")
+try:
+    from fake_es import FakeDataSource
+    from taxi_api.ds_provider.ds_provider import DSProvider
+    from taxi_api.helpers.driver_features import DriverFeatureStore
+    from taxi_api.to.driver_stats import DriverStatsTO
+    from taxi_api.to.user import UserTO
+except ImportError:
+    FakeDataSource = None
+
+
+@unittest.skipIf(FakeDataSource is None, "requires elasticsearch")
+class DriverFeatureStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_source = FakeDataSource()
+        self.connection = self.data_source.connection
+        self.connection.put("driver_stats", "d1", dict(driver_id="d1", rating=5.0))
+        self.connection.put("driver_stats", "d2", dict(driver_id="d2", rating=4.0))
+        self.connection.put("user", "d1", dict(user_id="d1", role="driver", car_category="sedan"))
+        self.connection.put("user", "d2", dict(user_id="d2", role="driver", car_category="sedan"))
+        self.connection.put("user", "p1", dict(user_id="p1", role="passenger"))
+        data_sources = DSProvider.get().data_sources
+        self.previous = data_sources.get(("elasticsearch", "test"))
+        data_sources[("elasticsearch", "test")] = self.data_source
+        # bonus is 2 * rating
+        self.store = DriverFeatureStore(dict(rating_weight=10.0, max_rating=5.0, acceptance_weight=0,
+                                             cancellation_penalty=0, default_rating=3.0))
+
+    def tearDown(self):
+        data_sources = DSProvider.get().data_sources
+        if self.previous is None:
+            data_sources.pop(("elasticsearch", "test"), None)
+        else:
+            data_sources[("elasticsearch", "test")] = self.previous
+
+    def _scores(self, category=None):
+        bonuses, eligible = self.store.get_scores(["d1", "d2", "d3"], category)
+        return list(bonuses), list(eligible) if eligible is not None else None
+
+    # runs func while the first scan is running, after it read the records
+    def _during_scan(self, func):
+        scan = self.data_source.scan
+
+        def scan_and_write(*args, **kwargs):
+            records = list(scan(*args, **kwargs))
+            self.data_source.scan = scan
+            func()
+            return iter(records)
+        self.data_source.scan = scan_and_write
+
+    def test_load(self):
+        self.assertEqual(self.store.load(), 2)
+        self.assertEqual(self._scores("sedan"), ([10.0, 8.0, 6.0], [True, True, False]))
+
+    def test_writes_update_the_features(self):
+        self.store.load()
+        self.store.on_stats_write(DriverStatsTO(driver_id="d3", rating=1.0))
+        self.store.on_user_write(UserTO(user_id="d2", role="driver", car_category="van"))
+        self.assertEqual(self._scores("van"), ([10.0, 8.0, 2.0], [False, True, False]))
+
+    def test_writes_made_during_a_load_survive_the_swap(self):
+        def write():
+            self.store.on_stats_write(DriverStatsTO(driver_id="d1", rating=1.0))
+            self.store.on_user_write(UserTO(user_id="d2", role="driver", car_category="van"))
+        self._during_scan(write)
+        self.store.load()
+        self.assertEqual(self._scores("van"), ([2.0, 8.0, 6.0], [False, True, False]))
+        # only replayed by the load they ran during
+        self.assertIsNone(self.store._loading)
+        self.store.load()
+        self.assertEqual(self._scores("van"), ([10.0, 8.0, 6.0], [False, False, False]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_driver_status_batch
+
+import json
+import os
+import unittest
+
+os.environ.setdefault("api_env", "test")
+try:
+    from flask import Flask
+    from flask_restful import Api
+    from taxi_api.helpers.api_auth import ApiAuth
+    from taxi_api.resources.driver_status_batch import DriverStatusBatch
+except ImportError:
+    Flask = None
+
+
+class FakeDriverBus(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def bulk_update_if_exists(self, statuses):
+        self.calls.append(statuses)
+        return [(status["driver_id"], None) for status in statuses]
+
+
+@unittest.skipIf(Flask is None, "requires flask-restful and elasticsearch")
+class DriverStatusBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self._gateways, self._driver_bus = ApiAuth._gateways, DriverStatusBatch._driver_bus
+        ApiAuth._gateways = [dict(name="fleet_a", access_key="key_a", drivers=["d1"]),
+                             dict(name="all", access_key="key_all", drivers="*")]
+        DriverStatusBatch._driver_bus = self.driver_bus = FakeDriverBus()
+        app = Flask(__name__)
+        Api(app).add_resource(DriverStatusBatch, '/drivers/status')
+        self.client = app.test_client()
+
+    def tearDown(self):
+        ApiAuth._gateways, DriverStatusBatch._driver_bus = self._gateways, self._driver_bus
+
+    def post(self, statuses, access_key=None):
+        headers = {"Gateway-Access-Key": access_key} if access_key else {}
+        return self.client.post('/drivers/status', data=dict(statuses=json.dumps(statuses)), headers=headers)
+
+    def test_rejects_missing_or_unknown_key(self):
+        statuses = [dict(driver_id="d1", available=True)]
+        self.assertEqual(self.post(statuses).status_code, 401)
+        self.assertEqual(self.post(statuses, "test_key").status_code, 401)
+        self.assertEqual(self.driver_bus.calls, [])
+
+    def test_rejects_drivers_of_other_gateways(self):
+        response = self.post([dict(driver_id="d1", available=True), dict(driver_id="d2", available=False)], "key_a")
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.data)
+        self.assertEqual([item["status"] for item in result], ["ok", "error"])
+        self.assertEqual(result[1]["driver_id"], "d2")
+        # only allowed drivers are written
+        self.assertEqual(self.driver_bus.calls, [[dict(driver_id="d1", available=True)]])
+
+    def test_gateway_of_any_driver(self):
+        response = self.post([dict(driver_id="d1"), dict(driver_id="d2")], "key_all")
+        self.assertEqual([item["status"] for item in json.loads(response.data)], ["ok", "ok"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_eta_engine
+
+import heapq
+import random
+import shutil
+import tempfile
+import unittest
+from taxi_api.helpers import geo
+from taxi_api.helpers.eta_engine import EtaEngine, build_graph, INF
+
+
+def dijkstra_to(n, edges, target):
+    # shortest travel time from every node to target (reversed edges)
+    reverse = [[] for _ in xrange(n)]
+    for u, v, w in edges:
+        reverse[v].append((u, w))
+    dist = [INF] * n
+    dist[target] = 0.0
+    heap = [(0.0, target)]
+    while heap:
+        d, v = heapq.heappop(heap)
+        if d > dist[v]:
+            continue
+        for u, w in reverse[v]:
+            if d + w < dist[u]:
+                dist[u] = d + w
+                heapq.heappush(heap, (d + w, u))
+    return dist
+
+
+@unittest.skipIf(geo.numpy is None, "EtaEngine requires numpy")
+class EtaEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        # 6x6 grid of two way roads, some one way shortcuts and an isolated node
+        rnd = random.Random(7)
+        side = 6
+        self.n = side * side + 1
+        lats = [-23.55 + 0.005 * (i / side) for i in xrange(side * side)] + [-23.40]
+        lons = [-46.63 + 0.005 * (i % side) for i in xrange(side * side)] + [-46.40]
+        self.edges = []
+        for i in xrange(side * side):
+            for j in (i + 1 if (i + 1) % side else None, i + side if i + side < side * side else None):
+                if j is not None:
+                    self.edges.append((i, j, rnd.uniform(10, 60)))
+                    self.edges.append((j, i, rnd.uniform(10, 60)))
+        for _ in xrange(10):
+            self.edges.append((rnd.randrange(side * side), rnd.randrange(side * side), rnd.uniform(5, 200)))
+        self.path = tempfile.mkdtemp()
+        build_graph(self.path, lats, lons, self.edges)
+        self.engine = EtaEngine(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_travel_times_match_dijkstra(self):
+        sources = range(self.n)
+        # second round is answered from the cached search spaces
+        for _ in xrange(2):
+            for target in xrange(self.n):
+                expected = dijkstra_to(self.n, self.edges, target)
+                times = self.engine.travel_times(sources, target).tolist()
+                for source in sources:
+                    if expected[source] == INF:
+                        self.assertEqual(times[source], INF)
+                    else:
+                        # weights are stored as float32
+                        self.assertAlmostEqual(times[source], expected[source], delta=1e-3 * max(1.0, expected[source]))
+
+
+if __name__ == '__main__':
+    unittest.main()
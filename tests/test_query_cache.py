@@ -0,0 +1,82 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_query_cache
+
+import os
+import unittest
+
+os.environ.setdefault("api_env", "test")
+try:
+    from fake_es import FakeDataSource
+    from taxi_api.dao.cache import QueryCache
+    from taxi_api.dao.elasticsearch.driver import DriverDao
+except ImportError:
+    FakeDataSource = None
+
+
+@unittest.skipIf(FakeDataSource is None, "requires elasticsearch")
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_source = FakeDataSource()
+        self.connection = self.data_source.connection
+        self.connection.put("driver", "d1", dict(driver_id="d1", available=True))
+        self.connection.put("driver", "d2", dict(driver_id="d2", available=False))
+        self.cache = QueryCache("driver", 100, 60, 0)
+        self.dao = self._new_dao()
+
+    def _new_dao(self):
+        dao = DriverDao(None, self.data_source)
+        dao.record_cache = None
+        dao.query_cache = self.cache
+        dao.single_flight = None
+        return dao
+
+    def _available(self, dao=None):
+        return sorted(driver.driver_id for driver in (dao or self.dao).search_by_field_value("available", True))
+
+    def _set_available(self, dao, driver_id, available):
+        driver = dao.get_by_pk(driver_id)
+        driver.available = available
+        dao.save(driver)
+
+    def test_repeated_queries_are_served_from_cache(self):
+        self.assertEqual(self._available(), ["d1"])
+        self.assertEqual(self._available(), ["d1"])
+        self.assertEqual(self.connection.calls.count("search"), 1)
+
+    def test_write_bumps_generation_and_invalidates(self):
+        self._available()
+        generation = self.cache.generation
+        self._set_available(self.dao, "d2", True)
+        self.assertEqual(self.cache.generation, generation + 1)
+        self.assertEqual(self._available(), ["d1", "d2"])
+        self.assertEqual(self.connection.calls.count("search"), 2)
+
+    def test_write_of_other_dao_invalidates(self):
+        self._available()
+        self._set_available(self._new_dao(), "d1", False)
+        self.assertEqual(self._available(), [])
+
+    def test_results_are_not_stored_right_after_a_write(self):
+        self.cache.refresh_interval = 60
+        self._set_available(self.dao, "d2", True)
+        self._available()
+        self._available()
+        self.assertEqual(self.connection.calls.count("search"), 2)
+
+    def test_results_read_before_a_write_are_not_cached(self):
+        writer = self._new_dao()
+
+        def write_after_search(name):
+            if name == "search":
+                self.connection.after = None
+                self._set_available(writer, "d2", True)
+        self.connection.after = write_after_search
+
+        self.assertEqual(self._available(), ["d1"])
+        self.assertEqual(self._available(), ["d1", "d2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_record_cache
+
+import os
+import unittest
+
+os.environ.setdefault("api_env", "test")
+try:
+    from fake_es import FakeDataSource
+    from taxi_api.dao.cache import RecordCache
+    from taxi_api.dao.elasticsearch.driver import DriverDao
+except ImportError:
+    FakeDataSource = None
+
+
+@unittest.skipIf(FakeDataSource is None, "requires elasticsearch")
+class RecordCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_source = FakeDataSource()
+        self.connection = self.data_source.connection
+        self.connection.put("driver", "d1", dict(driver_id="d1", available=True))
+        self.cache = RecordCache("driver", 100, 60)
+        self.dao = self._new_dao()
+
+    def _new_dao(self):
+        dao = DriverDao(None, self.data_source)
+        dao.record_cache = self.cache
+        dao.single_flight = None
+        return dao
+
+    def test_hits_are_served_from_cache(self):
+        self.assertTrue(self.dao.get_by_pk("d1").available)
+        self.assertTrue(self.dao.get_by_pk("d1").available)
+        self.assertEqual(self.connection.calls, ["get"])
+
+    def test_hits_are_copies(self):
+        self.dao.get_by_pk("d1").available = False
+        self.assertTrue(self.dao.get_by_pk("d1").available)
+
+    def test_write_invalidates(self):
+        driver = self.dao.get_by_pk("d1")
+        driver.available = False
+        self.dao.save(driver)
+        self.assertFalse(self.dao.get_by_pk("d1").available)
+        self.assertEqual(self.connection.calls, ["get", "update", "get"])
+
+    def test_write_of_other_dao_invalidates(self):
+        self.dao.get_by_pk("d1")
+        other = self._new_dao()
+        driver = other.get_by_pk("d1")
+        driver.available = False
+        other.save(driver)
+        self.assertFalse(self.dao.get_by_pk("d1").available)
+
+    def test_record_read_before_a_write_is_not_cached(self):
+        writer = self._new_dao()
+
+        def write_after_read(name):
+            # another thread writes after our get read the old record and before it is cached
+            self.connection.after = None
+            driver = writer.get_by_pk("d1")
+            driver.available = False
+            writer.save(driver)
+        self.connection.after = write_after_read
+
+        self.assertTrue(self.dao.get_by_pk("d1").available)
+        self.assertFalse(self.dao.get_by_pk("d1").available)
+
+    def test_missing_records_are_not_cached(self):
+        self.assertIsNone(self.dao.get_by_pk("d2"))
+        self.connection.put("driver", "d2", dict(driver_id="d2", available=True))
+        self.assertTrue(self.dao.get_by_pk("d2").available)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_single_flight
+
+import threading
+import time
+import unittest
+from taxi_api.helpers.single_flight import SingleFlight
+
+
+class Interrupted(BaseException):
+    # like GreenletExit or KeyboardInterrupt, not an Exception
+    pass
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+        self.runs = 0
+
+    def _blocking(self, result=None, error=None):
+        def func():
+            self.runs += 1
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return func
+
+    def _call(self, key, func, outcomes):
+        def run():
+            try:
+                outcomes.append(("result", self.flight.do(key, func)))
+            except BaseException as e:
+                outcomes.append(("error", e))
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.001)
+        self.assertTrue(condition())
+
+    def _leader_and_follower(self, func):
+        leader, follower = [], []
+        threads = [self._call("key", func, leader)]
+        self._wait_for(lambda: self.runs == 1)
+        threads.append(self._call("key", func, follower))
+        self._wait_for(lambda: self.flight.shared == 1)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return leader[0], follower[0]
+
+    def test_followers_share_the_leader_call(self):
+        leader, follower = self._leader_and_follower(self._blocking(result=dict(found=True)))
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(leader, ("result", dict(found=True)))
+        self.assertEqual(follower, ("result", dict(found=True)))
+        # each caller gets its own copy
+        self.assertIsNot(leader[1], follower[1])
+
+    def test_followers_get_the_leader_exception(self):
+        error = ValueError("boom")
+        leader, follower = self._leader_and_follower(self._blocking(error=error))
+        self.assertIs(leader[1], error)
+        self.assertIs(follower[1], error)
+
+    def test_followers_fail_when_leader_is_interrupted(self):
+        leader, follower = self._leader_and_follower(self._blocking(error=Interrupted()))
+        self.assertIsInstance(leader[1], Interrupted)
+        self.assertEqual(follower[0], "error")
+        self.assertIsInstance(follower[1], RuntimeError)
+
+    def test_forgotten_calls_are_not_joined(self):
+        first, second = [], []
+        threads = [self._call("key", self._blocking(result=1), first)]
+        self._wait_for(lambda: self.runs == 1)
+        self.flight.forget(lambda key: key == "key")
+        threads.append(self._call("key", self._blocking(result=2), second))
+        self._wait_for(lambda: self.runs == 2)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((first, second), ([("result", 1)], [("result", 2)]))
+        self.assertEqual(self.flight.shared, 0)
+
+    def test_finished_calls_are_not_kept(self):
+        self.release.set()
+        self.assertEqual(self.flight.do("key", self._blocking(result=1)), 1)
+        self.assertEqual(self.flight.do("key", self._blocking(result=2)), 2)
+        self.assertEqual(self.flight.stats(), dict(in_flight=0, calls=2, shared=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
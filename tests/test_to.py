@@ -0,0 +1,30 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_to
+
+import unittest
+from taxi_api.to.driver import DriverTO
+
+
+class SerializeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = DriverTO(driver_id="d1", available=True, location=(1, 2))
+
+    def test_changes_are_serialized(self):
+        self.assertTrue(self.driver.serialize()["available"])
+        self.driver.available = False
+        self.assertFalse(self.driver.serialize()["available"])
+
+    def test_changing_the_result_does_not_change_the_next_one(self):
+        serialized = self.driver.serialize()
+        serialized["available"] = False
+        serialized["location"]["lat"] = 10
+        self.assertEqual(self.driver.serialize(), dict(driver_id="d1", available=True, location=dict(lat=1, lon=2)))
+
+    def test_fields(self):
+        self.assertEqual(self.driver.serialize("available"), dict(available=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
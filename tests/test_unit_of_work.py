@@ -0,0 +1,180 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_unit_of_work
+
+import os
+import unittest
+
+os.environ.setdefault("api_env", "test")
+try:
+    from fake_es import FakeDataSource
+    from taxi_api.business.driver import DriverBus
+    from taxi_api.dao.elasticsearch.driver import DriverDao
+    from taxi_api.dao.elasticsearch.user import UserDao
+    from taxi_api.dao.unit_of_work import UnitOfWork
+    from taxi_api.ds_provider.ds_provider import DSProvider
+    from taxi_api.helpers.exceptions import BulkWriteException, RecordAlreadyExistsException
+    from taxi_api.to.driver import DriverTO
+    from taxi_api.to.user import UserTO
+except ImportError:
+    FakeDataSource = None
+
+try:
+    from taxi_api.resources.base import unit_of_work
+except ImportError:
+    unit_of_work = None
+
+
+def _new_dao(dao_class, data_source):
+    dao = dao_class(None, data_source)
+    dao.record_cache = None
+    dao.query_cache = None
+    dao.single_flight = None
+    return dao
+
+
+def _new_user(**kwargs):
+    user = dict(email="driver@test.com", password="pass", name="Driver", role="driver", car_plate="ABC-1234")
+    user.update(kwargs)
+    return UserTO(**user)
+
+
+@unittest.skipIf(FakeDataSource is None, "requires elasticsearch")
+class UnitOfWorkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_source = FakeDataSource()
+        self.connection = self.data_source.connection
+        self.connection.put("driver", "d1", dict(driver_id="d1", available=True, location=(0, 0)))
+        self.driver_dao = _new_dao(DriverDao, self.data_source)
+        self.user_dao = _new_dao(UserDao, self.data_source)
+        self.user_dao._get_driver_dao = lambda: self.driver_dao
+
+    def test_loads_return_the_same_record(self):
+        with UnitOfWork():
+            self.assertIs(self.driver_dao.get_by_pk("d1"), self.driver_dao.get_by_pk("d1"))
+        self.assertEqual(self.connection.calls, ["get"])
+
+    def test_writes_are_sent_in_order_in_one_bulk(self):
+        with UnitOfWork() as uow:
+            record = self.driver_dao.get_by_pk("d1")
+            record.available = False
+            self.driver_dao.save(record)
+            self.driver_dao.delete(record)
+            self.driver_dao.save(DriverTO(driver_id="d1", available=True, location=(1, 1)))
+            self.assertEqual(self.connection.calls, ["get"])
+            self.assertEqual(uow.flush(), 3)
+        self.assertEqual(self.connection.calls, ["get", "bulk"])
+        self.assertEqual(self.connection.docs[("driver", "d1")][1]["location"], dict(lat=1, lon=1))
+
+    def test_user_and_driver_are_created_in_one_bulk(self):
+        user = _new_user()
+        with UnitOfWork() as uow:
+            self.user_dao.create(user)
+            uow.flush()
+        self.assertEqual(self.connection.calls, ["bulk"])
+        self.assertIn(("user", user.user_id), self.connection.docs)
+        self.assertTrue(self.connection.docs[("driver", user.user_id)][1]["available"])
+
+    def test_deferred_create_of_existing_record_raises(self):
+        user = _new_user()
+        user.serialize()
+        self.connection.put("user", user.user_id, dict(email=user.email))
+        self.connection.put("driver", user.user_id, dict(driver_id=user.user_id, available=False, location=[0, 0]))
+        with UnitOfWork() as uow:
+            self.user_dao.create(_new_user())
+            self.assertRaises(RecordAlreadyExistsException, uow.flush)
+        # the existing driver status isn't reset
+        self.assertFalse(self.connection.docs[("driver", user.user_id)][1]["available"])
+
+    def test_other_errors_raise_bulk_write_exception(self):
+        with UnitOfWork() as uow:
+            self.driver_dao.create(DriverTO(driver_id="d2", available=True, location=(0, 0)), deferred=True)
+            self.driver_dao.update_if_exists(DriverTO(driver_id="d3", available=True, location=(0, 0)))
+            with self.assertRaises(BulkWriteException) as raised:
+                uow.flush()
+        self.assertEqual([rec_id for rec_id, _ in raised.exception.errors], ["d3"])
+        self.assertIn(("driver", "d2"), self.connection.docs)
+
+    def test_conditional_write_flushes_the_queue_first(self):
+        with UnitOfWork():
+            self.driver_dao.save(DriverTO(driver_id="d2", available=True, location=(0, 0)))
+            self.driver_dao.create(DriverTO(driver_id="d3", available=True, location=(0, 0)))
+            self.assertEqual(self.connection.calls, ["bulk", "index"])
+
+    def test_exception_discards_the_queue(self):
+        try:
+            with UnitOfWork():
+                self.driver_dao.save(DriverTO(driver_id="d2", available=True, location=(0, 0)))
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self.connection.calls, [])
+        self.assertNotIn(("driver", "d2"), self.connection.docs)
+
+    def test_after_write_hooks_run_only_when_written(self):
+        written = []
+        with UnitOfWork() as uow:
+            record = DriverTO(driver_id="d2", available=True, location=(0, 0))
+            self.driver_dao.save(record)
+            self.assertTrue(uow.after_write(record, written.append))
+            self.assertEqual(written, [])
+            uow.flush()
+        self.assertEqual(written, [record])
+
+        failed = []
+        with UnitOfWork() as uow:
+            record = DriverTO(driver_id="d3", available=True, location=(0, 0))
+            self.driver_dao.update_if_exists(record)
+            uow.after_write(record, failed.append)
+            self.assertRaises(BulkWriteException, uow.flush)
+        self.assertEqual(failed, [])
+
+    def test_after_write_without_queued_write(self):
+        with UnitOfWork() as uow:
+            self.assertFalse(uow.after_write(DriverTO(driver_id="d1", location=(0, 0)), lambda to_obj: None))
+
+
+@unittest.skipIf(FakeDataSource is None or unit_of_work is None, "requires elasticsearch and flask")
+class RequestUnitOfWorkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_source = FakeDataSource()
+        self.connection = self.data_source.connection
+        data_sources = DSProvider.get().data_sources
+        self.previous = data_sources.get(("elasticsearch", "test"))
+        data_sources[("elasticsearch", "test")] = self.data_source
+        self.bus = DriverBus("elasticsearch", "test")
+        self.bus.dao.record_cache = None
+        self.bus.dao.query_cache = None
+        self.bus.dao.single_flight = None
+        self.written = []
+        self.bus._after_write = self.written.append
+
+    def tearDown(self):
+        data_sources = DSProvider.get().data_sources
+        if self.previous is None:
+            data_sources.pop(("elasticsearch", "test"), None)
+        else:
+            data_sources[("elasticsearch", "test")] = self.previous
+
+    def _handler(self, result):
+        @unit_of_work
+        def handler():
+            self.bus.save(DriverTO(driver_id="d2", available=True, location=(0, 0)))
+            return result
+        return handler()
+
+    def test_successful_request_is_written(self):
+        self.assertEqual(self._handler({"status": "ok"}), {"status": "ok"})
+        self.assertIn(("driver", "d2"), self.connection.docs)
+        self.assertEqual([to_obj.driver_id for to_obj in self.written], ["d2"])
+
+    def test_failed_request_is_discarded(self):
+        self.assertEqual(self._handler(({"message": "error"}, 400)), ({"message": "error"}, 400))
+        self.assertEqual(self.connection.calls, [])
+        self.assertEqual(self.written, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_update_by_query
+
+import os
+import unittest
+
+os.environ.setdefault("api_env", "test")
+try:
+    from fake_es import FakeConnection, FakeDataSource
+    from taxi_api.dao.elasticsearch.driver import DriverDao
+    from taxi_api.helpers.exceptions import BulkWriteException
+except ImportError:
+    FakeDataSource = None
+
+
+@unittest.skipIf(FakeDataSource is None, "requires elasticsearch")
+class UpdateByQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = FakeConnection(nrt=True)
+        for driver_id in ("d1", "d2", "d3"):
+            self.connection.put("driver", driver_id, dict(driver_id=driver_id, available=driver_id != "d3",
+                                                          location=dict(lat=0, lon=0)))
+        self.connection.indices.refresh()
+        del self.connection.calls[:]
+        self.dao = DriverDao(None, FakeDataSource(self.connection))
+        self.dao.record_cache = None
+        self.dao.query_cache = None
+        self.dao.single_flight = None
+        self.dao.lookup_index = None
+
+    def _source(self, driver_id):
+        return self.connection.docs[("driver", driver_id)][1]
+
+    def _update(self):
+        return self.dao.update_by_field_value("available", True, dict(available=False))
+
+    # runs func before every bulk call, or only before the first one
+    def _before_bulk(self, func, once=False):
+        def before(name):
+            if name == "bulk":
+                if once:
+                    self.connection.before = None
+                func()
+        self.connection.before = before
+
+    def _move(self, driver_id):
+        source = dict(self._source(driver_id), location=dict(lat=1, lon=1))
+        self.connection.put("driver", driver_id, source)
+
+    def test_one_search_and_one_bulk(self):
+        updated = self._update()
+        self.assertEqual(sorted(to_obj.driver_id for to_obj in updated), ["d1", "d2"])
+        self.assertEqual(self.connection.calls, ["search", "bulk"])
+        self.assertFalse(self._source("d1")["available"])
+        self.assertFalse(self._source("d2")["available"])
+
+    def test_conflict_is_retried(self):
+        # d1 is written by someone else after the search
+        self._before_bulk(lambda: self._move("d1"), once=True)
+        updated = self._update()
+        self.assertEqual(sorted(to_obj.driver_id for to_obj in updated), ["d1", "d2"])
+        self.assertEqual(self.connection.calls, ["search", "bulk", "refresh", "search", "bulk"])
+        # both writes are kept
+        self.assertEqual(self._source("d1"), dict(driver_id="d1", available=False, location=dict(lat=1, lon=1)))
+
+    def test_conflicting_record_no_longer_matching(self):
+        self._before_bulk(lambda: self.connection.put("driver", "d1", dict(self._source("d1"), available=False)),
+                          once=True)
+        updated = self._update()
+        self.assertEqual([to_obj.driver_id for to_obj in updated], ["d2"])
+        self.assertEqual(self.connection.calls, ["search", "bulk", "refresh", "search"])
+
+    def test_exception_has_the_records_written(self):
+        # d1 always loses to a concurrent write
+        self._before_bulk(lambda: self._move("d1"))
+        with self.assertRaises(BulkWriteException) as raised:
+            self._update()
+        self.assertEqual([rec_id for rec_id, _ in raised.exception.errors], ["d1"])
+        self.assertEqual([to_obj.driver_id for to_obj in raised.exception.written], ["d2"])
+        self.assertEqual(self.connection.calls.count("bulk"), self.dao._max_update_by_query_attempts)
+        self.assertTrue(self._source("d1")["available"])
+        self.assertFalse(self._source("d2")["available"])
+
+    def test_other_errors_are_not_retried(self):
+        # d1 is deleted after the search
+        self._before_bulk(lambda: self.connection.docs.pop(("driver", "d1")), once=True)
+        with self.assertRaises(BulkWriteException) as raised:
+            self._update()
+        self.assertEqual([rec_id for rec_id, _ in raised.exception.errors], ["d1"])
+        self.assertEqual([to_obj.driver_id for to_obj in raised.exception.written], ["d2"])
+        self.assertEqual(self.connection.calls, ["search", "bulk"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+__author__ = 'luiz'
+
+# i.e: python -m unittest tests.test_user_session
+
+import os
+import unittest
+from datetime import datetime, timedelta
+
+os.environ.setdefault("api_env", "test")
+try:
+    from fake_es import FakeDataSource
+    from taxi_api.dao.elasticsearch.user_session import UserSessionDao
+    from taxi_api.to.fields import DateTimeField
+except ImportError:
+    FakeDataSource = None
+
+
+@unittest.skipIf(FakeDataSource is None, "requires elasticsearch")
+class UserSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_source = FakeDataSource()
+        self.connection = self.data_source.connection
+        self.dao = UserSessionDao(None, self.data_source)
+        self.dao.record_cache = None
+        self.dao.query_cache = None
+        self.dao.single_flight = None
+        self.dao.batch_loader = None
+        self.dao.lookup_index = None
+        now = datetime.now()
+        self._put("valid", now + timedelta(hours=1))
+        self._put("expired", now - timedelta(hours=1))
+        # created before sessions expired
+        self._put("legacy", None)
+
+    def _put(self, user_id, expires_in):
+        session = dict(user_id=user_id, api_token="%s.token" % user_id)
+        if expires_in:
+            session["expires_in"] = DateTimeField.serialize(expires_in)
+        self.connection.put("user_session", user_id, session)
+
+    def _session_ids(self):
+        return sorted(rec_id for doc_type, rec_id in self.connection.docs if doc_type == "user_session")
+
+    def test_get_session(self):
+        self.assertIsNotNone(self.dao.get_session("valid.token"))
+        self.assertIsNone(self.dao.get_session("expired.token"))
+        self.assertIsNone(self.dao.get_session("valid.other"))
+
+    def test_session_without_expiration_is_valid_until_the_deadline(self):
+        self.assertIsNotNone(self.dao.get_session("legacy.token"))
+        deadline = UserSessionDao._legacy_deadline
+        try:
+            UserSessionDao._legacy_deadline = datetime.now() - timedelta(seconds=1)
+            self.assertIsNone(self.dao.get_session("legacy.token"))
+        finally:
+            UserSessionDao._legacy_deadline = deadline
+
+    def test_only_expired_sessions_are_deleted(self):
+        self.assertEqual(self.dao.delete_expired(10), (1, 1))
+        self.assertEqual(self._session_ids(), ["legacy", "valid"])
+
+    def test_missing_expiration_is_set(self):
+        self.assertEqual(self.dao.set_missing_expiration(), 1)
+        legacy = self.dao.get_by_pk("legacy")
+        self.assertTrue(datetime.now() < legacy.expires_in <= datetime.now() + timedelta(seconds=self.dao._get_ttl()))
+        self.assertEqual(self.dao.set_missing_expiration(), 0)
+        self.assertEqual(self._session_ids(), ["expired", "legacy", "valid"])
+
+
+if __name__ == '__main__':
+    unittest.main()